@@ -0,0 +1,273 @@
+"""
+
+    Use this script to time the performance sensitive parts of Chronolapse
+
+    Usage: benchmark.py [name ...]
+
+    With no names, every benchmark is run.
+
+"""
+
+import sys, math, timeit
+
+from cStringIO import StringIO
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+import chronocapture, chronobatch
+
+# wx is only needed to time real bitmap copies
+try:
+    import wx
+except ImportError:
+    wx = None
+
+
+def timeCall(function, number=20, repeat=5):
+    # best of several runs, in milliseconds per call
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1000
+
+
+def benchTileHash():
+    if chronocapture.numpy is None:
+        print 'numpy not installed - skipping'
+        return
+    numpy = chronocapture.numpy
+
+    for width, height in ((1920, 1080), (2560, 1440), (3840, 2160)):
+        size = (width, height)
+
+        # the GUI hashes its RGBX frames, headless capture the RGB pixels PIL grabbed
+        frame = chronocapture.Frame(size, bytearray(
+                    numpy.random.randint(0, 256, width * height * 4).astype(numpy.uint8).tostring()))
+        pixels = numpy.random.randint(0, 256, width * height * 3).astype(numpy.uint8).tostring()
+
+        for tilesize in (32, 64, 128):
+            for name, data, bytesperpixel in (('GUI RGBX', frame.data, 4), ('headless RGB', pixels, 3)):
+                hasher = chronocapture.TileHasher(tilesize)
+                hasher.update(data, size, bytesperpixel)
+
+                ms = timeCall(lambda: hasher.update(data, size, bytesperpixel))
+                print '%dx%d  %3dpx tiles  %-12s  %6.2f ms/frame' % (width, height, tilesize, name, ms)
+
+
+def isShared(data, makeview, getvalue):
+    # change the buffer and see if the view made from it notices
+    view = makeview(data)
+    before = getvalue(view)
+    data[0] = (data[0] + 1) % 256
+    return getvalue(view) != before
+
+
+def getPixel(img):
+    return img.getpixel((0, 0))
+
+
+def getElement(array):
+    return int(array.flat[0])
+
+
+def countCopies(steps):
+    """steps is a list of (name, bytes, copies) where copies is True or False
+    if measured and None if it could not be. Returns (copies, bytes copied,
+    whether any step had to be assumed a copy)."""
+    copies = 0
+    copied = 0
+    estimated = False
+    for name, length, copy in steps:
+        if copy is None:
+            estimated = True
+            copy = True
+        if copy:
+            copies += 1
+            copied += length
+    return copies, copied, estimated
+
+
+def wxCopies(bmp, toimage, getvalue, setpixel):
+    # draw on the bitmap after handing it over and see if the copy notices
+    img = toimage(bmp)
+    before = getvalue(img)
+    setpixel(bmp, before)
+    return getvalue(img) == before
+
+
+def setBitmapPixel(bmp, before):
+    dc = wx.MemoryDC(bmp)
+    colour = wx.Colour(255, 255, 255) if before[:3] != (255, 255, 255) else wx.Colour(0, 0, 0)
+    dc.SetPen(wx.Pen(colour))
+    dc.DrawPoint(0, 0)
+    dc.SelectObject(wx.NullBitmap)
+
+
+def benchFrameHandoff():
+    numpy = chronocapture.numpy
+    app = None
+    if wx is not None:
+        app = wx.App(False)
+    else:
+        print 'wx not installed - wx steps are assumed to copy and left out of the timings'
+
+    for width, height in ((1920, 1080), (2560, 1440), (3840, 2160)):
+        size = (width, height)
+        bmp = None
+        if wx is not None:
+            bmp = wx.EmptyBitmap(width, height)
+
+        # before - the bitmap goes through a wx.Image whose RGB data is
+        # handed out as a str, then wrapped by PIL and numpy
+        rgb = bytearray(width * height * 3)
+        steps = [
+            ('wx ConvertToImage', len(rgb), None),
+            ('wx GetData', len(rgb), None),
+            # PIL keeps RGB images at 4 bytes a pixel, so a copy is that big
+            ('PIL frombuffer', width * height * 4, not isShared(rgb,
+                    lambda data: Image.frombuffer('RGB', size, buffer(data), 'raw', 'RGB', 0, 1), getPixel)),
+        ]
+        if numpy is not None:
+            steps.append(('numpy frombuffer', len(rgb), not isShared(rgb,
+                    lambda data: numpy.frombuffer(data, numpy.uint8), getElement)))
+
+        if wx is not None:
+            steps[0] = ('wx ConvertToImage', len(rgb), wxCopies(bmp, lambda bmp: bmp.ConvertToImage(),
+                    lambda img: (img.GetRed(0, 0), img.GetGreen(0, 0), img.GetBlue(0, 0)), setBitmapPixel))
+            image = bmp.ConvertToImage()
+            steps[1] = ('wx GetData', len(rgb), wxCopies(image, lambda image: image.GetData(),
+                    lambda data: data[:3], lambda image, before: image.SetRGB(0, 0, 255 - ord(before[0]), 0, 0)))
+
+        def before():
+            if bmp is not None:
+                data = bmp.ConvertToImage().GetData()
+            else:
+                data = str(rgb)
+            img = Image.frombuffer('RGB', size, data, 'raw', 'RGB', 0, 1)
+            if numpy is not None:
+                numpy.frombuffer(data, numpy.uint8)
+            return img
+
+        # after - one copy out of the bitmap into a frame, which PIL and
+        # numpy share
+        frame = chronocapture.Frame(size)
+        aftersteps = [
+            ('wx CopyToBuffer', len(frame.data), True if bmp is not None and hasattr(bmp, 'CopyToBuffer') else None),
+            ('Frame.getImage', len(frame.data), not isShared(frame.data,
+                    lambda data: chronocapture.Frame(size, data).getImage(), getPixel)),
+        ]
+        if numpy is not None:
+            aftersteps.append(('Frame.getArray', len(frame.data), not isShared(frame.data,
+                    lambda data: chronocapture.Frame(size, data).getArray(), getElement)))
+
+        def after():
+            if bmp is not None and hasattr(bmp, 'CopyToBuffer'):
+                bmp.CopyToBuffer(frame.data, wx.BitmapBufferFormat_RGBA)
+            frame.image = None
+            img = frame.getImage()
+            if numpy is not None:
+                frame.getArray()
+            return img
+
+        print '%dx%d' % size
+        for name, steps, function in (('before', steps, before), ('after', aftersteps, after)):
+            copies, copied, estimated = countCopies(steps)
+            print '  %-6s  %d copies  %5.1f MB/frame%s  %6.2f ms/frame%s' % (name, copies, copied / 1048576.0,
+                    estimated and ' (wx assumed)' or '', timeCall(function),
+                    (bmp is None or (name == 'after' and not hasattr(bmp, 'CopyToBuffer'))) and ' without wx' or '')
+            for step, length, copy in steps:
+                print '          %-18s %s' % (step, {True: 'copies', False: 'shares', None: 'not measured'}[copy])
+
+
+def benchDraftResize():
+    target = (800, 600)
+
+    for width, height in ((1280, 720), (1920, 1080), (2560, 1440), (3840, 2160)):
+        # noise with some structure, saved as a typical capture JPEG
+        img = Image.effect_noise((width / 8, height / 8), 64).resize((width, height), Image.BICUBIC)
+        img = Image.merge('RGB', (img, img.filter(ImageFilter.BLUR), img.transpose(Image.FLIP_LEFT_RIGHT)))
+        data = StringIO()
+        img.save(data, 'JPEG', quality=85)
+        data = data.getvalue()
+
+        size = chronobatch.getFitSize((width, height), target)
+
+        def resize(draft):
+            source = Image.open(StringIO(data))
+            if draft:
+                chronobatch.draftImage(source, size)
+            return source.resize(size, Image.ANTIALIAS)
+
+        full = timeCall(lambda: resize(False), number=3, repeat=3)
+        draft = timeCall(lambda: resize(True), number=3, repeat=3)
+
+        # how far the reduced decode strays from the full decode
+        rms = max(ImageStat.Stat(ImageChops.difference(resize(False), resize(True))).rms)
+        if rms > 0:
+            psnr = '%5.1f dB' % (20 * math.log10(255 / rms))
+        else:
+            psnr = 'identical'
+
+        print '%dx%d -> %dx%d  full %7.2f ms  draft %7.2f ms  %4.1fx faster  PSNR %s' % (
+                width, height, size[0], size[1], full, draft, full / draft, psnr)
+
+
+def benchRotate():
+    for width, height in ((1280, 720), (1920, 1080), (3840, 2160)):
+        img = Image.effect_noise((width / 8, height / 8), 64).resize((width, height), Image.BICUBIC).convert('RGB')
+        data = StringIO()
+        img.save(data, 'JPEG', quality=85)
+        data = data.getvalue()
+
+        def rotate():
+            out = StringIO()
+            Image.open(StringIO(data)).rotate(90, expand=True).save(out, 'JPEG')
+
+        def transpose():
+            out = StringIO()
+            Image.open(StringIO(data)).transpose(Image.ROTATE_90).save(out, 'JPEG')
+
+        print '%dx%d  rotate %7.2f ms  transpose %7.2f ms  exif %6.3f ms' % (width, height,
+                timeCall(rotate, number=3, repeat=3), timeCall(transpose, number=3, repeat=3),
+                timeCall(lambda: chronobatch.setJpegOrientation(data, 90)))
+
+
+
+def benchAnnotate():
+    label = 'Chronolapse annotation benchmark'
+    mask = chronobatch.drawTextMask(label)
+
+    for width, height in ((1280, 720), (1920, 1080)):
+        img = Image.new('RGB', (width, height), (90, 120, 150))
+
+        def redraw():
+            # measuring, drawing and fading the text again for every frame
+            faded = chronobatch.getTextMask(chronobatch.drawTextMask(label)).point(lambda value: int(value * 0.6))
+            frame = img.copy()
+            frame.paste((0, 0, 0), (42, 42), faded)
+            frame.paste((255, 255, 0), (40, 40), faded)
+
+        def cached():
+            chronobatch.annotateImage(img.copy(), mask, (255, 255, 0), 0.6, 'Bottom', True)
+
+        print '%dx%d  redraw %6.3f ms  cached layer %6.3f ms' % (width, height,
+                timeCall(redraw), timeCall(cached))
+
+
+BENCHMARKS = [
+    ('tilehash', benchTileHash),
+    ('framehandoff', benchFrameHandoff),
+    ('draftresize', benchDraftResize),
+    ('rotate', benchRotate),
+    ('annotate', benchAnnotate),
+]
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:]
+
+    for name, function in BENCHMARKS:
+        if names and name not in names:
+            continue
+
+        print name
+        print '-' * 50
+        function()
+        print
@@ -0,0 +1,1316 @@
+"""
+    chronobatch.py
+    @summary:
+        Batch processing of captured frames for Chronolapse that does not
+        depend on wx. Frames are handed to a pool of worker processes in
+        chunks, so a big folder keeps every core busy while the caller still
+        gets progress after every chunk and can cancel between chunks.
+    @license: MIT license - see license.txt
+
+    Each frame is processed by the same function whether it runs in a worker
+    process or in the calling process, and every output file depends only on
+    its own input frame, so the output does not depend on the number of
+    workers or on the order the chunks finish in.
+
+    Pipelines
+        The 'pipeline' operation runs several of the tools on a frame in one
+        go - decoded once, passed through each stage, and saved once - instead
+        of saving and decoding it again between tools. Stages run in the
+        order given, as (name, folder, parameters):
+
+            ('crop', folder, ((left, top, right, bottom),))
+            ('resize', folder, ((width, height),))
+            ('rotate', folder, (angle,))
+            ('pip', folder, (size, position))
+            ('annotate', folder, (masks, colour, position, dropshadow))
+
+        folder is None, or a folder the frame is also saved into after that
+        stage. What differs from frame to frame - the PIP frame pasted in, or
+        the annotation text and opacity - comes from the job's extras.
+
+    Manifests
+        Incremental jobs keep a manifest in the output folder saying what each
+        output was made from - the input file, the settings and, for pipelines,
+        the PIP frame and annotation - and the size and mtime of the output.
+        Running the job again only processes frames that are new or changed,
+        or whose output has gone or been changed since. Entries are added as
+        chunks finish, so a job that was cancelled or crashed carries on from
+        where it stopped.
+
+    Edit lists
+        An edit list is a small document in a capture folder saying how to
+        trim, crop, resize and rotate its captures, which PIP captures to
+        paste in and which annotation to draw. Nothing is saved until the
+        video is encoded - the edits are made to each frame on its way to
+        the encoder - so trying another PIP corner or annotation costs one
+        encode instead of a copy of every capture per tool.
+
+    Job queue
+        A JobQueue runs batch jobs, video encodes and other external commands
+        one after another on a thread of its own, so the GUI - and any capture
+        running in it - carries on while they work. Jobs can be queued while
+        another is running, paused, and cancelled.
+"""
+
+import os, sys, ast, time, bisect, cPickle, signal, struct, hashlib, tempfile, threading, subprocess
+import collections, multiprocessing
+import distutils.spawn
+
+from PIL import Image, ImageDraw, ImageFont
+
+from chronocapture import getPixels, readSkippedFrames, FILETIMEFORMAT
+from chronostore import unlinkShared, getFrames
+
+
+# defaults for the batch options in chronolapse.config
+BATCHOPTIONS = {
+    'batchworkers':     0,      # worker processes, 0 for one per core
+    'batchchunkframes': 16,     # frames handed to a worker at a time
+    'batchdraftdecode': True,   # decode JPEGs at reduced size when shrinking them
+    'rotatemode':       'lossless', # lossless, exif or reencode - see rotateFrame
+    'jpegtranpath':     '',     # empty to look for jpegtran on the path
+    'batchincremental': True,   # skip frames whose output is up to date
+    'piptolerance':     0.0,    # seconds apart PIP frames can be, 0 for half the frame interval
+    'batchlinkmode':    'link', # link, reflink or copy - how unchanged frames are passed through
+}
+
+# sidecar in each output folder recording what every output was made from
+MANIFESTFILE = 'chronolapse.manifest'
+
+# sidecars in a capture folder: its edit list and its annotation
+EDITLISTFILE = 'chronolapse.edits'
+ANNOTATIONFILE = 'chronolapse.annotate'
+
+# what an edit list leaves alone unless it says otherwise - see EditList
+EDITDEFAULTS = {
+    'first':                0,      # index of the first capture used
+    'last':                 None,   # index of the last capture used, None for the last one
+    'crop':                 None,   # (left, top, right, bottom) in pixels
+    'size':                 None,   # (width, height) to fit in
+    'rotate':               0,      # degrees counter clockwise
+    'pipfolder':            None,   # captures to paste in
+    'pipsize':              'Small',
+    'pipposition':          'Top-Right',
+    'piptolerance':         0.0,    # see pairFrames
+    'pipignoreunmatched':   False,  # leave out captures with no PIP capture
+    'annotationfolder':     None,   # folder holding the annotation
+    'annotatetimed':        False,
+    'annotateduration':     0.0,    # seconds of capture time
+    'annotatefadein':       0.0,
+    'annotatefadeout':      0.0,
+    'annotateposition':     'Bottom',
+    'annotatecolour':       (255, 255, 255),
+    'annotatedropshadow':   True,
+    'annotatefont':         '',     # wx font description, PIL's default font without wx
+    'holds':                True,   # repeat captures that stood in for skipped ones
+}
+
+# JPEGs are only decoded at reduced size when shrinking by at least this much
+DRAFTRATIO = 2
+
+# seconds between progress reports from queued jobs, and between checks on
+# external commands
+PROGRESSINTERVAL = 0.2
+
+ONWINDOWS = sys.platform.startswith('win')
+
+# annotation opacity is rounded to this many steps so each faded text layer
+# is drawn once, and at most this many layers are kept per process
+OPACITYLEVELS = 32
+MAXTEXTLAYERS = 256
+
+
+def getFitSize(size, box):
+    """Largest size with the aspect of size that fits in box, never larger than size"""
+    width, height = size
+    if width > box[0]:
+        height = int(max(height * box[0] / width, 1))
+        width = int(box[0])
+    if height > box[1]:
+        width = int(max(width * box[1] / height, 1))
+        height = int(box[1])
+    return width, height
+
+
+def draftImage(img, size):
+    """Before img is loaded: when it is a JPEG being shrunk to half or less,
+    has the decoder scale it down by 1/2, 1/4 or 1/8 while decoding (DCT
+    scaling), never below size, which skips most of the decoding work."""
+    if img.format != 'JPEG':
+        return
+    if img.size[0] >= size[0] * DRAFTRATIO and img.size[1] >= size[1] * DRAFTRATIO:
+        img.draft(img.mode, size)
+
+
+def resizeFrame(frame, outfolder, size, draft=True):
+    source = frame.open()
+    target = getFitSize(source.size, size)
+
+    if target != source.size:
+        if draft:
+            draftImage(source, target)
+        source = source.resize(target, Image.ANTIALIAS)
+
+    path = os.path.join(outfolder, frame.name)
+    unlinkShared(path)
+    source.save(path)
+    setFrameTime(frame, path)
+    return 0
+
+
+def setFrameTime(frame, path):
+    """Gives the output at path the capture time of frame, which later tools
+    go by - hard links already share the source's"""
+    if os.stat(path).st_nlink == 1:
+        frametime = frame.getTime()
+        os.utime(path, (frametime, frametime))
+
+
+# right angle rotations, counter clockwise like Image.rotate
+TRANSPOSES = {90: Image.ROTATE_90, 180: Image.ROTATE_180, 270: Image.ROTATE_270}
+
+# EXIF orientation values and how far counter clockwise each turns the stored
+# pixels for display - the mirrored orientations are left alone
+ORIENTATIONS = {1: 0, 8: 90, 3: 180, 6: 270}
+
+JPEGSTART = '\xff\xd8'
+EXIFHEADER = 'Exif\x00\x00'
+ORIENTATIONTAG = 0x0112
+
+
+def findJpegtran(path=''):
+    """Path to jpegtran, or None if it is not installed"""
+    if path:
+        if os.path.isfile(path):
+            return path
+        return None
+    return distutils.spawn.find_executable('jpegtran')
+
+
+def getOrientation(angle):
+    for value, turned in ORIENTATIONS.items():
+        if turned == angle:
+            return value
+
+
+def setJpegOrientation(data, angle):
+    """Returns the JPEG data with its EXIF orientation turned counter clockwise
+    by angle, without touching the image data, or None if that is not
+    possible (not a JPEG, mirrored, or EXIF without an orientation tag)."""
+    if not data.startswith(JPEGSTART):
+        return None
+
+    # find the EXIF segment among the segments before the image data
+    position = 2
+    insertat = 2
+    exifat = None
+    while position + 4 <= len(data) and data[position] == '\xff':
+        marker = ord(data[position + 1])
+        if marker == 0xda:
+            break
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+
+        if marker == 0xe0 and position == 2:
+            # JFIF has to stay first
+            insertat = position + 2 + length
+        elif marker == 0xe1 and data[position + 4:position + 10] == EXIFHEADER:
+            exifat = position + 10
+            break
+        position += 2 + length
+
+    if exifat is None:
+        # a minimal big endian TIFF block with only the orientation in it
+        tiff = 'MM\x00\x2a' + struct.pack('>I', 8) + struct.pack('>H', 1)
+        tiff += struct.pack('>HHIHH', ORIENTATIONTAG, 3, 1, getOrientation(angle), 0)
+        tiff += struct.pack('>I', 0)
+        segment = EXIFHEADER + tiff
+        return data[:insertat] + '\xff\xe1' + struct.pack('>H', len(segment) + 2) + segment + data[insertat:]
+
+    # patch the orientation entry of the first IFD in place
+    order = {'II': '<', 'MM': '>'}.get(data[exifat:exifat + 2])
+    if order is None:
+        return None
+    ifd = exifat + struct.unpack(order + 'I', data[exifat + 4:exifat + 8])[0]
+    count = struct.unpack(order + 'H', data[ifd:ifd + 2])[0]
+    for entry in xrange(ifd + 2, ifd + 2 + count * 12, 12):
+        tag, type = struct.unpack(order + 'HH', data[entry:entry + 4])
+        if tag != ORIENTATIONTAG or type != 3:
+            continue
+
+        current = struct.unpack(order + 'H', data[entry + 8:entry + 10])[0]
+        if current not in ORIENTATIONS:
+            return None
+        value = getOrientation((ORIENTATIONS[current] + angle) % 360)
+        return data[:entry + 8] + struct.pack(order + 'H', value) + data[entry + 10:]
+
+    return None
+
+
+def transposeJpeg(jpegtran, data, angle):
+    """Rotates JPEG data losslessly with jpegtran, or returns None if it cannot
+    be done perfectly (usually because the size is not a whole number of
+    blocks)"""
+    # jpegtran turns clockwise
+    command = [jpegtran, '-copy', 'all', '-perfect', '-rotate', str((360 - angle) % 360)]
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, errors = proc.communicate(data)
+    if proc.returncode != 0 or not output:
+        return None
+    return output
+
+
+def writeData(path, data):
+    unlinkShared(path)
+    outfile = open(path, 'wb')
+    try:
+        outfile.write(data)
+    finally:
+        outfile.close()
+
+
+def rotateFrame(frame, outfolder, angle, mode='reencode', jpegtran=None):
+    """Rotates frame counter clockwise by angle. Right angles never resample:
+    in lossless mode JPEGs are turned by jpegtran, in exif mode only their
+    orientation tag is changed, and everything else is transposed and saved
+    again. Other angles are rotated and saved again."""
+    path = os.path.join(outfolder, frame.name)
+    unlinkShared(path)
+    angle = angle % 360
+
+    if angle in TRANSPOSES:
+        if mode in ('lossless', 'exif'):
+            data = frame.read()
+            rotated = None
+            if mode == 'exif':
+                rotated = setJpegOrientation(data, angle)
+            elif jpegtran is not None and data.startswith(JPEGSTART):
+                rotated = transposeJpeg(jpegtran, data, angle)
+
+            if rotated is not None:
+                writeData(path, rotated)
+                setFrameTime(frame, path)
+                return 0
+
+        frame.open().transpose(TRANSPOSES[angle]).save(path)
+        setFrameTime(frame, path)
+        return 0
+
+    source = frame.open()
+    if angle:
+        source = source.rotate(angle, expand=True)
+    source.save(path)
+    setFrameTime(frame, path)
+    return 0
+
+
+def getPipSize(size, pipsize, position):
+    """How much of a main image of size the PIP covers, for the PIP tab's
+    size ('Small', 'Medium' or 'Large') and position"""
+    divisor = {'Small': 4, 'Medium': 3}.get(pipsize, 2)
+    width, height = size
+
+    # sides take the full height, top and bottom the full width
+    if position in ('Left', 'Right'):
+        return width / divisor, height
+    if position in ('Top', 'Bottom'):
+        return width, height / divisor
+    return width / divisor, height / divisor
+
+
+def pasteImage(source, pip, pipsize, position):
+    """Shrinks pip and pastes it onto source at the PIP tab's position"""
+    pip.thumbnail(getPipSize(source.size, pipsize, position))
+
+    right = source.size[0] - pip.size[0]
+    bottom = source.size[1] - pip.size[1]
+    offsets = {
+        'Right':        (right, 0),
+        'Bottom':       (0, bottom),
+        'Top-Right':    (right, 0),
+        'Bottom-Right': (right, bottom),
+        'Bottom-Left':  (0, bottom),
+    }
+    source.paste(pip, offsets.get(position, (0, 0)))
+    return source
+
+
+def getFrameInterval(times):
+    """The usual time between sorted frame times, or None if there are too few"""
+    intervals = sorted(later - earlier for earlier, later in zip(times, times[1:]) if later > earlier)
+    if len(intervals) == 0:
+        return None
+    return intervals[len(intervals) / 2]
+
+
+def pairFrames(frames, pipframes, tolerance=0.0):
+    """Pairs each of frames with the PIP frame captured closest to it, if
+    that is within tolerance seconds. Returns the PIP frame or None for each
+    of frames, in the order given. A tolerance of 0 uses half the usual
+    time between frames, so a missing frame never pairs with its neighbour.
+
+    Both lists are put in time order and walked once side by side: the
+    closest PIP frame never moves backwards as the frame times go forwards."""
+    times = sorted((frame.getTime(), index) for index, frame in enumerate(frames))
+    pipframes = sorted(pipframes, key=lambda frame: frame.getTime())
+    piptimes = [frame.getTime() for frame in pipframes]
+
+    if tolerance <= 0:
+        interval = getFrameInterval([frametime for frametime, index in times])
+        if interval is None:
+            tolerance = float('inf')
+        else:
+            tolerance = interval / 2.0
+
+    pairs = [None] * len(frames)
+    if len(pipframes) == 0:
+        return pairs
+
+    current = 0
+    for frametime, index in times:
+        # move on while the next PIP frame is at least as close
+        while current + 1 < len(piptimes) and \
+                abs(piptimes[current + 1] - frametime) <= abs(piptimes[current] - frametime):
+            current += 1
+
+        if abs(piptimes[current] - frametime) <= tolerance:
+            pairs[index] = pipframes[current]
+
+    return pairs
+
+
+def getTextMask(mask):
+    """Annotation text masks travel as (size, 8 bit pixels) so they pickle with any PIL"""
+    size, data = mask
+    return Image.frombuffer('L', size, data, 'raw', 'L', 0, 1)
+
+
+def makeTextMask(img):
+    return img.size, getPixels(img.convert('L'))
+
+
+def drawTextMask(text, font=None):
+    """Text mask for annotateImage drawn with a PIL font, for annotating
+    without wx. Uses PIL's default font if none is given."""
+    if font is None:
+        font = ImageFont.load_default()
+
+    width, height = ImageDraw.Draw(Image.new('L', (1, 1))).textsize(text, font=font)
+    img = Image.new('L', (max(width, 1), max(height, 1)), 0)
+    ImageDraw.Draw(img).text((0, 0), text, fill=255, font=font)
+    return makeTextMask(img)
+
+
+# text layers drawn so far in this process
+textlayers = {}
+
+
+def getTextLayer(mask, colour, level, dropshadow):
+    """The text in mask as an RGBA image in colour over its drop shadow,
+    faded to level out of OPACITYLEVELS"""
+    key = (mask[1], mask[0], colour, level, dropshadow)
+    layer = textlayers.get(key)
+    if layer is not None:
+        return layer
+
+    alpha = getTextMask(mask)
+    if level < OPACITYLEVELS:
+        alpha = alpha.point(lambda value: value * level / OPACITYLEVELS)
+
+    layer = Image.new('RGBA', alpha.size, colour + (255,))
+    layer.putalpha(alpha)
+
+    # the shadow sits 2 pixels down and right, under the text
+    if dropshadow:
+        shadow = Image.new('RGBA', alpha.size, (0, 0, 0, 255))
+        shadow.putalpha(alpha)
+        size = (alpha.size[0] + 2, alpha.size[1] + 2)
+        below = Image.new('RGBA', size, (0, 0, 0, 0))
+        below.paste(shadow, (2, 2))
+        above = Image.new('RGBA', size, colour + (0,))
+        above.paste(layer, (0, 0))
+        layer = Image.alpha_composite(below, above)
+
+    if len(textlayers) >= MAXTEXTLAYERS:
+        textlayers.clear()
+    textlayers[key] = layer
+    return layer
+
+
+def getOpacityLevel(opacity):
+    return min(max(int(round(opacity * OPACITYLEVELS)), 0), OPACITYLEVELS)
+
+
+def annotateImage(img, mask, colour, opacity, position, dropshadow):
+    """Draws the text in mask (white on black) onto img in colour, centred at
+    the top or bottom like the Annotate tab, with a black drop shadow"""
+    level = getOpacityLevel(opacity)
+    if level == 0:
+        return img
+
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGB')
+
+    layer = getTextLayer(mask, tuple(colour), level, dropshadow)
+
+    x = (img.size[0] - mask[0][0]) / 2
+    if position == 'Top':
+        y = 40
+    else:
+        y = img.size[1] - mask[0][1] - 40
+
+    img.paste(layer, (x, y), layer)
+    return img
+
+
+def applyStage(img, stage, extra, first=False, draft=True):
+    """Runs img through one pipeline stage. extra holds the frame's PIP frame
+    and (text, opacity) entry. Returns the image and whether it changed."""
+    name, folder, parameters = stage
+
+    if name == 'crop':
+        left, top, right, bottom = parameters[0]
+        box = (max(left, 0), max(top, 0), min(right, img.size[0]), min(bottom, img.size[1]))
+        if box != (0, 0) + img.size and box[0] < box[2] and box[1] < box[3]:
+            return img.crop(box), True
+
+    elif name == 'resize':
+        target = getFitSize(img.size, parameters[0])
+        if target != img.size:
+            # only possible before anything has been decoded
+            if draft and first:
+                draftImage(img, target)
+            return img.resize(target, Image.ANTIALIAS), True
+
+    elif name == 'rotate':
+        angle = parameters[0] % 360
+        if angle in TRANSPOSES:
+            return img.transpose(TRANSPOSES[angle]), True
+        elif angle:
+            return img.rotate(angle, expand=True), True
+
+    elif name == 'pip':
+        if extra.get('pip') is not None:
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGB')
+            return pasteImage(img, extra['pip'].open(), *parameters), True
+
+    elif name == 'annotate':
+        # text faded out completely leaves the image as it is
+        if extra.get('annotate') is not None and getOpacityLevel(extra['annotate'][1]) > 0:
+            masks, colour, position, dropshadow = parameters
+            text, opacity = extra['annotate']
+            return annotateImage(img, masks[text], colour, opacity, position, dropshadow), True
+
+    else:
+        raise ValueError('Unknown pipeline stage %s' % name)
+
+    return img, False
+
+
+def renderFrame(frame, stages, extra=None, draft=True):
+    """frame run through stages, without saving anything"""
+    img = frame.open()
+    for index, stage in enumerate(stages):
+        img, changed = applyStage(img, stage, extra or {}, index == 0, draft)
+    return img
+
+
+def pipelineFrame(frame, outfolder, stages, draft=True, linkmode='copy', extra=None):
+    """Runs frame through stages with a single decode and saves the result in
+    outfolder. extra holds the frame's PIP frame and (text, opacity) entry.
+    Frames no stage changes are linked or copied instead of saved again,
+    see linkFile. Returns the number of bytes linking saved writing."""
+    extra = extra or {}
+    img = frame.open()
+    changed = False
+    linked = 0
+
+    for index, stage in enumerate(stages):
+        img, stagechanged = applyStage(img, stage, extra, index == 0, draft)
+        changed = changed or stagechanged
+
+        folder = stage[1]
+        if folder is not None and index < len(stages) - 1:
+            steppath = os.path.join(folder, frame.name)
+            linked += saveFrame(frame, img, changed, steppath, linkmode)
+            setFrameTime(frame, steppath)
+
+    path = os.path.join(outfolder, frame.name)
+    linked += saveFrame(frame, img, changed, path, linkmode)
+    setFrameTime(frame, path)
+    return linked
+
+
+def saveFrame(frame, img, changed, path, linkmode):
+    if changed:
+        unlinkShared(path)
+        img.save(path)
+        return 0
+    return frame.copyTo(path, linkmode)
+
+
+class AnnotationTimeline:
+    """When each text of an annotation shows, worked out once so looking up
+    a frame only costs a binary search however many entries there are.
+
+    annotation maps times in timeformat to text. Every entry shows from its
+    time until the next entry's time, or for duration seconds if that is
+    sooner - constant annotations have no duration. Timed entries fade in and
+    out over the first fadein and last fadeout seconds of their duration."""
+
+    def __init__(self, annotation, timeformat, duration=None, fadein=0.0, fadeout=0.0):
+        entries = sorted((time.mktime(time.strptime(stamp, timeformat)), text)
+                            for stamp, text in annotation.items())
+        self.starts = [start for start, text in entries]
+        self.texts = [text for start, text in entries]
+
+        self.duration = duration
+        self.fadein = fadein
+        self.fadeout = fadeout
+
+    def getEntry(self, frametime):
+        """(text, opacity) showing at frametime, or None if nothing shows"""
+        index = bisect.bisect_right(self.starts, frametime) - 1
+        if index < 0:
+            return None
+
+        elapsed = frametime - self.starts[index]
+        if self.duration is None:
+            return self.texts[index], 1.0
+
+        if elapsed > self.duration:
+            return None
+
+        if elapsed < self.fadein:
+            opacity = elapsed / self.fadein
+        elif elapsed < self.duration - self.fadeout:
+            opacity = 1.0
+        elif elapsed < self.duration:
+            opacity = (self.duration - elapsed) / self.fadeout
+        elif self.fadeout:
+            opacity = 0.0
+        else:
+            opacity = 1.0
+        return self.texts[index], opacity
+
+
+def planAnnotation(frames, annotation, timeformat, timed=False, duration=0.0, fadein=0.0, fadeout=0.0):
+    """Works out what an annotation shows on each of frames: (text, opacity)
+    or None for frames it leaves alone. Timed annotations show for duration
+    seconds of capture time, see AnnotationTimeline."""
+    if not timed:
+        duration = None
+    timeline = AnnotationTimeline(annotation, timeformat, duration, fadein, fadeout)
+    return [timeline.getEntry(frame.getCreationTime()) for frame in frames]
+
+
+def readAnnotation(folder):
+    """The annotation saved in folder, mapping capture times to text"""
+    annofile = open(os.path.join(folder, ANNOTATIONFILE), 'rb')
+    try:
+        return cPickle.load(annofile)
+    finally:
+        annofile.close()
+
+
+def readEditList(folder):
+    """The edit list saved in folder, or None if it has none. Settings it
+    does not mention, or can't read, keep their EDITDEFAULTS value."""
+    path = os.path.join(folder, EDITLISTFILE)
+    if not os.path.isfile(path):
+        return None
+
+    settings = dict(EDITDEFAULTS)
+    editfile = open(path, 'r')
+    try:
+        for line in editfile:
+            parts = line.rstrip('\r\n').split('\t', 1)
+            if len(parts) != 2 or parts[0] not in EDITDEFAULTS:
+                continue
+            try:
+                settings[parts[0]] = ast.literal_eval(parts[1])
+            except (ValueError, SyntaxError):
+                continue
+    finally:
+        editfile.close()
+    return settings
+
+
+def writeEditList(folder, settings):
+    """Saves settings as the edit list of folder - one setting per line, so
+    it can be changed by hand. Settings left at their default are left out."""
+    editfile = open(os.path.join(folder, EDITLISTFILE), 'w')
+    try:
+        editfile.write('# Chronolapse edit list - applied while encoding this folder\n')
+        for key in sorted(EDITDEFAULTS):
+            value = settings.get(key, EDITDEFAULTS[key])
+            if value != EDITDEFAULTS[key]:
+                editfile.write('%s\t%r\n' % (key, value))
+    finally:
+        editfile.close()
+
+
+class EditList:
+    """Edits to make to the captures in folder on their way to the encoder,
+    instead of saving a copy of every capture after each tool.
+
+    settings says which captures to use, how to crop, resize and rotate them,
+    which PIP captures to paste in, which annotation to draw and whether to
+    repeat captures for skipped ones - see EDITDEFAULTS. Changing one only
+    changes the next encode, the captures themselves are never touched.
+
+    drawText(text) draws annotation text as a mask for annotateImage, see
+    drawTextMask, which draws with PIL's default font."""
+
+    def __init__(self, folder, settings, drawText=None):
+        self.folder = folder
+        self.settings = settings
+        self.drawText = drawText or drawTextMask
+
+    def getFrames(self):
+        """The frames to encode, in order and with holds repeated, and the
+        extra parameter each one needs for the stages from getStages"""
+        settings = self.settings
+        frames = [frame for frame in getFrames(self.folder) if frame.isImage()]
+
+        last = settings['last']
+        if last is None:
+            last = len(frames) - 1
+        frames = frames[max(settings['first'], 0):last + 1]
+        extras = [{} for frame in frames]
+
+        if settings['pipfolder'] is not None:
+            pipframes = [frame for frame in getFrames(settings['pipfolder']) if frame.isImage()]
+            pairs = zip(frames, pairFrames(frames, pipframes, settings['piptolerance']))
+            if settings['pipignoreunmatched']:
+                pairs = [(frame, pipframe) for frame, pipframe in pairs if pipframe is not None]
+            frames = [frame for frame, pipframe in pairs]
+            extras = [{'pip': pipframe} for frame, pipframe in pairs]
+
+        if settings['annotationfolder'] is not None:
+            plan = planAnnotation(frames, readAnnotation(settings['annotationfolder']), FILETIMEFORMAT,
+                        settings['annotatetimed'], settings['annotateduration'],
+                        settings['annotatefadein'], settings['annotatefadeout'])
+            for extra, entry in zip(extras, plan):
+                extra['annotate'] = entry
+
+        if not settings['holds']:
+            return frames, extras
+
+        holds = readSkippedFrames(self.folder)
+        held = []
+        for frame, extra in zip(frames, extras):
+            held.extend([(frame, extra)] * (holds.get(frame.name, 0) + 1))
+        return [frame for frame, extra in held], [extra for frame, extra in held]
+
+    def getStages(self, extras):
+        """Pipeline stages making the edits - the annotation texts in extras,
+        from getFrames, are drawn here once each"""
+        settings = self.settings
+        stages = []
+
+        if settings['crop'] is not None:
+            stages.append(('crop', None, (tuple(settings['crop']),)))
+        if settings['size'] is not None:
+            stages.append(('resize', None, (tuple(settings['size']),)))
+        if settings['rotate'] % 360:
+            stages.append(('rotate', None, (settings['rotate'],)))
+        if settings['pipfolder'] is not None:
+            stages.append(('pip', None, (settings['pipsize'], settings['pipposition'])))
+
+        if settings['annotationfolder'] is not None:
+            masks = {}
+            for extra in extras:
+                entry = extra.get('annotate')
+                if entry is not None and entry[0] not in masks:
+                    masks[entry[0]] = self.drawText(entry[0])
+            stages.append(('annotate', None, (masks, tuple(settings['annotatecolour']),
+                        settings['annotateposition'], settings['annotatedropshadow'])))
+
+        return stages
+
+
+# operations by name - jobs name their operation so chunks stay picklable
+def renameFrame(frame, outfolder, linkmode='copy', name=None):
+    """Puts frame in outfolder as name, see linkFile. Returns the number of
+    bytes linking saved writing."""
+    return frame.copyTo(os.path.join(outfolder, name), linkmode)
+
+
+OPERATIONS = {
+    'resize':   resizeFrame,
+    'rotate':   rotateFrame,
+    'pipeline': pipelineFrame,
+    'rename':   renameFrame,
+}
+
+
+def processChunk(chunk):
+    """Runs (operation, frame, outfolder, parameters) tasks. Returns (frame
+    name, error, bytes linked) for each, error is None if it worked."""
+    results = []
+    for operation, frame, outfolder, parameters in chunk:
+        try:
+            linked = OPERATIONS[operation](frame, outfolder, *parameters)
+            results.append((frame.name, None, linked))
+        except Exception, e:
+            # exceptions do not always survive pickling, their description does
+            results.append((frame.name, repr(e), 0))
+    return results
+
+
+def getFrameKey(frame):
+    """Identifies a frame's contents without reading them"""
+    if frame.packed:
+        return '%s@%d+%d:%.6f' % (frame.path, frame.offset, frame.length, frame.timestamp)
+
+    # the folder scan's stat can be stale - files rewritten in place don't
+    # change the folder's mtime - so the file itself is asked
+    filestat = os.stat(frame.path)
+    frame.filestat = (filestat.st_size, filestat.st_mtime, filestat.st_ctime)
+    return '%s:%d:%.6f' % (frame.path, filestat.st_size, filestat.st_mtime)
+
+
+def getSettingsKey(value):
+    """A string that only changes when value does, with frames standing in
+    for their files and dictionaries in key order"""
+    if hasattr(value, 'packed'):
+        return getFrameKey(value)
+    if isinstance(value, dict):
+        return '{%s}' % ','.join('%s:%s' % (getSettingsKey(key), getSettingsKey(item))
+                                for key, item in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return '(%s)' % ','.join(getSettingsKey(item) for item in value)
+    return repr(value)
+
+
+def getJobSettings(operation, parameters):
+    """Hash of an operation's shared parameters, for getOutputKey"""
+    return hashlib.md5(getSettingsKey((operation, parameters))).hexdigest()
+
+
+def getOutputKey(settings, frame, extra=None):
+    """Key for the output made from frame with settings, from
+    getJobSettings, and the frame's extra parameter"""
+    key = hashlib.md5(settings)
+    key.update(getFrameKey(frame))
+    if extra is not None:
+        key.update(getSettingsKey(extra))
+    return key.hexdigest()
+
+
+class JobManifest:
+    """The manifest of an output folder, see Manifests above. Each line is
+    the output name, its key from getOutputKey, and its size and mtime."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFESTFILE)
+        self.entries = {}
+        self.lines = 0
+
+        if not os.path.isfile(self.path):
+            return
+
+        manifestfile = open(self.path, 'r')
+        try:
+            for line in manifestfile:
+                parts = line.rstrip('\r\n').split('\t')
+                if len(parts) != 4:
+                    continue
+                # later lines replace earlier ones for the same output
+                self.entries[parts[0]] = tuple(parts[1:])
+                self.lines += 1
+        finally:
+            manifestfile.close()
+
+    def getOutputStat(self, name):
+        try:
+            filestat = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return None
+        return str(filestat.st_size), '%.6f' % filestat.st_mtime
+
+    def isCurrent(self, name, key):
+        """True if the output name was made with key and not changed since"""
+        entry = self.entries.get(name)
+        if entry is None or entry[0] != key:
+            return False
+        return entry[1:] == self.getOutputStat(name)
+
+    def add(self, outputs):
+        """Records (name, key) for outputs that have just been written"""
+        lines = []
+        for name, key in outputs:
+            outputstat = self.getOutputStat(name)
+            if outputstat is None:
+                continue
+            self.entries[name] = (key,) + outputstat
+            lines.append('%s\t%s\t%s\t%s\n' % (name, key, outputstat[0], outputstat[1]))
+
+        if len(lines) == 0:
+            return
+
+        manifestfile = open(self.path, 'a')
+        try:
+            manifestfile.writelines(lines)
+        finally:
+            manifestfile.close()
+        self.lines += len(lines)
+
+    def compact(self):
+        """Rewrites the manifest without the entries later ones replaced"""
+        if self.lines <= 2 * len(self.entries):
+            return
+
+        temppath = self.path + '.tmp'
+        manifestfile = open(temppath, 'w')
+        try:
+            for name in sorted(self.entries):
+                manifestfile.write('%s\t%s\n' % (name, '\t'.join(self.entries[name])))
+        finally:
+            manifestfile.close()
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temppath, self.path)
+        self.lines = len(self.entries)
+
+
+def getWorkerCount(workers=0):
+    if workers > 0:
+        return workers
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+class BatchJob:
+    """Runs one operation over a list of frames, writing into outfolder.
+
+    extras, if given, holds one more parameter for each frame, passed after
+    the shared parameters.
+
+    An incremental job skips frames whose output the folder's manifest says
+    is up to date, and adds the frames it processes to the manifest. Jobs
+    writing over their own input are never incremental.
+
+    linkedbytes counts the bytes that linking unchanged frames into outfolder
+    saved writing, see chronostore.linkFile.
+
+    run() takes an optional progress(done, total, name) callback, called after
+    every chunk from the thread that called run(). Returning False from it
+    cancels the job: no more chunks are started, and the chunks already
+    handed out are finished so no half written files are left behind.
+    """
+
+    def __init__(self, operation, frames, outfolder, parameters=(), workers=0, chunkframes=16, debug=None,
+                    extras=None, incremental=False):
+        if operation not in OPERATIONS:
+            raise ValueError('Unknown batch operation %s' % operation)
+
+        self.operation = operation
+        self.frames = frames
+        self.outfolder = outfolder
+        self.parameters = tuple(parameters)
+        self.extras = extras
+        self.workers = getWorkerCount(workers)
+        self.chunkframes = max(1, chunkframes)
+        self.debug = debug or (lambda message, verbosity=-1: None)
+
+        self.incremental = incremental
+        self.manifest = None
+        self.keys = {}
+
+        self.done = 0
+        self.skipped = 0
+        self.linkedbytes = 0
+        self.errors = []
+        self.cancelled = False
+
+    def isInPlace(self):
+        outfolder = os.path.normcase(os.path.abspath(self.outfolder))
+        for frame in self.frames:
+            if not frame.packed and os.path.normcase(os.path.abspath(frame.folder)) == outfolder:
+                return True
+        return False
+
+    def getChunks(self):
+        extras = self.extras
+        if extras is None:
+            extras = [None] * len(self.frames)
+
+        if self.incremental and not self.isInPlace():
+            self.manifest = JobManifest(self.outfolder)
+            settings = getJobSettings(self.operation, self.parameters)
+
+        tasks = []
+        for frame, extra in zip(self.frames, extras):
+            parameters = self.parameters
+            if self.extras is not None:
+                parameters = parameters + (extra,)
+
+            if self.manifest is not None:
+                key = getOutputKey(settings, frame, extra)
+                if self.manifest.isCurrent(frame.name, key):
+                    self.skipped += 1
+                    continue
+                self.keys[frame.name] = key
+
+            tasks.append((self.operation, frame, self.outfolder, parameters))
+
+        if self.skipped > 0:
+            self.debug('Skipping %d frames that are up to date in %s' % (self.skipped, self.outfolder))
+        self.done = self.skipped
+        return [tasks[i:i + self.chunkframes] for i in xrange(0, len(tasks), self.chunkframes)]
+
+    def collect(self, results, progress):
+        """Counts a finished chunk, returns False if the job should stop"""
+        for name, error, linked in results:
+            self.done += 1
+            self.linkedbytes += linked
+            if error is not None:
+                self.errors.append((name, error))
+                self.debug('Skipped %s: %s' % (name, error))
+
+        if self.manifest is not None:
+            self.manifest.add([(name, self.keys[name]) for name, error, linked in results if error is None])
+
+        if progress is not None and len(results) > 0:
+            if progress(self.done, len(self.frames), results[-1][0]) is False:
+                self.cancelled = True
+        return not self.cancelled
+
+    def run(self, progress=None):
+        """Processes every frame. Returns True if the job ran to the end."""
+        chunks = self.getChunks()
+
+        # a pool is not worth starting for a single worker or a single chunk
+        if self.workers == 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                if not self.collect(processChunk(chunk), progress):
+                    break
+            self.finish()
+            return not self.cancelled
+
+        self.debug('Processing %d frames on %d processes' % (len(self.frames), self.workers))
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            # keep every worker busy with one more chunk queued up, and collect
+            # in submission order so progress moves through the folder
+            chunks = collections.deque(chunks)
+            pending = collections.deque()
+            while len(chunks) > 0 or len(pending) > 0:
+                while not self.cancelled and len(chunks) > 0 and len(pending) <= self.workers:
+                    pending.append(pool.apply_async(processChunk, (chunks.popleft(),)))
+
+                if len(pending) == 0:
+                    break
+                self.collect(pending.popleft().get(), progress)
+
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        self.finish()
+        return not self.cancelled
+
+    def finish(self):
+        if self.manifest is not None:
+            self.manifest.compact()
+
+
+class CommandJob:
+    """Runs an external command, such as MEncoder, in folder cwd as a job.
+    Afterwards returncode holds its exit code and output what it printed."""
+
+    def __init__(self, command, cwd=None, debug=None):
+        self.command = command
+        self.cwd = cwd
+        self.debug = debug or (lambda message, verbosity=-1: None)
+
+        self.proc = None
+        self.outputfile = None
+        self.returncode = None
+        self.output = ''
+        self.cancelled = False
+
+    def start(self, stdin=None):
+        self.debug('Calling: %s' % self.command)
+
+        # output goes to a file so a full pipe can't stall the command
+        self.outputfile = tempfile.TemporaryFile()
+        if ONWINDOWS:
+            self.proc = subprocess.Popen(self.command, cwd=self.cwd, stdin=stdin,
+                            stdout=self.outputfile, stderr=self.outputfile)
+        else:
+            self.proc = subprocess.Popen(self.command, cwd=self.cwd, close_fds=True, shell=True, stdin=stdin,
+                            stdout=self.outputfile, stderr=self.outputfile)
+
+    def finish(self):
+        try:
+            self.returncode = self.proc.wait()
+            self.outputfile.seek(0)
+            self.output = self.outputfile.read()
+        finally:
+            self.outputfile.close()
+        return self.returncode == 0 and not self.cancelled
+
+    def run(self, progress):
+        self.start()
+        while self.proc.poll() is None:
+            if progress(0, 0, 'Running') is False:
+                self.cancel()
+            time.sleep(PROGRESSINTERVAL)
+        return self.finish()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.proc is not None and self.proc.poll() is None:
+            try:
+                self.proc.terminate()
+            except OSError:
+                # already gone
+                pass
+            # a paused command has to run again to stop
+            self.resume()
+
+    def canPause(self):
+        # Windows has no way to suspend a process from here
+        return hasattr(signal, 'SIGSTOP')
+
+    def pause(self):
+        if self.proc is not None and self.canPause():
+            try:
+                os.kill(self.proc.pid, signal.SIGSTOP)
+            except OSError:
+                pass
+
+    def resume(self):
+        if self.proc is not None and hasattr(signal, 'SIGCONT'):
+            try:
+                os.kill(self.proc.pid, signal.SIGCONT)
+            except OSError:
+                pass
+
+
+class EncodeJob(CommandJob):
+    """Decodes frames and feeds them to an encoder command reading raw RGB
+    video of size on its stdin. Frames of another size are scaled to fit.
+
+    With stages - an edit list's, say - each frame is run through them on
+    the way, with its entry in extras, see renderFrame. A frame repeated
+    with the same extra, like a hold, is only decoded once."""
+
+    def __init__(self, command, frames, size, cwd=None, debug=None, stages=None, extras=None, draft=True):
+        CommandJob.__init__(self, command, cwd, debug)
+        self.frames = frames
+        self.size = size
+        self.stages = stages or []
+        self.extras = extras or [None] * len(frames)
+        self.draft = draft
+
+    def canPause(self):
+        # the encoder waits for frames while the queue holds up progress
+        return True
+
+    def run(self, progress):
+        self.start(subprocess.PIPE)
+        previous = None
+        pixels = None
+        try:
+            for index, (frame, extra) in enumerate(zip(self.frames, self.extras)):
+                if progress(index, len(self.frames), frame.name) is False:
+                    self.cancel()
+                    break
+
+                if (frame, extra) != previous:
+                    previous = (frame, extra)
+                    try:
+                        img = renderFrame(frame, self.stages, extra, self.draft).convert('RGB')
+                    except Exception:
+                        # not an image
+                        pixels = None
+                        continue
+
+                    if img.size != self.size:
+                        img = img.resize(self.size, Image.BILINEAR)
+                    pixels = getPixels(img)
+
+                if pixels is not None:
+                    self.proc.stdin.write(pixels)
+        except IOError, e:
+            # the encoder quit early - its output says why
+            self.debug('Encoder stopped reading frames: %s' % repr(e))
+
+        try:
+            self.proc.stdin.close()
+        except IOError:
+            pass
+        return self.finish()
+
+
+class JobQueue:
+    """Runs queued jobs one at a time on a thread of its own.
+
+    A job is anything with a run(progress) method that returns True if the
+    job finished. It calls progress(done, total, text) as it goes - total is
+    0 if it can't tell how far along it is - and stops if that returns False.
+    progress does not return while the queue is paused. Jobs that can pause
+    or stop by themselves, like external commands, also get pause(), resume()
+    and cancel() calls, and say with canPause() whether pausing works at all.
+
+    listener(event, job, ...) hears about each job, on the queue's thread:
+
+        ('queued', job)
+        ('started', job)
+        ('progress', job, done, total, text)
+        ('finished', job, ok, error)    error is None unless run() raised
+    """
+
+    def __init__(self, listener=None, debug=None):
+        self.listener = listener or (lambda *args: None)
+        self.debug = debug or (lambda message, verbosity=-1: None)
+
+        self.waiting = collections.deque()
+        self.current = None
+        self.cancelling = False
+        self.closed = False
+        self.condition = threading.Condition()
+
+        # cleared while paused
+        self.running = threading.Event()
+        self.running.set()
+
+        self.thread = threading.Thread(target=self.runJobs, name='JobQueue')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def add(self, job, title):
+        job.title = title
+        self.listener('queued', job)
+
+        self.condition.acquire()
+        try:
+            self.waiting.append(job)
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def remove(self, job):
+        """Takes a job that has not started yet off the queue"""
+        self.condition.acquire()
+        try:
+            if job not in self.waiting:
+                return False
+            self.waiting.remove(job)
+            return True
+        finally:
+            self.condition.release()
+
+    def getJobs(self):
+        """The running job, or None, and the jobs waiting after it"""
+        self.condition.acquire()
+        try:
+            return self.current, list(self.waiting)
+        finally:
+            self.condition.release()
+
+    def cancel(self):
+        """Stops the running job"""
+        self.condition.acquire()
+        try:
+            job = self.current
+            self.cancelling = job is not None
+        finally:
+            self.condition.release()
+
+        if job is not None and hasattr(job, 'cancel'):
+            job.cancel()
+
+    def isPaused(self):
+        return not self.running.isSet()
+
+    def canPause(self):
+        """False if the running job would carry on while the queue is paused"""
+        job = self.current
+        return job is None or not hasattr(job, 'canPause') or job.canPause()
+
+    def pause(self):
+        self.running.clear()
+        job = self.current
+        if job is not None and hasattr(job, 'pause'):
+            job.pause()
+
+    def resume(self):
+        job = self.current
+        if job is not None and hasattr(job, 'resume'):
+            job.resume()
+        self.running.set()
+
+    def close(self):
+        """Stops the running job and drops the rest"""
+        self.condition.acquire()
+        try:
+            self.closed = True
+            self.waiting.clear()
+            self.condition.notify()
+        finally:
+            self.condition.release()
+        self.cancel()
+        self.resume()
+
+    def getProgress(self, job):
+        reported = [0.0]
+
+        def progress(done, total, text):
+            # the GUI only needs a few updates a second
+            now = time.time()
+            if now - reported[0] >= PROGRESSINTERVAL or (total > 0 and done >= total):
+                reported[0] = now
+                self.listener('progress', job, done, total, text)
+
+            while not self.cancelling and not self.running.wait(PROGRESSINTERVAL):
+                pass
+            return not self.cancelling
+
+        return progress
+
+    def runJobs(self):
+        while True:
+            self.condition.acquire()
+            try:
+                while len(self.waiting) == 0 and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                job = self.waiting.popleft()
+                self.current = job
+                self.cancelling = False
+            finally:
+                self.condition.release()
+
+            # a paused queue starts nothing new
+            while not self.running.wait(PROGRESSINTERVAL) and not self.cancelling:
+                pass
+
+            self.listener('started', job)
+            ok = False
+            error = None
+            if not self.cancelling:
+                try:
+                    ok = job.run(self.getProgress(job))
+                except Exception, e:
+                    error = repr(e)
+                    self.debug('Job %s failed: %s' % (job.title, error))
+
+            self.condition.acquire()
+            try:
+                self.current = None
+            finally:
+                self.condition.release()
+            self.listener('finished', job, ok, error)
@@ -0,0 +1,1536 @@
+"""
+    chronocapture.py
+    @summary:
+        Capture helpers for Chronolapse that do not depend on wx. Everything in
+        here can be used from the GUI, from a background thread, or from a
+        process with no event loop at all.
+    @license: MIT license - see license.txt
+"""
+
+import os, sys, time, math, threading, Queue, collections, subprocess, tempfile
+
+from cStringIO import StringIO
+
+from PIL import Image, ImageChops
+
+# numpy is optional - only the tile hashing needs it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from chronostore import FramePackWriter, FramePackReader, FrameIndex, PACKEXTENSION, scanFolder
+
+
+# capture file names and timestamps
+FILETIMEFORMAT = '%Y-%m-%d_%H-%M-%S'
+TIMESTAMPFORMAT = '%Y-%m-%d %H:%M:%S'
+
+# sidecar listing captures that were skipped because nothing changed
+SKIPFILE = 'chronolapse.skipped'
+
+# sidecar with the geometry of each display captured to its own stream
+DISPLAYFILE = 'chronolapse.displays'
+
+# sidecar linking the files saved for each capture
+FRAMERECORDFILE = 'chronolapse.frames'
+
+# defaults for the screenshot, webcam and capture options in chronolapse.config
+CAPTUREOPTIONS = {
+    'screenshottimestamp':  True,
+    'screenshotsavefolder':     'screenshots',
+    'screenshotprefix':     'screen_',
+    'screenshotformat':     'jpg',
+    'screenshotdualmonitor': False,
+    'screenshotseparatedisplays': False,
+
+    'screenshotsubsection': False,
+    'screenshotsubsectiontop': '0',
+    'screenshotsubsectionleft': '0',
+    'screenshotsubsectionwidth': '800',
+    'screenshotsubsectionheight': '600',
+
+    'screenshotskipunchanged':      False,
+    'screenshotchangethreshold':    0.001,
+    'screenshottiles':              False,
+    'screenshottilesize':           64,
+
+    'captureasync':         False,
+    'captureworkers':       2,
+    'capturequeuedepth':    8,
+    'capturebackpressure':  'block',
+    'capturemissedpolicy':  'skip',
+
+    'highfrequencybuffer':      False,
+    'highfrequencybudget':      512,    # MB
+    'highfrequencybatch':       50,
+    'highfrequencycontainer':   False,
+
+    'captureindex':             True,
+    'capturecontainer':         False,
+    'capturesegmentframes':     1000,
+
+    'liveencode':               False,
+    'liveencoder':              '',     # empty uses the MEncoder path from the Video tab
+    'liveencodesegmentframes':  1000,
+    'liveencodequeuedepth':     32,
+
+    'webcamtimestamp':  True,
+    'webcamsavefolder':     'webcam',
+    'webcamprefix':     'cam_',
+    'webcamformat':     'jpg',
+    'webcamresolution': '800, 600',
+    'webcambackgroundgrab':     True,
+}
+
+# map chronolapse format names to PIL format names
+PILFORMATS = {
+    'jpg':  'JPEG',
+    'png':  'PNG',
+    'gif':  'GIF',
+}
+
+
+def _getmonotonic():
+    # python 3.3+
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+
+    # time.clock is QueryPerformanceCounter on windows and never jumps
+    if sys.platform.startswith('win'):
+        return time.clock
+
+    try:
+        import ctypes, ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        if sys.platform == 'darwin':
+            clockid = 6     # CLOCK_MONOTONIC on osx 10.12+
+        else:
+            clockid = 1     # CLOCK_MONOTONIC on linux
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        clock_gettime = libc.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+        def monotonic():
+            t = timespec()
+            if clock_gettime(clockid, ctypes.byref(t)) != 0:
+                raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+            return t.tv_sec + t.tv_nsec * 1e-9
+
+        # make sure it actually works here
+        monotonic()
+        return monotonic
+
+    except Exception:
+        return time.time
+
+# clock that is not affected by changes to the system time
+monotonic = _getmonotonic()
+
+
+def getPixels(img):
+    """Raw pixel data of a PIL image, with either PIL or Pillow"""
+    if hasattr(img, 'tobytes'):
+        return img.tobytes()
+    return img.tostring()
+
+
+def writeImage(img, path, format='jpg'):
+    """Saves a PIL image in one of the capture formats"""
+    format = PILFORMATS.get(format, 'JPEG')
+
+    # only JPEG takes the padded frame layout as it is
+    if img.mode == 'RGBX' and format != 'JPEG':
+        img = img.convert('RGB')
+
+    img.save(path, format)
+
+
+def storeImage(img, path, format='jpg', store=None, onwrite=None):
+    """Saves a PIL image to its own file, or into the FrameStore if one is
+    given. File writes are reported to onwrite(path, size, bytes, format);
+    the FrameStore reports its own writes."""
+    if store is not None:
+        store.writeImage(img, path, format)
+        return
+
+    writeImage(img, path, format)
+    if onwrite is not None:
+        onwrite(path, img.size, os.path.getsize(path), format)
+
+
+class FrameStore:
+    """Saves captures into frame packs instead of one file per capture.
+
+    Frames are encoded like writeImage would and appended to the current
+    pack of the folder they would have been saved in, under the name of the
+    file they would have been. A pack is closed (and gets its index) after
+    segmentframes frames and the next frame starts a new one, so a crash
+    only costs the index of the open segment. Safe to use from several
+    threads at once.
+
+    Every frame stored is reported to onwrite(path, size, bytes, format,
+    pack, offset) with the pack it went into and where its data starts.
+    """
+
+    def __init__(self, segmentframes=1000, debug=None, onwrite=None):
+        self.segmentframes = max(1, int(segmentframes))
+        self.debug = debug or (lambda message, verbosity=-1: None)
+        self.onwrite = onwrite
+
+        # open pack per folder
+        self.packs = {}
+        self.lock = threading.Lock()
+
+    def writeImage(self, img, path, format='jpg'):
+        """Same as writeImage, but into a pack"""
+        data = StringIO()
+        writeImage(img, data, format)
+        self.append(path, img.size, format, data.getvalue())
+
+    def append(self, path, size, format, data, timestamp=None):
+        """Stores already encoded image data"""
+        if timestamp is None:
+            timestamp = time.time()
+
+        folder, name = os.path.split(path)
+
+        self.lock.acquire()
+        try:
+            pack = self.packs.get(folder)
+            if pack is None:
+                packpath = os.path.join(folder, os.path.splitext(name)[0] + PACKEXTENSION)
+                pack = self.packs[folder] = FramePackWriter(packpath)
+                self.debug('Started frame pack %s' % packpath)
+
+            offset = FramePackReader.getDataOffset(pack.append(name, timestamp, size, format, data), name)
+            packpath = pack.path
+
+            # start a new segment
+            if pack.frames >= self.segmentframes:
+                pack.close()
+                del self.packs[folder]
+        finally:
+            self.lock.release()
+
+        if self.onwrite is not None:
+            self.onwrite(path, size, len(data), format, packpath, offset)
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            for pack in self.packs.values():
+                pack.close()
+            self.packs = {}
+        finally:
+            self.lock.release()
+
+
+class Frame:
+    """The pixels of one capture, held in a single writable buffer.
+
+    Frames are 4 bytes per pixel (RGBX) because that is the layout PIL can
+    wrap without copying. Change detection, tile hashing, the timestamp and
+    the encoder all work on this same memory.
+    """
+
+    MODE = 'RGBX'
+
+    def __init__(self, size, data=None, timestamp=None):
+        self.size = size
+        self.stride = size[0] * len(self.MODE)
+
+        if data is None:
+            data = bytearray(self.stride * size[1])
+        self.data = data
+
+        if timestamp is None:
+            timestamp = time.time()
+        self.timestamp = timestamp
+
+        self.image = None
+
+    @classmethod
+    def fromImage(cls, img, timestamp=None):
+        """Copies a PIL image into a new frame"""
+        if img.mode != cls.MODE:
+            img = img.convert(cls.MODE)
+        return cls(img.size, bytearray(getPixels(img)), timestamp)
+
+    def getImage(self):
+        """PIL image sharing the frame's memory"""
+        if self.image is None:
+            self.image = Image.frombuffer(self.MODE, self.size, self.data, 'raw', self.MODE, 0, 1)
+        return self.image
+
+    def getArray(self):
+        """numpy array of height x width x 4 sharing the frame's memory"""
+        return numpy.frombuffer(self.data, numpy.uint8).reshape(self.size[1], self.size[0], len(self.MODE))
+
+    def paste(self, img, position):
+        """Copies a PIL image into the frame at position, clipped to the frame"""
+        x, y = position
+        left = max(0, -x)
+        top = max(0, -y)
+        right = min(img.size[0], self.size[0] - x)
+        bottom = min(img.size[1], self.size[1] - y)
+        if right <= left or bottom <= top:
+            return
+
+        img = img.crop((left, top, right, bottom))
+        if img.mode != self.MODE:
+            img = img.convert(self.MODE)
+
+        pixels = getPixels(img)
+        rowbytes = img.size[0] * len(self.MODE)
+        for row in xrange(img.size[1]):
+            start = (y + top + row) * self.stride + (x + left) * len(self.MODE)
+            self.data[start:start+rowbytes] = pixels[row*rowbytes:(row+1)*rowbytes]
+
+
+def writeImages(jobs, store=None, onwrite=None):
+    """Writes several (image, path, format) jobs at once, one thread each,
+    like storeImage"""
+    threads = []
+    errors = []
+
+    def write(img, path, format):
+        try:
+            storeImage(img, path, format, store, onwrite)
+        except Exception, e:
+            errors.append((path, e))
+
+    for job in jobs:
+        thread = threading.Thread(None, write, 'writeimage', job)
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+
+    return errors
+
+
+class CaptureStream:
+    """One sequence of screenshots saved under the same prefix, with its own
+    change detection. geometry is (x, y, width, height) or None for the
+    default screen area. source names the stream in frame records."""
+
+    def __init__(self, prefix, geometry=None, source='screen', changegate=None, tilehasher=None):
+        self.prefix = prefix
+        self.geometry = geometry
+        self.source = source
+        self.changegate = changegate
+        self.tilehasher = tilehasher
+
+        # file name of the last saved screenshot
+        self.lastfile = None
+        self.lastdirtymask = None
+
+
+def getBoundingRect(geometries):
+    """Smallest (x, y, width, height) containing every geometry"""
+    left = min(x for x, y, width, height in geometries)
+    top = min(y for x, y, width, height in geometries)
+    right = max(x + width for x, y, width, height in geometries)
+    bottom = max(y + height for x, y, width, height in geometries)
+    return (left, top, right - left, bottom - top)
+
+
+def getDisplayPrefix(prefix, index):
+    """Prefix of the stream for one display, for example screen_d0_"""
+    return '%sd%d_' % (prefix, index)
+
+
+def getDisplaySource(index):
+    """Frame record source name of the stream for one display"""
+    return 'screen_d%d' % index
+
+
+def formatStamp(capturetime, subsecond=False):
+    """Text of the timestamp drawn on a capture taken at capturetime"""
+    stamp = time.strftime(TIMESTAMPFORMAT, time.localtime(capturetime))
+    if subsecond:
+        stamp = stamp + str(capturetime - math.floor(capturetime))[0:4]
+    return stamp
+
+
+def runParallel(calls):
+    """Runs the functions in calls at the same time and waits for all of them.
+    The first one runs on the calling thread, so it may use things that only
+    work there (like reading the screen with wx), the rest get a thread each.
+    Returns their results in order; a call that raised returns the exception
+    instead."""
+    results = [None] * len(calls)
+
+    def run(index, function):
+        try:
+            results[index] = function()
+        except Exception, e:
+            results[index] = e
+
+    threads = []
+    for index, function in enumerate(calls[1:]):
+        thread = threading.Thread(None, run, 'capture', (index + 1, function))
+        thread.start()
+        threads.append(thread)
+
+    if len(calls) > 0:
+        run(0, calls[0])
+
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def recordDisplays(folder, geometries):
+    displayfile = open(os.path.join(folder, DISPLAYFILE), 'w')
+    try:
+        for index, geometry in enumerate(geometries):
+            displayfile.write('%d\t%d\t%d\t%d\t%d\n' % ((index,) + tuple(geometry)))
+    finally:
+        displayfile.close()
+
+
+def readDisplays(folder):
+    """Returns a dictionary of display index -> (x, y, width, height)"""
+    displays = {}
+
+    path = os.path.join(folder, DISPLAYFILE)
+    if not os.path.isfile(path):
+        return displays
+
+    displayfile = open(path, 'r')
+    try:
+        for line in displayfile:
+            parts = line.split()
+            if len(parts) != 5:
+                continue
+            parts = [int(part) for part in parts]
+            displays[parts[0]] = tuple(parts[1:])
+    finally:
+        displayfile.close()
+
+    return displays
+
+
+def compositeDisplays(folder, prefix, outfolder, debug=None):
+    """Pastes the per display screenshots in folder back together into one
+    image per capture, laid out like the displays were. Returns the number of
+    images written."""
+    debug = debug or (lambda message, verbosity=-1: None)
+
+    displays = readDisplays(folder)
+    if len(displays) == 0:
+        raise IOError('No %s found in %s' % (DISPLAYFILE, folder))
+
+    left, top, width, height = getBoundingRect(displays.values())
+
+    # group files by capture name
+    captures = {}
+    files = scanFolder(folder).files.keys()
+    for index in displays.keys():
+        displayprefix = getDisplayPrefix(prefix, index)
+        for f in files:
+            if f.startswith(displayprefix):
+                captures.setdefault(f[len(displayprefix):], {})[index] = f
+
+    names = captures.keys()
+    names.sort()
+
+    count = 0
+    for name in names:
+        canvas = Image.new('RGB', (width, height))
+        for index, f in captures[name].iteritems():
+            x, y, displaywidth, displayheight = displays[index]
+            try:
+                canvas.paste(Image.open(os.path.join(folder, f)).convert('RGB'), (x - left, y - top))
+            except Exception, e:
+                debug('Skipping %s: %s' % (f, repr(e)))
+
+        format = os.path.splitext(name)[1][1:].lower()
+        if format == 'jpeg':
+            format = 'jpg'
+        writeImage(canvas, os.path.join(outfolder, prefix + name), format)
+        count += 1
+
+    return count
+
+
+class CaptureScheduler:
+    """Works out when captures are due.
+
+    Deadlines are absolute - start + n * interval on a monotonic clock - so the
+    time spent capturing never pushes later captures back. When a deadline is
+    missed entirely (the machine was suspended, a capture took longer than the
+    interval) the missed policy decides what happens:
+
+        skip        drop the missed captures and carry on from the next deadline
+        catchup     fire every missed capture, one after the other, until the
+                    schedule is back on time
+    """
+
+    SKIP = 'skip'
+    CATCHUP = 'catchup'
+    POLICIES = (SKIP, CATCHUP)
+
+    def __init__(self, interval, policy='skip', clock=monotonic):
+        if interval <= 0:
+            raise ValueError('Capture interval must be positive')
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown missed deadline policy: %s' % policy)
+
+        self.interval = float(interval)
+        self.policy = policy
+        self.clock = clock
+
+        self.starttime = None
+        self.frame = 1
+
+        # statistics
+        self.captured = 0
+        self.skipped = 0
+        self.lastlateness = 0.0
+        self.maxlateness = 0.0
+        self.totallateness = 0.0
+
+    def start(self, now=None):
+        if now is None:
+            now = self.clock()
+
+        # first capture is one interval after starting
+        self.starttime = now
+        self.frame = 1
+
+    def getDeadline(self):
+        return self.starttime + self.frame * self.interval
+
+    def timeUntilNext(self, now=None):
+        if now is None:
+            now = self.clock()
+        return self.getDeadline() - now
+
+    def getProgress(self, now=None):
+        """Fraction of the current interval that has already passed"""
+        return min(1.0, max(0.0, 1 - self.timeUntilNext(now) / self.interval))
+
+    def poll(self, now=None):
+        """Returns (deadline, lateness) when a capture is due, otherwise None"""
+        if now is None:
+            now = self.clock()
+
+        deadline = self.getDeadline()
+        if now < deadline:
+            return None
+
+        # missed one or more whole intervals
+        missed = int((now - deadline) / self.interval)
+        if missed > 0 and self.policy == self.SKIP:
+            self.frame += missed
+            self.skipped += missed
+            deadline = self.getDeadline()
+
+        lateness = now - deadline
+        self.frame += 1
+
+        self.captured += 1
+        self.lastlateness = lateness
+        self.maxlateness = max(self.maxlateness, lateness)
+        self.totallateness += lateness
+
+        return deadline, lateness
+
+    def getStats(self):
+        if self.captured:
+            meanlateness = self.totallateness / self.captured
+        else:
+            meanlateness = 0.0
+
+        return {
+            'captured':     self.captured,
+            'skipped':      self.skipped,
+            'lastlateness': self.lastlateness,
+            'maxlateness':  self.maxlateness,
+            'meanlateness': meanlateness,
+        }
+
+
+class CaptureWriter:
+    """Bounded pool of worker threads that encode and write captured frames.
+
+    The capture side only hands over raw pixels with submit() and returns
+    immediately; encoding and disk writes happen on the workers. What happens
+    when the workers fall behind is decided by the backpressure policy:
+
+        block       wait for a free slot in the queue
+        dropoldest  throw away the oldest frame that is still waiting
+        downscale   encode frames at half size while the queue is more than
+                    half full, drop the oldest frame when it is completely full
+    """
+
+    BLOCK = 'block'
+    DROPOLDEST = 'dropoldest'
+    DOWNSCALE = 'downscale'
+    POLICIES = (BLOCK, DROPOLDEST, DOWNSCALE)
+
+    def __init__(self, workers=2, depth=8, policy='block', debug=None, store=None, onwrite=None):
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown backpressure policy: %s' % policy)
+
+        self.workers = max(1, int(workers))
+        self.depth = max(1, int(depth))
+        self.policy = policy
+        self.debug = debug or (lambda message, verbosity=-1: None)
+
+        # frames go into packs instead of files if a FrameStore is given
+        self.store = store
+        self.onwrite = onwrite
+
+        self.queue = Queue.Queue(self.depth)
+        self.threads = []
+        self.lock = threading.Lock()
+
+        # counters
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.downscaled = 0
+        self.failed = 0
+
+    def start(self):
+        for i in xrange(self.workers):
+            thread = threading.Thread(None, self.work, 'capturewriter%d' % i)
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, flush=True):
+        """Stop the workers. Pending frames are written first unless flush is False"""
+        if not flush:
+            self.discardPending()
+
+        # one sentinel per worker
+        for thread in self.threads:
+            self.queue.put(None)
+
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def join(self):
+        """Wait until every submitted frame has been written or dropped"""
+        self.queue.join()
+
+    def submit(self, pixels, size, path, format='jpg'):
+        """Queue a frame for writing. pixels is either a Frame, a PIL image or
+        a raw RGB buffer of the given size"""
+        job = [pixels, size, path, format, False]
+
+        if self.policy == self.BLOCK:
+            self.queue.put(job)
+
+        else:
+            if self.policy == self.DOWNSCALE and self.queue.qsize() >= self.depth / 2.0:
+                job[4] = True
+
+            while True:
+                try:
+                    self.queue.put_nowait(job)
+                    break
+                except Queue.Full:
+                    self.dropOldest()
+
+        self.lock.acquire()
+        self.queued += 1
+        self.lock.release()
+
+    def dropOldest(self):
+        try:
+            old = self.queue.get_nowait()
+        except Queue.Empty:
+            return
+
+        self.queue.task_done()
+
+        self.lock.acquire()
+        self.dropped += 1
+        self.lock.release()
+        self.debug('Capture queue full - dropped frame %s' % old[2])
+
+    def discardPending(self):
+        while not self.queue.empty():
+            self.dropOldest()
+
+    def getStats(self):
+        self.lock.acquire()
+        stats = {
+            'queued':       self.queued,
+            'written':      self.written,
+            'dropped':      self.dropped,
+            'downscaled':   self.downscaled,
+            'failed':       self.failed,
+            'pending':      self.queue.qsize(),
+        }
+        self.lock.release()
+        return stats
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+
+            # sentinel - shut down
+            if job is None:
+                self.queue.task_done()
+                break
+
+            try:
+                self.write(*job)
+            except Exception, e:
+                self.lock.acquire()
+                self.failed += 1
+                self.lock.release()
+                self.debug('Failed to write %s: %s' % (job[2], repr(e)))
+
+            self.queue.task_done()
+
+    def write(self, pixels, size, path, format, downscale):
+        if isinstance(pixels, Frame):
+            img = pixels.getImage()
+        elif isinstance(pixels, Image.Image):
+            img = pixels
+        else:
+            img = Image.frombuffer('RGB', size, pixels, 'raw', 'RGB', 0, 1)
+
+        if downscale:
+            img = img.resize((max(1, img.size[0] / 2), max(1, img.size[1] / 2)), Image.BILINEAR)
+
+        storeImage(img, path, format, self.store, self.onwrite)
+
+        self.lock.acquire()
+        self.written += 1
+        if downscale:
+            self.downscaled += 1
+        self.lock.release()
+
+
+class FrameRingBuffer:
+    """Fixed memory budget of raw frame slots for high frequency capture.
+
+    push() copies a frame into a free slot and returns straight away. A
+    background thread takes full batches of slots and writes them out, either
+    as one image file per frame or as one raw frame pack per batch. If the
+    writer falls behind and every slot is taken, the new frame is dropped and
+    counted as an overrun instead of holding up the caller.
+
+    Slots are framesize bytes, which should fit the largest frame that will be
+    pushed - several streams of different sizes share one buffer. If it is 0
+    they are sized for the first frame pushed.
+    """
+
+    def __init__(self, budget, batchsize=50, container=False, flushinterval=5.0, debug=None, store=None,
+                    onwrite=None, framesize=0):
+        self.budget = int(budget)
+        self.batchsize = max(1, int(batchsize))
+        self.container = container
+        self.flushinterval = flushinterval
+        self.debug = debug or (lambda message, verbosity=-1: None)
+
+        # encoded frames go into packs instead of files if a FrameStore is given
+        self.store = store
+        self.onwrite = onwrite
+
+        # slots are allocated when the first frame is pushed
+        self.framesize = framesize
+        self.buffer = None
+        self.slotsize = 0
+        self.free = collections.deque()
+        self.pending = collections.deque()
+
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        # counters
+        self.pushed = 0
+        self.written = 0
+        self.overruns = 0
+        self.batches = 0
+        self.failed = 0
+
+    def allocate(self, framesize):
+        slots = self.budget / framesize
+        if slots < 2:
+            raise ValueError('Frame buffer budget of %d bytes is too small for %d byte frames' % (self.budget, framesize))
+
+        self.buffer = bytearray(slots * framesize)
+        self.slotsize = framesize
+        self.free = collections.deque(xrange(slots))
+        self.debug('Allocated %d frame slots of %d bytes' % (slots, framesize))
+
+    def getSlots(self):
+        if self.slotsize == 0:
+            return 0
+        return len(self.buffer) / self.slotsize
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(None, self.work, 'framebufferflush')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self, flush=True):
+        """Stop the flush thread. Buffered frames are written first unless flush is False"""
+        self.condition.acquire()
+        if not flush:
+            self.free.extend(slot for slot, frame in self.pending)
+            self.pending.clear()
+        self.running = False
+        self.condition.notify()
+        self.condition.release()
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def push(self, pixels, size, path, format='jpg', timestamp=None, mode='RGB'):
+        """Copy a raw RGB or RGBX frame into the buffer. Returns False on overrun"""
+        if timestamp is None:
+            timestamp = time.time()
+
+        framesize = size[0] * size[1] * len(mode)
+
+        self.condition.acquire()
+        try:
+            if self.buffer is None:
+                self.allocate(max(framesize, self.framesize))
+
+            if framesize > self.slotsize:
+                self.debug('%d byte frame does not fit the %d byte frame slots' % (framesize, self.slotsize))
+                self.overruns += 1
+                return False
+
+            if len(self.free) == 0:
+                self.overruns += 1
+                return False
+
+            slot = self.free.popleft()
+        finally:
+            self.condition.release()
+
+        # the slot belongs to us now, copy outside the lock
+        start = slot * self.slotsize
+        self.buffer[start:start+framesize] = pixels
+
+        self.condition.acquire()
+        self.pending.append((slot, (size, path, format, timestamp, mode)))
+        self.pushed += 1
+        if len(self.pending) >= self.batchsize:
+            self.condition.notify()
+        self.condition.release()
+
+        return True
+
+    def getStats(self):
+        self.condition.acquire()
+        stats = {
+            'pushed':   self.pushed,
+            'written':  self.written,
+            'overruns': self.overruns,
+            'batches':  self.batches,
+            'failed':   self.failed,
+            'buffered': len(self.pending),
+            'slots':    self.getSlots(),
+        }
+        self.condition.release()
+        return stats
+
+    def work(self):
+        while True:
+            self.condition.acquire()
+
+            # wait for a full batch, but don't sit on frames forever
+            if self.running and len(self.pending) < self.batchsize:
+                self.condition.wait(self.flushinterval)
+
+            if not self.running and len(self.pending) == 0:
+                self.condition.release()
+                break
+
+            batch = []
+            while len(self.pending) > 0 and len(batch) < self.batchsize:
+                batch.append(self.pending.popleft())
+            self.condition.release()
+
+            if len(batch) == 0:
+                continue
+
+            written = self.writeBatch(batch)
+
+            self.condition.acquire()
+            self.free.extend(slot for slot, frame in batch)
+            self.written += written
+            self.failed += len(batch) - written
+            self.batches += 1
+            self.condition.release()
+
+    def writeBatch(self, batch):
+        written = 0
+
+        if self.container:
+            # one pack named after the first frame in the batch
+            size, path, format, timestamp, mode = batch[0][1]
+            packpath = os.path.splitext(path)[0] + PACKEXTENSION
+            try:
+                pack = FramePackWriter(packpath)
+                try:
+                    for slot, (size, path, format, timestamp, mode) in batch:
+                        name = os.path.basename(path)
+                        data = buffer(self.buffer, slot * self.slotsize, size[0] * size[1] * len(mode))
+                        offset = FramePackReader.getDataOffset(pack.append(name, timestamp, size, mode.lower(), data), name)
+                        written += 1
+                        if self.onwrite is not None:
+                            self.onwrite(path, size, len(data), mode.lower(), packpath, offset)
+                finally:
+                    pack.close()
+            except Exception, e:
+                self.debug('Failed to write frame pack %s: %s' % (packpath, repr(e)))
+
+        else:
+            for slot, (size, path, format, timestamp, mode) in batch:
+                try:
+                    data = buffer(self.buffer, slot * self.slotsize, size[0] * size[1] * len(mode))
+                    storeImage(Image.frombuffer(mode, size, data, 'raw', mode, 0, 1), path, format,
+                                self.store, self.onwrite)
+                    written += 1
+                except Exception, e:
+                    self.debug('Failed to write %s: %s' % (path, repr(e)))
+
+        return written
+
+
+class WebcamGrabber:
+    """Keeps reading frames from a webcam on its own thread so the newest frame
+    is always ready.
+
+    Webcam drivers queue up frames, so grabbing one only when a capture is due
+    returns whatever was queued last, which may be seconds old. The grab
+    thread calls grab() as fast as the camera delivers frames and keeps only
+    the newest one, so capture() returns straight away with a current frame.
+    grab() has to return a frame that is not reused by the driver, or None if
+    no frame could be read. Frames replaced before anyone captured them are
+    counted as dropped.
+    """
+
+    def __init__(self, grab, clock=monotonic, debug=None):
+        self.grab = grab
+        self.clock = clock
+        self.debug = debug or (lambda message, verbosity=-1: None)
+
+        # newest frame and when it was grabbed
+        self.frame = None
+        self.grabbedat = None
+        self.taken = False
+
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        # counters
+        self.grabbed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.captured = 0
+        self.lastage = 0.0
+        self.maxage = 0.0
+        self.totalage = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(None, self.work, 'webcamgrab')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        self.condition.acquire()
+        self.running = False
+        self.condition.notifyAll()
+        self.condition.release()
+
+        # a grab may block on the driver, don't hang on it forever
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def isRunning(self):
+        return self.thread is not None and self.thread.isAlive()
+
+    def capture(self, timeout=2.0):
+        """Returns the newest frame and its age in seconds, or (None, None) if
+        no frame arrived within timeout"""
+        self.condition.acquire()
+        try:
+            if self.frame is None and self.running:
+                self.condition.wait(timeout)
+
+            if self.frame is None:
+                return None, None
+
+            age = self.clock() - self.grabbedat
+            self.taken = True
+            self.captured += 1
+            self.lastage = age
+            self.maxage = max(self.maxage, age)
+            self.totalage += age
+            return self.frame, age
+        finally:
+            self.condition.release()
+
+    def getStats(self):
+        self.condition.acquire()
+        stats = {
+            'grabbed':  self.grabbed,
+            'dropped':  self.dropped,
+            'failed':   self.failed,
+            'captured': self.captured,
+            'lastage':  self.lastage,
+            'maxage':   self.maxage,
+            'meanage':  self.totalage / max(1, self.captured),
+        }
+        self.condition.release()
+        return stats
+
+    def work(self):
+        while self.running:
+            try:
+                frame = self.grab()
+            except Exception, e:
+                self.debug('Webcam grab failed: %s' % repr(e))
+                frame = None
+
+            self.condition.acquire()
+            if frame is None:
+                self.failed += 1
+                # give the camera a moment before trying again
+                self.condition.wait(0.1)
+            else:
+                if self.frame is not None and not self.taken:
+                    self.dropped += 1
+                self.frame = frame
+                self.grabbedat = self.clock()
+                self.taken = False
+                self.grabbed += 1
+                self.condition.notifyAll()
+            self.condition.release()
+
+
+class LiveEncoder:
+    """Feeds captured frames straight into a running mencoder or ffmpeg
+    process, so the video is finished when capture stops.
+
+    Frames are queued with push() and written to the encoder's stdin as raw
+    RGB by a background thread. The queue is bounded; when the encoder falls
+    behind new frames are dropped rather than holding up capture. Every
+    segmentframes frames the encoder is closed and a new one started on the
+    next segment file, so a crash only loses the segment being written. If
+    the encoder dies the frame is retried once on a new segment; encoding is
+    given up after three frames in a row could not be encoded.
+
+    Every frame is scaled to the size of the first one.
+    """
+
+    MENCODER = ('"%(encoder)s" - -demuxer rawvideo -rawvideo w=%(width)d:h=%(height)d:format=rgb24:fps=%(fps)s '
+                '-ovc lavc -lavcopts vcodec=%(codec)s -o "%(output)s"')
+    FFMPEG = ('"%(encoder)s" -y -f rawvideo -pix_fmt rgb24 -s %(width)dx%(height)d -r %(fps)s -i - '
+                '-vcodec %(codec)s "%(output)s"')
+
+    MAXFAILURES = 3
+
+    def __init__(self, encoder, outputprefix, fps=25, codec='mpeg4', segmentframes=1000, depth=32,
+                    extension='avi', debug=None):
+        self.encoder = encoder
+        self.outputprefix = outputprefix
+        self.fps = fps
+        self.codec = codec
+        self.segmentframes = max(1, int(segmentframes))
+        self.extension = extension
+        self.debug = debug or (lambda message, verbosity=-1: None)
+
+        if 'ffmpeg' in os.path.basename(encoder).lower():
+            self.template = self.FFMPEG
+        else:
+            self.template = self.MENCODER
+
+        self.queue = Queue.Queue(max(1, int(depth)))
+        self.thread = None
+        self.lock = threading.Lock()
+
+        # running encoder
+        self.size = None
+        self.proc = None
+        self.errorfile = None
+        self.segment = 0
+        self.segmentcount = 0
+        self.lastframe = None
+        self.failures = 0
+        self.failed = False
+
+        # counters
+        self.pushed = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.crashes = 0
+        self.segments = []
+
+    def start(self):
+        self.thread = threading.Thread(None, self.work, 'liveencoder')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        """Encodes the queued frames and finishes the current segment"""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def push(self, pixels):
+        """Queues a Frame or PIL image. Returns False if it was dropped"""
+        if self.failed:
+            return False
+
+        try:
+            self.queue.put_nowait(pixels)
+        except Queue.Full:
+            self.lock.acquire()
+            self.dropped += 1
+            self.lock.release()
+            return False
+
+        self.lastframe = pixels
+        self.lock.acquire()
+        self.pushed += 1
+        self.lock.release()
+        return True
+
+    def repeat(self):
+        """Shows the last frame again, for captures that were skipped"""
+        if self.lastframe is None:
+            return False
+        return self.push(self.lastframe)
+
+    def getStats(self):
+        self.lock.acquire()
+        stats = {
+            'pushed':   self.pushed,
+            'encoded':  self.encoded,
+            'dropped':  self.dropped,
+            'crashes':  self.crashes,
+            'segments': list(self.segments),
+            'failed':   self.failed,
+        }
+        self.lock.release()
+        return stats
+
+    def getSegmentPath(self):
+        return '%s_%03d.%s' % (self.outputprefix, self.segment, self.extension)
+
+    def startSegment(self):
+        self.segment += 1
+        self.segmentcount = 0
+        output = self.getSegmentPath()
+
+        command = self.template % {'encoder': self.encoder, 'width': self.size[0], 'height': self.size[1],
+                                    'fps': self.fps, 'codec': self.codec, 'output': output}
+        self.debug('Starting live encoder: %s' % command)
+
+        # encoder output goes to a file so a full pipe can't stall it
+        self.errorfile = tempfile.TemporaryFile()
+        if sys.platform.startswith('win'):
+            self.proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=self.errorfile, stderr=self.errorfile)
+        else:
+            self.proc = subprocess.Popen(command, close_fds=True, shell=True, stdin=subprocess.PIPE,
+                            stdout=self.errorfile, stderr=self.errorfile)
+
+        self.lock.acquire()
+        self.segments.append(output)
+        self.lock.release()
+
+    def finishSegment(self):
+        """Closes the encoder's input and waits for it. Returns its exit code"""
+        if self.proc is None:
+            return None
+
+        try:
+            self.proc.stdin.close()
+        except IOError:
+            pass
+        returncode = self.proc.wait()
+
+        if returncode != 0:
+            self.errorfile.seek(0)
+            output = self.errorfile.read()
+            self.debug('Live encoder exited with %s: %s' % (returncode, output[-500:]))
+        self.errorfile.close()
+
+        self.proc = None
+        self.errorfile = None
+        return returncode
+
+    def getPixels(self, pixels):
+        if isinstance(pixels, Frame):
+            img = pixels.getImage()
+        else:
+            img = pixels
+
+        if self.size is None:
+            self.size = img.size
+        elif img.size != self.size:
+            img = img.resize(self.size, Image.BILINEAR)
+
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return getPixels(img)
+
+    def encode(self, data):
+        """Writes one frame, starting a new encoder if needed. Returns False if
+        the encoder died"""
+        if self.proc is None:
+            self.startSegment()
+
+        try:
+            if self.proc.poll() is not None:
+                raise IOError('encoder exited with %s' % self.proc.returncode)
+            self.proc.stdin.write(data)
+        except (IOError, OSError), e:
+            self.debug('Live encoder died: %s' % repr(e))
+            self.lock.acquire()
+            self.crashes += 1
+            self.lock.release()
+            self.finishSegment()
+            return False
+
+        self.segmentcount += 1
+        self.lock.acquire()
+        self.encoded += 1
+        self.lock.release()
+
+        # roll over to a new segment
+        if self.segmentcount >= self.segmentframes:
+            self.finishSegment()
+        return True
+
+    def work(self):
+        while True:
+            pixels = self.queue.get()
+            if pixels is None:
+                break
+            if self.failed:
+                continue
+
+            try:
+                data = self.getPixels(pixels)
+            except Exception, e:
+                self.debug('Live encoder could not read frame: %s' % repr(e))
+                continue
+
+            # retry once on a fresh encoder
+            if self.encode(data) or self.encode(data):
+                self.failures = 0
+                continue
+
+            self.failures += 1
+            if self.failures >= self.MAXFAILURES:
+                self.debug('Live encoder keeps failing - giving up')
+                self.failed = True
+
+        self.finishSegment()
+
+
+class ChangeGate:
+    """Decides whether a frame changed enough since the last saved frame to be
+    worth encoding and writing.
+
+    Both frames are shrunk to a small greyscale sample and compared pixel by
+    pixel. A sample pixel counts as changed when it differs by more than
+    tolerance levels; the frame counts as changed when more than threshold
+    (a fraction between 0 and 1) of the sample pixels changed.
+    """
+
+    def __init__(self, threshold=0.001, tolerance=16, samplesize=(160, 90)):
+        self.threshold = float(threshold)
+        self.tolerance = int(tolerance)
+        self.samplesize = samplesize
+
+        self.reference = None
+        self.lastdifference = 1.0
+
+    def reset(self):
+        self.reference = None
+
+    def getSample(self, img):
+        return img.resize(self.samplesize, Image.BILINEAR).convert('L')
+
+    def check(self, img):
+        """Returns True if img should be saved. img is a PIL image"""
+        sample = self.getSample(img)
+
+        # always keep the first frame
+        if self.reference is None:
+            self.reference = sample
+            self.lastdifference = 1.0
+            return True
+
+        # count sample pixels that moved more than the tolerance
+        histogram = ImageChops.difference(sample, self.reference).histogram()
+        changed = sum(histogram[self.tolerance+1:])
+        self.lastdifference = changed / float(self.samplesize[0] * self.samplesize[1])
+
+        if self.lastdifference > self.threshold:
+            # compare against the last saved frame so slow changes still add up
+            self.reference = sample
+            return True
+
+        return False
+
+
+class TileHasher:
+    """Splits frames into fixed size tiles and hashes every tile so changed
+    (dirty) regions can be found by comparing hashes with the previous frame.
+
+    The hash is a weighted sum of the raw pixel words in each tile, with a
+    different odd weight for every word column and every row, computed with
+    two vectorised passes over the frame. Per tile change counts are kept for
+    activity heatmaps.
+    """
+
+    def __init__(self, tilesize=64):
+        if numpy is None:
+            raise ImportError('Tile hashing requires numpy')
+
+        self.tilesize = int(tilesize)
+        self.layout = None
+
+        self.hashes = None
+        self.mask = None
+        self.changecounts = None
+        self.frames = 0
+
+    def getLayout(self, size, bytesperpixel):
+        width, height = size
+        rowbytes = width * bytesperpixel
+        tilebytes = self.tilesize * bytesperpixel
+
+        # largest word that divides both rows and tiles
+        for wordsize, dtype in ((8, numpy.uint64), (4, numpy.uint32), (2, numpy.uint16), (1, numpy.uint8)):
+            if rowbytes % wordsize == 0 and tilebytes % wordsize == 0:
+                break
+
+        words = rowbytes / wordsize
+        columnstarts = numpy.arange(0, words, tilebytes / wordsize)
+        rowstarts = numpy.arange(0, height, self.tilesize)
+
+        # odd multipliers so every word affects the hash
+        columnweights = (numpy.arange(words, dtype=numpy.uint64) * numpy.uint64(11400714819323198485)
+                            + numpy.uint64(1)) | numpy.uint64(1)
+        rowweights = (numpy.arange(height, dtype=numpy.uint64) * numpy.uint64(40503)
+                            + numpy.uint64(7)) | numpy.uint64(1)
+
+        return (size, bytesperpixel, dtype, words, columnstarts, rowstarts,
+                    columnweights, rowweights[:, numpy.newaxis])
+
+    def hashFrame(self, pixels, size, bytesperpixel=3):
+        """Returns an array of tile hashes, one per tile row and column"""
+        if self.layout is None or self.layout[0] != size or self.layout[1] != bytesperpixel:
+            self.layout = self.getLayout(size, bytesperpixel)
+        size, bytesperpixel, dtype, words, columnstarts, rowstarts, columnweights, rowweights = self.layout
+
+        frame = numpy.frombuffer(pixels, dtype, words * size[1]).reshape(size[1], words)
+
+        # weighted sum of each tile's words in every row, then of each tile's rows
+        rows = numpy.add.reduceat(frame * columnweights, columnstarts, axis=1, dtype=numpy.uint64)
+        return numpy.add.reduceat(rows * rowweights, rowstarts, axis=0, dtype=numpy.uint64)
+
+    def update(self, pixels, size, bytesperpixel=3):
+        """Hashes a new frame and returns the dirty tile mask against the previous one"""
+        hashes = self.hashFrame(pixels, size, bytesperpixel)
+
+        # first frame or the size changed - everything is dirty
+        if self.hashes is None or self.hashes.shape != hashes.shape:
+            self.mask = numpy.ones(hashes.shape, numpy.bool_)
+            self.changecounts = numpy.zeros(hashes.shape, numpy.int64)
+            self.frames = 0
+        else:
+            self.mask = hashes != self.hashes
+
+        self.hashes = hashes
+        self.changecounts += self.mask
+        self.frames += 1
+
+        return self.mask
+
+    def getDirtyFraction(self):
+        if self.mask is None:
+            return 1.0
+        return self.mask.mean()
+
+    def getDirtyRects(self):
+        """Returns (x, y, width, height) of every dirty tile in the last frame"""
+        rects = []
+        if self.mask is None:
+            return rects
+
+        width, height = self.layout[0]
+        for row, column in zip(*numpy.nonzero(self.mask)):
+            x = column * self.tilesize
+            y = row * self.tilesize
+            rects.append((x, y, min(self.tilesize, width - x), min(self.tilesize, height - y)))
+        return rects
+
+    def getHeatmap(self):
+        """Returns the fraction of frames in which each tile changed"""
+        if self.changecounts is None or self.frames == 0:
+            return None
+        return self.changecounts / float(self.frames)
+
+
+def recordSkippedFrame(folder, name, heldfile):
+    """Note in the folder's sidecar that capture name was skipped and heldfile
+    stands in for it"""
+    skipfile = open(os.path.join(folder, SKIPFILE), 'a')
+    try:
+        skipfile.write('%s\t%s\n' % (name, heldfile))
+    finally:
+        skipfile.close()
+
+
+def recordFrame(folders, capturetime, files):
+    """Appends a line linking every file saved for one capture to the frame
+    record in each folder. files is a list of (source, path), for example
+    [('screen', 'screenshots/screen_1.jpg'), ('webcam', 'webcam/cam_1.jpg')]."""
+    line = '%.6f\t%s\n' % (capturetime, '\t'.join('%s=%s' % (source, os.path.abspath(path))
+                                    for source, path in files))
+
+    for folder in set(folders):
+        recordfile = open(os.path.join(folder, FRAMERECORDFILE), 'a')
+        try:
+            recordfile.write(line)
+        finally:
+            recordfile.close()
+
+
+class CaptureIndex:
+    """Keeps the frame index (see chronostore.FrameIndex) of every save folder
+    up to date while capturing. frameWritten() is the onwrite callback for
+    the writers. Index errors are logged and never stop a capture."""
+
+    def __init__(self, debug=None):
+        self.debug = debug or (lambda message, verbosity=-1: None)
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def getIndex(self, folder):
+        self.lock.acquire()
+        try:
+            if folder not in self.indexes:
+                # captures already in the folder are indexed once, up front
+                existing = not FrameIndex.exists(folder) and len(scanFolder(folder).files) > 0
+                index = FrameIndex(folder)
+                if existing:
+                    self.debug('Indexed %d existing frames in %s' % (index.rebuild(getFrameSources(folder)), folder))
+                self.indexes[folder] = index
+            return self.indexes[folder]
+        finally:
+            self.lock.release()
+
+    def addCapture(self, capturetime, files):
+        """Records the (source, path) files saved by one capture"""
+        for source, path in files:
+            folder, name = os.path.split(path)
+            try:
+                self.getIndex(folder).addFrame(name, capturetime, source)
+            except Exception, e:
+                self.debug('Failed to index %s: %s' % (path, repr(e)))
+
+    def frameWritten(self, path, size, length, format, pack=None, offset=None):
+        folder, name = os.path.split(path)
+        if pack is not None:
+            pack = os.path.basename(pack)
+        try:
+            self.getIndex(folder).addWrite(name, size, length, format, pack, offset)
+        except Exception, e:
+            self.debug('Failed to index %s: %s' % (path, repr(e)))
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            for index in self.indexes.values():
+                index.close()
+            self.indexes = {}
+        finally:
+            self.lock.release()
+
+
+def readFrameRecords(folder):
+    """Returns a list of (capture time, {source: path}) in capture order"""
+    records = []
+
+    path = os.path.join(folder, FRAMERECORDFILE)
+    if not os.path.isfile(path):
+        return records
+
+    recordfile = open(path, 'r')
+    try:
+        for line in recordfile:
+            parts = line.rstrip('\r\n').split('\t')
+            try:
+                capturetime = float(parts[0])
+            except ValueError:
+                continue
+
+            files = {}
+            for part in parts[1:]:
+                source, sep, filepath = part.partition('=')
+                if sep:
+                    files[source] = filepath
+            records.append((capturetime, files))
+    finally:
+        recordfile.close()
+
+    return records
+
+
+def getFrameSources(folder):
+    """Returns a dictionary of file name -> the source it was captured from,
+    for the files in folder's frame records"""
+    sources = {}
+    for capturetime, files in readFrameRecords(folder):
+        for source, path in files.iteritems():
+            sources[os.path.basename(path)] = source
+    return sources
+
+
+def readSkippedFrames(folder):
+    """Returns a dictionary of file name -> number of skipped captures it stands in for"""
+    holds = {}
+
+    path = os.path.join(folder, SKIPFILE)
+    if not os.path.isfile(path):
+        return holds
+
+    skipfile = open(path, 'r')
+    try:
+        for line in skipfile:
+            parts = line.rstrip('\r\n').split('\t')
+            if len(parts) != 2:
+                continue
+            holds[parts[1]] = holds.get(parts[1], 0) + 1
+    finally:
+        skipfile.close()
+
+    return holds
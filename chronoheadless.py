@@ -0,0 +1,677 @@
+"""
+    chronoheadless.py
+    @summary:
+        Runs Chronolapse captures without the GUI. Options are read from the
+        same chronolapse.config the GUI writes, captures run on a dedicated
+        thread and the process is controlled with signals:
+
+            SIGINT / SIGTERM    stop capturing, write out pending frames and exit
+            SIGUSR1             write out pending frames and log statistics
+
+    @license: MIT license - see license.txt
+
+    Usage: chronoheadless.py [-v] [-q] [-c configfile] [-f seconds] [-n count] [-o option=value ...]
+           chronoheadless.py [-c configfile] -x outputfolder
+
+        -v / -q     increase / decrease verbosity
+        -c          config file to read (default: chronolapse.config next to this script)
+        -f          capture frequency in seconds, overrides the config
+        -n          stop after this many captures
+        -o          override a single option, for example -o captureasync=True
+        -x          put screenshots saved per display back together into
+                    outputfolder and exit
+"""
+
+import os, sys, time, getopt, signal, threading, cPickle
+
+from PIL import Image, ImageDraw, ImageFont
+
+from chronocapture import CaptureWriter, CaptureScheduler, ChangeGate, TileHasher, FrameRingBuffer
+from chronocapture import WebcamGrabber, FrameStore, LiveEncoder, CaptureIndex
+from chronocapture import CAPTUREOPTIONS, FILETIMEFORMAT
+from chronocapture import getPixels, storeImage, writeImages, recordSkippedFrame
+from chronocapture import CaptureStream, getBoundingRect, getDisplayPrefix, getDisplaySource, recordDisplays
+from chronocapture import compositeDisplays, formatStamp, runParallel, recordFrame
+
+
+# capture backends are optional - only fail when they are actually used
+try:
+    from PIL import ImageGrab
+except ImportError:
+    ImageGrab = None
+
+# only used to find the layout of multiple displays
+try:
+    import win32api
+except ImportError:
+    win32api = None
+
+if sys.platform.startswith('win'):
+    ONWINDOWS = True
+    try:
+        from VideoCapture import Device
+    except ImportError:
+        Device = None
+else:
+    ONWINDOWS = False
+    try:
+        import cv
+    except ImportError:
+        cv = None
+
+CONFIGFILE = 'chronolapse.config'
+
+# verbosity
+NORMAL = 0
+VERBOSE = 1
+DEBUG = 2
+
+
+def parseValue(value, default):
+    """value read as the type of the option's default, the type the GUI
+    stores. Raises ValueError if it isn't one."""
+    if isinstance(default, bool):
+        if value.lower() in ('true', 'yes', 'on', '1'):
+            return True
+        if value.lower() in ('false', 'no', 'off', '0'):
+            return False
+        raise ValueError('%s is not True or False' % value)
+
+    if isinstance(default, (int, float)):
+        return type(default)(value)
+
+    return value
+
+
+def loadConfig(path):
+    """Returns the pickled config dictionary, or an empty one if there is none"""
+    if not os.path.isfile(path):
+        return {}
+
+    configfile = open(path, 'rb')
+    try:
+        return cPickle.load(configfile)
+    finally:
+        configfile.close()
+
+
+class HeadlessCapture:
+    """Captures screenshots and/or webcam shots on a schedule without wx"""
+
+    def __init__(self, options, interval, usescreenshot=True, usewebcam=False,
+                    maxcaptures=0, verbosity=NORMAL, fontpath='', config=None):
+        self.options = options
+
+        # the rest of chronolapse.config - live encoding uses the Video tab settings
+        self.config = config or {}
+        self.interval = float(interval)
+        self.usescreenshot = usescreenshot
+        self.usewebcam = usewebcam
+        self.maxcaptures = maxcaptures
+        self.verbosity = verbosity
+
+        self.writer = None
+        self.framebuffer = None
+        self.framestore = None
+        self.captureindex = None
+        self.liveencoders = None
+        self.scheduler = None
+        self.cam = None
+        self.webcamgrabber = None
+
+        # one stream per captured screen area
+        self.screenstreams = []
+
+        self.stopping = threading.Event()
+        self.thread = None
+
+        # timestamp font
+        if os.path.isfile(fontpath):
+            self.font = ImageFont.load(fontpath)
+        else:
+            self.font = ImageFont.load_default()
+
+    def debug(self, message, verbosity=DEBUG):
+        if verbosity <= self.verbosity:
+            print message
+
+    def checkScreenshots(self):
+        """Why screenshots can't be taken here, or None if they can"""
+        if ImageGrab is None:
+            return ('PIL ImageGrab is not available - Pillow only has it on Windows and macOS, '
+                    'and on Linux from Pillow 7.1 with an X display')
+        try:
+            self.grab()
+        except Exception, e:
+            return 'a test screenshot failed: %s' % e
+        return None
+
+    def start(self):
+        # find out now rather than on every capture
+        if self.usescreenshot:
+            problem = self.checkScreenshots()
+            if problem is not None and not self.usewebcam:
+                raise ImportError('Cannot take screenshots, %s. Turn screenshots off or use a webcam' % problem)
+            elif problem is not None:
+                self.debug('Cannot take screenshots, %s - capturing from the webcam only' % problem, NORMAL)
+                self.usescreenshot = False
+
+        if self.usescreenshot:
+            self.screenstreams = self.getScreenStreams()
+
+            for stream in self.screenstreams:
+                if self.options['screenshotskipunchanged']:
+                    stream.changegate = ChangeGate(self.options['screenshotchangethreshold'])
+
+                if self.options['screenshottiles']:
+                    try:
+                        stream.tilehasher = TileHasher(self.options['screenshottilesize'])
+                    except Exception, e:
+                        self.debug('Tile hashing unavailable: %s' % repr(e), NORMAL)
+
+        if self.usewebcam:
+            self.initCam()
+
+        onwrite = None
+        if self.options['captureindex']:
+            self.captureindex = CaptureIndex(self.debug)
+            onwrite = self.captureindex.frameWritten
+
+        if self.options['capturecontainer']:
+            self.framestore = FrameStore(self.options['capturesegmentframes'], self.debug, onwrite)
+
+        if self.options['liveencode']:
+            self.liveencoders = {}
+
+        if self.options['highfrequencybuffer'] and self.interval < 1:
+            # the slots have to fit the largest display when each is saved on its own
+            framesize = max([width * height * 3 for x, y, width, height in
+                                [stream.geometry for stream in self.screenstreams if stream.geometry is not None]] or [0])
+            self.framebuffer = FrameRingBuffer(self.options['highfrequencybudget'] * 1024 * 1024,
+                                self.options['highfrequencybatch'], self.options['highfrequencycontainer'],
+                                debug=self.debug, store=self.framestore, onwrite=onwrite, framesize=framesize)
+            self.framebuffer.start()
+
+        if self.options['captureasync']:
+            self.writer = CaptureWriter(self.options['captureworkers'], self.options['capturequeuedepth'],
+                                self.options['capturebackpressure'], self.debug, self.framestore, onwrite)
+            self.writer.start()
+
+        self.scheduler = CaptureScheduler(self.interval, self.options['capturemissedpolicy'])
+        self.scheduler.start()
+
+        self.thread = threading.Thread(None, self.run, 'capture')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+        self.debug('Capturing every %s seconds' % self.interval, VERBOSE)
+
+    def stop(self, flush=True):
+        self.stopping.set()
+        if self.thread is not None and self.thread is not threading.currentThread():
+            self.thread.join()
+
+        if self.webcamgrabber is not None:
+            self.webcamgrabber.stop()
+        if self.framebuffer is not None:
+            self.framebuffer.stop(flush)
+        if self.writer is not None:
+            self.writer.stop(flush)
+        if self.framestore is not None:
+            self.framestore.close()
+        if self.liveencoders is not None:
+            for liveencoder in self.liveencoders.values():
+                liveencoder.stop()
+        if self.captureindex is not None:
+            self.captureindex.close()
+
+        self.logStats()
+
+    def isRunning(self):
+        return self.thread is not None and self.thread.isAlive()
+
+    def flush(self):
+        """Wait for queued frames to be written"""
+        if self.writer is not None:
+            self.writer.join()
+
+    def logStats(self):
+        stats = self.scheduler.getStats()
+        self.debug('Captured: %d skipped: %d mean lateness: %.3fs max lateness: %.3fs' % (
+                stats['captured'], stats['skipped'], stats['meanlateness'], stats['maxlateness']), VERBOSE)
+
+        if self.writer is not None:
+            stats = self.writer.getStats()
+            self.debug('Writer - queued: %d written: %d dropped: %d downscaled: %d failed: %d pending: %d' % (
+                    stats['queued'], stats['written'], stats['dropped'], stats['downscaled'],
+                    stats['failed'], stats['pending']), VERBOSE)
+
+        if self.framebuffer is not None:
+            stats = self.framebuffer.getStats()
+            self.debug('Frame buffer - buffered: %d written: %d overruns: %d batches: %d' % (
+                    stats['pushed'], stats['written'], stats['overruns'], stats['batches']), VERBOSE)
+
+        if self.liveencoders is not None:
+            for liveencoder in self.liveencoders.values():
+                stats = liveencoder.getStats()
+                self.debug('Live encoder - encoded: %d dropped: %d crashes: %d segments: %d' % (
+                        stats['encoded'], stats['dropped'], stats['crashes'], len(stats['segments'])), VERBOSE)
+
+        if self.webcamgrabber is not None:
+            stats = self.webcamgrabber.getStats()
+            self.debug('Webcam - grabbed: %d dropped: %d failed: %d mean age: %.3fs max age: %.3fs' % (
+                    stats['grabbed'], stats['dropped'], stats['failed'], stats['meanage'], stats['maxage']), VERBOSE)
+
+    def run(self):
+        while not self.stopping.isSet():
+            # sleep in short steps so a stop request is noticed
+            wait = self.scheduler.timeUntilNext()
+            if wait > 0:
+                time.sleep(min(wait, 0.5))
+                continue
+
+            due = self.scheduler.poll()
+            if due is None:
+                continue
+
+            deadline, lateness = due
+            try:
+                self.capture()
+            except Exception, e:
+                self.debug('Capture failed: %s' % repr(e), NORMAL)
+            self.debug('Capture was %.3fs late' % lateness)
+
+            if self.maxcaptures and self.scheduler.captured >= self.maxcaptures:
+                break
+
+    def capture(self):
+        # one capture time shared by every source
+        capturetime = time.time()
+
+        # get filename from time
+        filename = time.strftime(FILETIMEFORMAT, time.localtime(capturetime))
+
+        # use microseconds if capture speed is less than 1
+        if self.interval < 1:
+            filename = str(capturetime)
+
+        self.debug('Capturing - ' + filename)
+
+        calls = []
+        if self.usescreenshot:
+            calls.append(lambda: self.saveScreenshot(filename, capturetime))
+
+        # VideoCapture on windows stays on the thread that opened it
+        if self.usewebcam and ONWINDOWS and len(calls) > 0:
+            results = [calls[0](), self.saveWebcam(filename, capturetime)]
+        else:
+            if self.usewebcam:
+                calls.append(lambda: self.saveWebcam(filename, capturetime))
+            results = runParallel(calls)
+
+        files = []
+        folders = []
+        for result in results:
+            if isinstance(result, Exception):
+                self.debug('Capture failed: %s' % repr(result), NORMAL)
+                continue
+
+            # screenshots return a list of files, the webcam a single path
+            if isinstance(result, list):
+                files.extend(result)
+                folders.append(self.options['screenshotsavefolder'])
+            elif result is not None:
+                files.append(('webcam', result))
+                folders.append(self.options['webcamsavefolder'])
+
+        # link the files of this capture together
+        if len(files) > 0:
+            try:
+                recordFrame(folders, capturetime, files)
+            except Exception, e:
+                self.debug('Failed to record frame: %s' % repr(e), NORMAL)
+
+        # index the new files - held files were indexed when they were captured
+        if self.captureindex is not None:
+            self.captureindex.addCapture(capturetime,
+                    [(source, path) for source, path in files if filename in os.path.basename(path)])
+
+        return filename
+
+    def getStamp(self, capturetime=None):
+        if capturetime is None:
+            capturetime = time.time()
+        return formatStamp(capturetime, self.interval < 1)
+
+    def getDisplayGeometries(self):
+        """Returns (x, y, width, height) of every display, primary first, or
+        an empty list when the layout cannot be found"""
+        if win32api is None:
+            return []
+
+        geometries = []
+        try:
+            for handle, dc, (left, top, right, bottom) in win32api.EnumDisplayMonitors():
+                geometry = (left, top, right - left, bottom - top)
+                if geometry in geometries:
+                    continue
+                if left == 0 and top == 0:
+                    geometries.insert(0, geometry)
+                else:
+                    geometries.append(geometry)
+        except Exception, e:
+            self.debug('Failed to enumerate displays: %s' % repr(e), NORMAL)
+        return geometries
+
+    def getScreenStreams(self):
+        prefix = self.options['screenshotprefix']
+
+        if self.options['screenshotsubsection']:
+            return [CaptureStream(prefix, (int(self.options['screenshotsubsectionleft']),
+                        int(self.options['screenshotsubsectiontop']),
+                        int(self.options['screenshotsubsectionwidth']),
+                        int(self.options['screenshotsubsectionheight'])))]
+
+        if self.options['screenshotdualmonitor'] and self.options['screenshotseparatedisplays']:
+            geometries = self.getDisplayGeometries()
+            if len(geometries) > 1:
+                try:
+                    recordDisplays(self.options['screenshotsavefolder'], geometries)
+                except Exception, e:
+                    self.debug('Failed to record display layout: %s' % repr(e), NORMAL)
+                return [CaptureStream(getDisplayPrefix(prefix, index), geometry, getDisplaySource(index))
+                            for index, geometry in enumerate(geometries)]
+
+            self.debug('Display layout unknown - capturing all displays as one image', NORMAL)
+
+        return [CaptureStream(prefix)]
+
+    def saveScreenshot(self, filename, capturetime=None):
+        """Returns a list of (source, path) with the file standing in for each
+        stream in this capture"""
+        folder = self.options['screenshotsavefolder']
+        format = self.options['screenshotformat']
+        if format not in ('gif', 'png'):
+            format = 'jpg'
+
+        # one grab for all streams so they show the same moment
+        images = self.takeScreenshots(self.screenstreams)
+        stamp = self.getStamp(capturetime)
+
+        captured = []
+        streams = []
+        files = []
+        for stream, img in zip(self.screenstreams, images):
+            size = img.size
+
+            # compare before the timestamp makes every frame different
+            if stream.tilehasher is not None:
+                stream.lastdirtymask = stream.tilehasher.update(getPixels(img), size)
+
+            if stream.changegate is not None and not stream.changegate.check(img):
+                self.debug('Screenshot %s unchanged - skipping' % stream.prefix)
+                try:
+                    recordSkippedFrame(folder, stream.prefix + filename, stream.lastfile)
+                except Exception, e:
+                    self.debug('Failed to record skipped screenshot: %s' % repr(e), NORMAL)
+                if stream.lastfile is not None:
+                    files.append((stream.source, os.path.join(folder, stream.lastfile)))
+
+                # keep the video in time with the captures
+                if self.liveencoders is not None:
+                    self.getLiveEncoder(stream).repeat()
+                continue
+
+            if self.options['screenshottimestamp']:
+                ImageDraw.Draw(img).text((20, size[1]-30), stamp, fill=(0, 0, 0), font=self.font)
+
+            if self.liveencoders is not None and not self.getLiveEncoder(stream).push(img):
+                self.debug('Live encoder behind - dropped frame', VERBOSE)
+
+            captured.append((img, os.path.join(folder, "%s%s.%s" % (stream.prefix, filename, format)), format))
+            streams.append(stream)
+
+        # encode the displays in parallel unless something else already does
+        if len(captured) > 1 and self.writer is None and self.framebuffer is None:
+            failed = set()
+            for path, e in writeImages(captured, self.framestore, self.getWriteCallback()):
+                self.debug('Failed to save %s: %s' % (path, repr(e)), NORMAL)
+                failed.add(path)
+            saved = [path not in failed for img, path, format in captured]
+        else:
+            saved = [self.saveImage(img, path, format) for img, path, format in captured]
+
+        # only files that were kept go in the records
+        for stream, (img, path, format), kept in zip(streams, captured, saved):
+            if kept:
+                stream.lastfile = os.path.basename(path)
+                files.append((stream.source, path))
+
+        return files
+
+    def getLiveEncoder(self, stream):
+        if stream.prefix not in self.liveencoders:
+            encoder = self.options['liveencoder'] or self.config.get('mencoderpath', 'mencoder')
+            outputprefix = os.path.join(self.options['screenshotsavefolder'],
+                                '%slive_%s' % (stream.prefix, time.strftime(FILETIMEFORMAT)))
+
+            liveencoder = LiveEncoder(encoder, outputprefix, self.config.get('videoframerate', '10'),
+                                self.config.get('videocodec', 'wmv2'), self.options['liveencodesegmentframes'],
+                                self.options['liveencodequeuedepth'], debug=self.debug)
+            liveencoder.start()
+            self.liveencoders[stream.prefix] = liveencoder
+
+        return self.liveencoders[stream.prefix]
+
+    def grab(self, bbox=None):
+        if self.options['screenshotdualmonitor']:
+            try:
+                return ImageGrab.grab(bbox, all_screens=True).convert('RGB')
+            except TypeError:
+                # older PIL without multi monitor support
+                pass
+
+        return ImageGrab.grab(bbox).convert('RGB')
+
+    def takeScreenshots(self, streams):
+        """Returns one image per stream"""
+        if len(streams) == 1:
+            bbox = None
+            if streams[0].geometry is not None:
+                x, y, width, height = streams[0].geometry
+                bbox = (x, y, x + width, y + height)
+            return [self.grab(bbox)]
+
+        # the all screens grab starts at the top left of the bounding rect
+        img = self.grab()
+        left, top, width, height = getBoundingRect([stream.geometry for stream in streams])
+        return [img.crop((x - left, y - top, x - left + w, y - top + h))
+                    for x, y, w, h in [stream.geometry for stream in streams]]
+
+    def saveImage(self, img, path, format):
+        """Returns False if the frame was dropped"""
+        if self.framebuffer is not None:
+            if not self.framebuffer.push(getPixels(img), img.size, path, format):
+                self.debug('Frame buffer overrun - dropped %s' % path, VERBOSE)
+                return False
+
+        elif self.writer is not None:
+            self.writer.submit(img, None, path, format)
+
+        else:
+            storeImage(img, path, format, self.framestore, self.getWriteCallback())
+        return True
+
+    def getWriteCallback(self):
+        if self.captureindex is None:
+            return None
+        return self.captureindex.frameWritten
+
+    def initCam(self, devnum=0):
+        if ONWINDOWS:
+            if Device is None:
+                raise ImportError('VideoCapture library not found')
+            self.cam = Device(devnum, 0)
+        else:
+            if cv is None:
+                raise ImportError('OpenCV not found')
+            self.cam = cv.CaptureFromCAM(devnum)
+            if not self.cam:
+                self.cam = None
+                raise IOError('No webcam found')
+
+            if self.options['webcambackgroundgrab']:
+                self.webcamgrabber = WebcamGrabber(self.grabWebcamFrame, debug=self.debug)
+                self.webcamgrabber.start()
+
+    def grabWebcamFrame(self):
+        # OpenCV reuses the returned image for the next frame
+        im = cv.QueryFrame(self.cam)
+        if not im:
+            return None
+        return cv.CloneImage(im)
+
+    def saveWebcam(self, filename, capturetime=None):
+        """Returns the saved path, or None if the camera had no frame"""
+        folder = self.options['webcamsavefolder']
+        prefix = self.options['webcamprefix']
+        format = self.options['webcamformat']
+        path = os.path.join(folder, "%s%s.%s" % (prefix, filename, format))
+
+        if ONWINDOWS:
+            img = self.cam.getImage(timestamp=int(self.options['webcamtimestamp']))
+            self.saveImage(img, path, format)
+
+        else:
+            if self.webcamgrabber is not None:
+                im, age = self.webcamgrabber.capture()
+                if im is not None:
+                    self.debug('Webcam frame is %.3fs old' % age)
+                    if self.options['webcamtimestamp']:
+                        im = cv.CloneImage(im)
+            else:
+                cv.GrabFrame(self.cam)
+                im = cv.RetrieveFrame(self.cam)
+
+            if im is None or im is False:
+                self.debug('Error - could not get frame from camera', NORMAL)
+                return None
+
+            if self.options['webcamtimestamp']:
+                font = cv.InitFont(cv.CV_FONT_HERSHEY_COMPLEX, 0.75, 0.75, 0.0, 2, cv.CV_AA)
+                cv.PutText(im, self.getStamp(capturetime), (20, 30), font, cv.RGB(0,0,0))
+
+            if self.framestore is not None:
+                self.framestore.append(path, cv.GetSize(im), format, cv.EncodeImage('.' + format, im).tostring())
+            else:
+                cv.SaveImage(path, im)
+
+                if self.captureindex is not None:
+                    self.captureindex.frameWritten(path, cv.GetSize(im), os.path.getsize(path), format)
+
+        return path
+
+
+def main(argv):
+    chronolapsepath = os.path.dirname(os.path.abspath(argv[0]))
+    configpath = os.path.join(chronolapsepath, CONFIGFILE)
+
+    verbosity = NORMAL
+    frequency = None
+    compositefolder = None
+    maxcaptures = 0
+    overrides = {}
+
+    try:
+        optlist, args = getopt.getopt(argv[1:], 'vqc:f:n:o:x:')
+    except getopt.GetoptError, e:
+        print e
+        print __doc__
+        return 2
+
+    for opt, value in optlist:
+        if opt == '-v':
+            verbosity = max(0, min(2, verbosity + 1))
+        elif opt == '-q':
+            verbosity = max(0, min(2, verbosity - 1))
+        elif opt == '-c':
+            configpath = value
+        elif opt == '-f':
+            frequency = value
+        elif opt == '-n':
+            maxcaptures = int(value)
+        elif opt == '-o':
+            key, sep, optvalue = value.partition('=')
+            if key not in CAPTUREOPTIONS:
+                print 'Unknown option: %s' % key
+                return 2
+            try:
+                overrides[key] = parseValue(optvalue, CAPTUREOPTIONS[key])
+            except ValueError, e:
+                print 'Invalid value for %s: %s' % (key, e)
+                return 2
+        elif opt == '-x':
+            compositefolder = value
+
+    # same options the GUI would use
+    config = loadConfig(configpath)
+    options = dict(CAPTUREOPTIONS)
+    for key in options.keys():
+        if key in config:
+            options[key] = config[key]
+    options.update(overrides)
+
+    if compositefolder is not None:
+        try:
+            count = compositeDisplays(options['screenshotsavefolder'], options['screenshotprefix'], compositefolder)
+        except Exception, e:
+            print 'Failed to composite displays: %s' % e
+            return 1
+        print 'Wrote %d images to %s' % (count, compositefolder)
+        return 0
+
+    if frequency is None:
+        frequency = config.get('frequency', '60')
+    try:
+        interval = float(frequency)
+        if interval <= 0:
+            raise ValueError()
+    except ValueError:
+        print 'Frequency must be a positive number of seconds'
+        return 2
+
+    capture = HeadlessCapture(options, interval,
+                    config.get('usescreenshot', True), config.get('usewebcam', False),
+                    maxcaptures, verbosity, os.path.join(chronolapsepath, 'helvetica-10.pil'), config)
+
+    # stop and flush on request
+    def stopHandler(signum, frame):
+        capture.debug('Signal %d received - stopping' % signum, VERBOSE)
+        capture.stopping.set()
+
+    def flushHandler(signum, frame):
+        capture.flush()
+        capture.logStats()
+
+    signal.signal(signal.SIGINT, stopHandler)
+    signal.signal(signal.SIGTERM, stopHandler)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, flushHandler)
+
+    try:
+        capture.start()
+    except Exception, e:
+        print 'Failed to start capture: %s' % e
+        return 1
+
+    # signals are only delivered to the main thread while it is not blocked
+    while capture.isRunning():
+        capture.thread.join(0.5)
+
+    capture.stop()
+    return 0
+
+
+# run it!
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -53,7 +53,7 @@
 VERSION = '1.0.9'
 
 import wx, time, datetime, os, sys, shutil, cPickle, tempfile, textwrap
-import math, subprocess, getopt, urllib, urllib2, threading, xml.dom.minidom
+import math, subprocess, getopt, urllib, urllib2, threading, multiprocessing, xml.dom.minidom
 import wx.lib.masked as masked
 
 
@@ -84,6 +84,18 @@ except ImportError: # if it's not there locally, try the wxPython lib.
 
 
 from chronolapsegui import *
+from chronocapture import CaptureWriter, CaptureScheduler, ChangeGate, TileHasher, FrameRingBuffer
+from chronocapture import WebcamGrabber, FrameStore, LiveEncoder
+from chronocapture import SKIPFILE, recordSkippedFrame, readSkippedFrames
+from chronocapture import CAPTUREOPTIONS, FILETIMEFORMAT, TIMESTAMPFORMAT
+from chronocapture import Frame, writeImage, writeImages, storeImage, CaptureIndex
+from chronocapture import CaptureStream, getBoundingRect, getDisplayPrefix, getDisplaySource, recordDisplays
+from chronocapture import formatStamp, runParallel, recordFrame
+from chronostore import listFrames, getFrames, countFrames, hasPacks, getIndexedInterval
+from chronobatch import BatchJob, BATCHOPTIONS, findJpegtran
+from chronobatch import JobQueue, CommandJob, EncodeJob
+from chronobatch import EditList, readEditList, writeEditList, renderFrame
+from chronobatch import pasteImage, pairFrames, planAnnotation, makeTextMask, getFrameInterval
 
 # use psyco if available
 try:
@@ -198,6 +210,79 @@ class WebcamPreviewDialog(webcamPreviewDialog):
             pass
 
 
+class JobsDialog(jobsDialog):
+    """Shows the running job and the ones waiting, and pauses or cancels them"""
+
+    def __init__(self, *args, **kwargs):
+        jobsDialog.__init__(self, *args, **kwargs)
+        self.jobqueue = self.GetParent().jobqueue
+
+        self.jobpausebutton.Bind(wx.EVT_BUTTON, self.pausePressed)
+        self.jobcancelbutton.Bind(wx.EVT_BUTTON, self.cancelPressed)
+        self.jobremovebutton.Bind(wx.EVT_BUTTON, self.removePressed)
+        self.jobhidebutton.Bind(wx.EVT_BUTTON, self.hide)
+
+        # closing only hides it - the jobs keep running
+        self.Bind(wx.EVT_CLOSE, self.hide)
+
+    def hide(self, event=None):
+        self.Hide()
+
+    def pausePressed(self, event):
+        if self.jobqueue.isPaused():
+            self.jobqueue.resume()
+        else:
+            self.jobqueue.pause()
+        self.refresh()
+
+    def cancelPressed(self, event):
+        self.jobqueue.cancel()
+
+    def removePressed(self, event):
+        current, waiting = self.jobqueue.getJobs()
+        index = self.joblist.GetSelection()
+        if index != wx.NOT_FOUND and index < len(waiting):
+            self.jobqueue.remove(waiting[index])
+        self.refresh()
+
+    def refresh(self):
+        current, waiting = self.jobqueue.getJobs()
+        paused = self.jobqueue.isPaused()
+        pausable = self.jobqueue.canPause()
+
+        if current is None:
+            title = 'No jobs running'
+            self.jobgauge.SetValue(0)
+        elif not pausable:
+            title = "%s - running (can't pause)" % current.title
+        else:
+            title = current.title
+
+        if paused:
+            title += ' - paused'
+            self.jobpausebutton.SetLabel('Resume')
+        else:
+            self.jobpausebutton.SetLabel('Pause')
+
+        self.jobtitlelabel.SetLabel(title)
+        self.jobpausebutton.Enable(pausable or paused)
+        self.joblist.Set([job.title for job in waiting])
+        self.jobcancelbutton.Enable(current is not None)
+        self.jobremovebutton.Enable(len(waiting) > 0)
+
+    def showProgress(self, done, total, text):
+        if total > 0:
+            self.jobgauge.SetRange(total)
+            self.jobgauge.SetValue(min(done, total))
+            self.jobstatuslabel.SetLabel('%d of %d - %s' % (done, total, text))
+        else:
+            self.jobgauge.Pulse()
+            self.jobstatuslabel.SetLabel(text)
+
+    def showMessage(self, message):
+        self.jobstatuslabel.SetLabel(message)
+
+
 class Timer(wx.Timer):
     """Timer class"""
     def __init__(self, callback):
@@ -285,8 +370,10 @@ class ChronoFrame(chronoFrame):
         self.VERSION = VERSION
         self.ANNOTATIONFILE = 'chronolapse.annotate'
         self.CONFIGFILE = 'chronolapse.config'
-        self.FILETIMEFORMAT = '%Y-%m-%d_%H-%M-%S'
-        self.TIMESTAMPFORMAT = '%Y-%m-%d %H:%M:%S'
+        self.SKIPFILE = SKIPFILE
+        self.FRAMELISTFILE = 'chronolapse.framelist'
+        self.FILETIMEFORMAT = FILETIMEFORMAT
+        self.TIMESTAMPFORMAT = TIMESTAMPFORMAT
         self.DOCFILE = 'manual.html'
         self.VERSIONCHECKPATH = 'http://keeyai.com/versioncheck.php?application=chronolapse'
         self.UPDATECHECKFREQUENCY = 604800      # 1 week, in seconds
@@ -352,41 +439,63 @@ class ChronoFrame(chronoFrame):
         'font': wx.Font(22, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL),
         'fontdata': wx.FontData(),
 
-        'screenshottimestamp':  True,
-        'screenshotsavefolder':     'screenshots',
-        'screenshotprefix':     'screen_',
-        'screenshotformat':     'jpg',
-        'screenshotdualmonitor': False,
-
-        'screenshotsubsection': False,
-        'screenshotsubsectiontop': '0',
-        'screenshotsubsectionleft': '0',
-        'screenshotsubsectionwidth': '800',
-        'screenshotsubsectionheight': '600',
-
-        'webcamtimestamp':  True,
-        'webcamsavefolder':     'webcam',
-        'webcamprefix':     'cam_',
-        'webcamformat':     'jpg',
-        'webcamresolution': '800, 600',
-
         'pipmainfolder':    '',
         'pippipfolder':     '',
 
         'videosourcefolder':    '',
         'videooutputfolder':    '',
 
+        'pipelineresize':       True,
+        'pipelinerotate':       False,
+        'pipelinepip':          False,
+        'pipelineannotate':     False,
+        'pipelinekeepsteps':    False,
+        'pipelineeditlist':     False,
+
         'lastupdate': time.strftime('%Y-%m-%d')
         }
 
+        # screenshot, webcam and capture options are shared with headless capture
+        self.options.update(CAPTUREOPTIONS)
+        self.options.update(BATCHOPTIONS)
+
         # load config
         self.parseConfig()
 
         # webcam
         self.cam = None
 
-        # image countdown
-        self.countdown = 60.0
+        # keeps the newest webcam frame ready, only used while capturing
+        self.webcamgrabber = None
+
+        # background image writer, only used while capturing in async mode
+        self.writer = None
+
+        # in memory frame buffer, only used while capturing faster than once a second
+        self.framebuffer = None
+
+        # frame packs captures are saved into, only used while capturing in container mode
+        self.framestore = None
+
+        # frame index of each save folder, only used while capturing
+        self.captureindex = None
+
+        # the tools queue their work here so it runs in the background,
+        # with the GUI thread only told about progress
+        self.jobqueue = JobQueue(lambda *args: wx.CallAfter(self.jobEvent, *args), self.debug)
+        self.jobsdialog = None
+        self.jobfinishers = {}
+
+        # encoders fed while capturing, one per screen stream
+        self.liveencoders = None
+
+        # one screenshot stream per captured area, each with its own
+        # unchanged screenshot detection and dirty tile tracking
+        self.screenstreams = []
+
+        # capture interval in seconds and the schedule built from it
+        self.interval = 60.0
+        self.scheduler = None
 
         # create timer
         self.timer = Timer(self.timerCallBack)
@@ -422,6 +531,17 @@ class ChronoFrame(chronoFrame):
         # save config before closing
         self.saveConfig()
 
+        # write out any frames still waiting in the queue
+        self.stopWriter()
+        self.stopFrameBuffer()
+        self.stopFrameStore()
+        self.stopWebcamGrabber()
+        self.stopLiveEncoding()
+        self.stopCaptureIndex()
+
+        # stop the running job and drop the rest
+        self.jobqueue.close()
+
         try:
             if hasattr(self, 'TBFrame') and self.TBFrame:
                 self.TBFrame.kill(event)
@@ -432,30 +552,135 @@ class ChronoFrame(chronoFrame):
 
     def startTimer(self):
 
-        # set countdown
-        self.countdown = float(self.frequencytext.GetValue())
+        # set interval
+        self.interval = float(self.frequencytext.GetValue())
 
-        # start timer - if frequency < 1 second, use small increments, otherwise, 1 second will be plenty fast
-        if self.countdown < 1:
-            self.timer.Start( self.countdown * 1000)
-        else:
-            self.timer.Start(1000)
+        # captures are due at absolute times from now on
+        self.scheduler = CaptureScheduler(self.interval, self.options['capturemissedpolicy'])
+        self.scheduler.start()
+        self.armTimer()
+
+    def armTimer(self):
+        # wake up for the next capture, or after a second to update the progress bar
+        wait = min(self.scheduler.timeUntilNext(), 1.0)
+        self.timer.Start(max(1, int(wait * 1000)), True)
 
     def stopTimer(self):
         self.timer.Stop()
 
+        if self.scheduler is not None:
+            stats = self.scheduler.getStats()
+            self.debug('Capture schedule stopped - captured: %d skipped: %d mean lateness: %.3fs max lateness: %.3fs' % (
+                    stats['captured'], stats['skipped'], stats['meanlateness'], stats['maxlateness']), self.VERBOSE)
+            self.scheduler = None
+
+    def startWriter(self):
+        if self.writer is not None or not self.options['captureasync']:
+            return
+
+        try:
+            self.writer = CaptureWriter(self.options['captureworkers'],
+                            self.options['capturequeuedepth'],
+                            self.options['capturebackpressure'], self.debug, self.framestore,
+                            self.getWriteCallback())
+        except Exception, e:
+            self.debug('Falling back to synchronous capture: %s' % repr(e), self.NORMAL)
+            self.writer = None
+            return
+
+        self.writer.start()
+        self.debug('Started capture writer with %d workers' % self.writer.workers, self.VERBOSE)
+
+    def stopWriter(self):
+        if self.writer is None:
+            return
+
+        self.writer.stop()
+        stats = self.writer.getStats()
+        self.debug('Capture writer stopped - queued: %d written: %d dropped: %d downscaled: %d failed: %d' % (
+                stats['queued'], stats['written'], stats['dropped'], stats['downscaled'], stats['failed']), self.VERBOSE)
+        self.writer = None
+
+    def startFrameStore(self):
+        if self.framestore is not None or not self.options['capturecontainer']:
+            return
+
+        self.framestore = FrameStore(self.options['capturesegmentframes'], self.debug, self.getWriteCallback())
+        self.debug('Saving captures into frame packs', self.VERBOSE)
+
+    def stopFrameStore(self):
+        if self.framestore is None:
+            return
+
+        self.framestore.close()
+        self.framestore = None
+
+    def startCaptureIndex(self):
+        if self.captureindex is not None or not self.options['captureindex']:
+            return
+
+        self.captureindex = CaptureIndex(self.debug)
+
+    def stopCaptureIndex(self):
+        if self.captureindex is None:
+            return
+
+        self.captureindex.close()
+        self.captureindex = None
+
+    def getWriteCallback(self):
+        """Where writers report what they saved, if anything is listening"""
+        if self.captureindex is None:
+            return None
+        return self.captureindex.frameWritten
+
+    def startLiveEncoding(self):
+        if self.liveencoders is not None or not self.options['liveencode']:
+            return
+
+        # encoders are started with the first frame of each stream
+        self.liveencoders = {}
+
+    def getLiveEncoder(self, stream):
+        if stream.prefix not in self.liveencoders:
+            encoder = self.options['liveencoder'] or self.mencoderpathtext.GetValue()
+            outputprefix = os.path.join(self.options['screenshotsavefolder'],
+                                '%slive_%s' % (stream.prefix, time.strftime(self.FILETIMEFORMAT)))
+
+            liveencoder = LiveEncoder(encoder, outputprefix, self.videoframeratetext.GetValue(),
+                                self.videocodeccombo.GetStringSelection(), self.options['liveencodesegmentframes'],
+                                self.options['liveencodequeuedepth'], debug=self.debug)
+            liveencoder.start()
+            self.liveencoders[stream.prefix] = liveencoder
+
+        return self.liveencoders[stream.prefix]
+
+    def stopLiveEncoding(self):
+        if self.liveencoders is None:
+            return
+
+        for liveencoder in self.liveencoders.values():
+            liveencoder.stop()
+            stats = liveencoder.getStats()
+            self.debug('Live encoding stopped - encoded: %d dropped: %d crashes: %d segments: %s' % (
+                    stats['encoded'], stats['dropped'], stats['crashes'], ', '.join(stats['segments'])), self.VERBOSE)
+        self.liveencoders = None
+
     def timerCallBack(self):
+        if self.scheduler is None:
+            return
 
-        # decrement timer
-        self.countdown -= 1
+        # capture if a deadline has been reached
+        due = self.scheduler.poll()
+        if due is not None:
+            deadline, lateness = due
+            self.capture()      # take screenshot and webcam capture
+            self.debug('Capture was %.3fs late' % lateness)
 
         # adjust progress bar
-        self.progresspanel.setProgress(1- (self.countdown / float(self.frequencytext.GetValue())))
+        self.progresspanel.setProgress(self.scheduler.getProgress())
 
-        # on countdown
-        if self.countdown <= 0:
-            self.capture()      # take screenshot and webcam capture
-            self.countdown = float(self.frequencytext.GetValue()) # reset timer
+        self.armTimer()
 
     def fileBrowser(self, message, defaultFile=''):
         dlg = wx.FileDialog(self, message, defaultFile=defaultFile,
@@ -499,24 +724,60 @@ class ChronoFrame(chronoFrame):
 
     def capture(self):
 
+        # one capture time shared by every source
+        capturetime = time.time()
+
         # get filename from time
-        filename = time.strftime(self.FILETIMEFORMAT)
+        filename = time.strftime(self.FILETIMEFORMAT, time.localtime(capturetime))
 
         # use microseconds if capture speed is less than 1
-        if self.countdown < 1:
-            filename = str( time.time() )
+        if self.interval < 1:
+            filename = str(capturetime)
 
         self.debug('Capturing - ' + filename)
 
-        # if screenshots
-        if self.screenshotcheck.IsChecked():
-            # take screenshot
-            self.saveScreenshot(filename)
+        usescreenshot = self.screenshotcheck.IsChecked()
+        usewebcam = self.webcamcheck.IsChecked()
+
+        files = []
+        folders = []
 
-        # if webcam
-        if self.webcamcheck.IsChecked():
-            # take webcam shot
-            self.saveWebcam(filename)
+        # grab and save the webcam frame on another thread while the screen
+        # is captured here - wx can only read the screen from this thread.
+        # VideoCapture on windows stays on the thread that opened it.
+        if usescreenshot and usewebcam and not ONWINDOWS:
+            screenfiles, webcampath = runParallel([
+                    lambda: self.saveScreenshot(filename, capturetime),
+                    lambda: self.saveWebcam(filename, capturetime)])
+        else:
+            screenfiles = webcampath = None
+            if usescreenshot:
+                screenfiles = self.saveScreenshot(filename, capturetime)
+            if usewebcam:
+                webcampath = self.saveWebcam(filename, capturetime)
+
+        for result in (screenfiles, webcampath):
+            if isinstance(result, Exception):
+                self.debug('Capture failed: %s' % repr(result))
+
+        if usescreenshot and isinstance(screenfiles, list):
+            files.extend(screenfiles)
+            folders.append(self.options['screenshotsavefolder'])
+        if usewebcam and isinstance(webcampath, basestring):
+            files.append(('webcam', webcampath))
+            folders.append(self.options['webcamsavefolder'])
+
+        # link the files of this capture together
+        if len(files) > 0:
+            try:
+                recordFrame(folders, capturetime, files)
+            except Exception, e:
+                self.debug('Failed to record frame: %s' % repr(e))
+
+        # index the new files - held files were indexed when they were captured
+        if self.captureindex is not None:
+            self.captureindex.addCapture(capturetime,
+                    [(source, path) for source, path in files if filename in os.path.basename(path)])
 
         return filename
 
@@ -852,30 +1113,185 @@ class ChronoFrame(chronoFrame):
                     self.debug('initCam -- failed to initialize camera')
         return False
 
-    def saveScreenshot(self, filename):
-        timestamp = self.options['screenshottimestamp']
-        folder = self.options['screenshotsavefolder']
+    def grabWebcamFrame(self):
+        """Reads the next frame from the camera. OpenCV reuses the returned
+        image for the next frame, so hand out a copy"""
+        im = cv.QueryFrame(self.cam)
+        if not im:
+            return None
+        return cv.CloneImage(im)
+
+    def startWebcamGrabber(self):
+        # VideoCapture on windows always hands out the current frame
+        if ONWINDOWS or self.cam is None or self.webcamgrabber is not None:
+            return
+        if not self.options['webcambackgroundgrab']:
+            return
+
+        self.webcamgrabber = WebcamGrabber(self.grabWebcamFrame, debug=self.debug)
+        self.webcamgrabber.start()
+        self.debug('Started webcam grabber', self.VERBOSE)
+
+    def stopWebcamGrabber(self):
+        if self.webcamgrabber is None:
+            return
+
+        self.webcamgrabber.stop()
+        stats = self.webcamgrabber.getStats()
+        self.debug('Webcam grabber stopped - grabbed: %d dropped: %d failed: %d mean age: %.3fs max age: %.3fs' % (
+                stats['grabbed'], stats['dropped'], stats['failed'], stats['meanage'], stats['maxage']), self.VERBOSE)
+        self.webcamgrabber = None
+
+    def getDisplayGeometries(self):
+        """Returns (x, y, width, height) of every attached display, primary first.
+        Mirrored displays are only listed once."""
+        geometries = []
+        try:
+            for index in xrange(wx.Display_GetCount()):
+                geometry = tuple(wx.Display(index).GetGeometry())
+                if geometry not in geometries:
+                    geometries.append(geometry)
+        except Exception, e:
+            self.debug("Exception while enumerating displays: %s"%repr(e))
+
+        if len(geometries) == 0:
+            geometries.append(tuple(wx.Display().GetGeometry()))
+        return geometries
+
+    def getScreenStreams(self, usegates=False):
+        """Works out which screen areas to capture and returns a CaptureStream for each"""
         prefix = self.options['screenshotprefix']
-        format = self.options['screenshotformat']
 
-        rect = None
-        if self.options['screenshotsubsection']:
-            if (self.options['screenshotsubsectiontop'] > 0 and
+        if self.options['screenshotsubsection'] and (
+                self.options['screenshotsubsectiontop'] > 0 and
                 self.options['screenshotsubsectionleft'] > 0 and
                 self.options['screenshotsubsectionwidth'] > 0 and
                 self.options['screenshotsubsectionheight'] > 0):
-                rect = wx.Rect(
+            streams = [CaptureStream(prefix, (
                         int(self.options['screenshotsubsectionleft']),
                         int(self.options['screenshotsubsectiontop']),
                         int(self.options['screenshotsubsectionwidth']),
                         int(self.options['screenshotsubsectionheight'])
-                    )
+                    ))]
+
+        elif not self.options['screenshotdualmonitor']:
+            streams = [CaptureStream(prefix)]
+
+        else:
+            geometries = self.getDisplayGeometries()
+
+            if len(geometries) == 1:
+                streams = [CaptureStream(prefix, geometries[0])]
+
+            # one stream per display - no dead space between displays
+            elif self.options['screenshotseparatedisplays']:
+                streams = [CaptureStream(getDisplayPrefix(prefix, index), geometry, getDisplaySource(index))
+                            for index, geometry in enumerate(geometries)]
+                try:
+                    recordDisplays(self.options['screenshotsavefolder'], geometries)
+                except Exception, e:
+                    self.debug('Failed to record display layout: %s' % repr(e))
+
+            # everything in one image covering all displays
+            else:
+                streams = [CaptureStream(prefix, getBoundingRect(geometries))]
+
+        if usegates:
+            for stream in streams:
+                # skip screenshots that match the last one saved
+                if self.options['screenshotskipunchanged']:
+                    stream.changegate = ChangeGate(self.options['screenshotchangethreshold'])
+
+                # track which tiles of the screen change
+                if self.options['screenshottiles']:
+                    try:
+                        stream.tilehasher = TileHasher(self.options['screenshottilesize'])
+                    except Exception, e:
+                        self.debug('Tile hashing unavailable: %s' % repr(e), self.NORMAL)
+
+        return streams
 
-        img = self.takeScreenshot(rect, timestamp)
-        self.saveImage(img, filename, folder, prefix, format)
+    def saveScreenshot(self, filename, capturetime=None):
+        """Captures and saves every screen stream. Returns a list of (source, path)
+        with the file standing in for each stream in this capture"""
+        timestamp = self.options['screenshottimestamp']
+        folder = self.options['screenshotsavefolder']
+        format = self.options['screenshotformat']
+        if format not in ('gif', 'png'):
+            format = 'jpg'
+
+        streams = self.screenstreams or self.getScreenStreams()
 
-    def takeScreenshot(self, rect = None, timestamp=False):
-        """ Takes a screenshot of the screen at give pos & size (rect).
+        # grab every area first so they all show the same moment
+        captured = []
+        files = []
+        for stream in streams:
+            rect = None
+            if stream.geometry is not None:
+                rect = wx.Rect(*stream.geometry)
+
+            frame = self.takeScreenshot(rect, timestamp, stream, capturetime)
+
+            # nothing changed - let the last saved screenshot stand in for this one
+            if frame is None:
+                self.debug('Screenshot %s unchanged (%.4f changed) - skipping' % (
+                        stream.prefix, stream.changegate.lastdifference))
+                try:
+                    recordSkippedFrame(folder, stream.prefix + filename, stream.lastfile)
+                except Exception, e:
+                    self.debug('Failed to record skipped screenshot: %s' % repr(e))
+                if stream.lastfile is not None:
+                    files.append((stream.source, os.path.join(folder, stream.lastfile)))
+
+                # keep the video in time with the captures
+                if self.liveencoders is not None:
+                    self.getLiveEncoder(stream).repeat()
+                continue
+
+            if self.liveencoders is not None and not self.getLiveEncoder(stream).push(frame):
+                self.debug('Live encoder behind - dropped frame', self.VERBOSE)
+
+            captured.append((stream, frame))
+
+        # encode the displays in parallel unless something else already does
+        if len(captured) > 1 and self.writer is None and self.framebuffer is None:
+            jobs = [(frame.getImage(), os.path.join(folder, "%s%s.%s" % (stream.prefix, filename, format)), format)
+                    for stream, frame in captured]
+            failed = set()
+            for path, e in writeImages(jobs, self.framestore, self.getWriteCallback()):
+                self.debug('Failed to save %s: %s' % (path, repr(e)))
+                failed.add(path)
+            saved = [os.path.join(folder, "%s%s.%s" % (stream.prefix, filename, format)) not in failed
+                        for stream, frame in captured]
+        else:
+            saved = [self.saveImage(frame, filename, folder, stream.prefix, format) for stream, frame in captured]
+
+        # only files that were kept go in the records
+        for (stream, frame), kept in zip(captured, saved):
+            if kept:
+                stream.lastfile = "%s%s.%s" % (stream.prefix, filename, format)
+                files.append((stream.source, os.path.join(folder, stream.lastfile)))
+
+        return files
+
+    def getFrame(self, bmp, rect=None):
+        """Copies a bitmap (or part of it) into a Frame with a single copy"""
+        if rect is not None:
+            bmp = bmp.GetSubBitmap(rect)
+
+        # older wx can only hand out RGB data
+        if not hasattr(bmp, 'CopyToBuffer'):
+            img = bmp.ConvertToImage()
+            pilimage = Image.frombuffer('RGB', (img.GetWidth(), img.GetHeight()), img.GetData(), 'raw', 'RGB', 0, 1)
+            return Frame.fromImage(pilimage)
+
+        frame = Frame((bmp.GetWidth(), bmp.GetHeight()))
+        bmp.CopyToBuffer(frame.data, wx.BitmapBufferFormat_RGBA)
+        return frame
+
+    def takeScreenshot(self, rect = None, timestamp=False, stream=None, capturetime=None):
+        """ Takes a screenshot of the screen at give pos & size (rect) and returns it as a Frame.
+        If the stream has a changegate and the screen has not changed, returns None.
         Code from Andrea - http://lists.wxwidgets.org/pipermail/wxpython-users/2007-October/069666.html"""
 
         # use whole screen if none specified
@@ -886,21 +1302,6 @@ class ChronoFrame(chronoFrame):
             x, y, width, height = wx.Display().GetGeometry()
             rect = wx.Rect(x,y,width,height)
 
-            try:
-                # use two monitors if checked and available
-                if self.options['screenshotdualmonitor'] and wx.Display_GetCount() > 0:
-                    second = wx.Display(1)
-                    x2, y2, width2, height2 = second.GetGeometry()
-
-                    x3 = min(x,x2)
-                    y3 = min(y, y2)
-                    width3 = max(x+width, x2+width2) - x3
-                    height3 = max(height-y3, height2-y3)
-
-                    rect = wx.Rect(x3, y3, width3, height3)
-            except Exception, e:
-                self.debug("Exception while attempting to capture second monitor: %s"%repr(e))
-
         #Create a DC for the whole screen area
         dcScreen = wx.ScreenDC()
 
@@ -927,48 +1328,109 @@ class ChronoFrame(chronoFrame):
             rect.y          #What's the Y offset in the original DC?
             )
 
+        #Select the Bitmap out of the memory DC by selecting a new
+        #uninitialized Bitmap
+        memDC.SelectObject(wx.NullBitmap)
+
+        # copy the pixels out once - everything after this works on the frame
+        frame = self.getFrame(bmp)
+
+        # find the tiles that changed since the last screenshot
+        if stream is not None and stream.tilehasher is not None:
+            stream.lastdirtymask = stream.tilehasher.update(frame.data, frame.size, 4)
+            self.debug('%d of %d screen tiles changed' % (stream.lastdirtymask.sum(), stream.lastdirtymask.size))
+
+        # compare with the last saved screenshot before the timestamp makes every frame different
+        if stream is not None and stream.changegate is not None and not stream.changegate.check(frame.getImage()):
+            return None
+
         # write timestamp on image
         if timestamp:
-            stamp = time.strftime(self.TIMESTAMPFORMAT)
-            if self.countdown < 1:
-                now = time.time()
-                micro = str(now - math.floor(now))[0:4]
-                stamp = stamp + micro
+            if capturetime is None:
+                capturetime = time.time()
+            stamp = formatStamp(capturetime, self.interval < 1)
 
+            memDC.SelectObject(bmp)
             memDC.DrawText(stamp, 20, rect.height-30)
+            stampwidth, stampheight = memDC.GetTextExtent(stamp)
+            memDC.SelectObject(wx.NullBitmap)
 
-        #Select the Bitmap out of the memory DC by selecting a new
-        #uninitialized Bitmap
-        memDC.SelectObject(wx.NullBitmap)
+            # only copy the stamped area into the frame
+            stamprect = wx.Rect(20, rect.height-30, stampwidth, stampheight).Intersect(wx.Rect(0, 0, rect.width, rect.height))
+            if not stamprect.IsEmpty():
+                stampframe = self.getFrame(bmp, stamprect)
+                frame.paste(stampframe.getImage(), (stamprect.x, stamprect.y))
 
-        return bmp
+        return frame
 
-    def saveImage(self, bmp, filename, folder, prefix, format='jpg'):
-        # convert
-        img = bmp.ConvertToImage()
+    def startFrameBuffer(self):
+        if self.framebuffer is not None or not self.options['highfrequencybuffer']:
+            return
 
-        # save
-        if format == 'gif':
-            fileName = os.path.join(folder,"%s%s.gif" % (prefix, filename))
-            img.SaveFile(fileName, wx.BITMAP_TYPE_GIF)
+        # only worth it when capturing faster than once a second
+        try:
+            if not 0 < float(self.frequencytext.GetValue()) < 1:
+                return
+        except ValueError:
+            return
 
-        elif format == 'png':
-            fileName = os.path.join(folder,"%s%s.png" % (prefix, filename))
-            img.SaveFile(fileName, wx.BITMAP_TYPE_PNG)
+        # the slots have to fit the largest screen stream - displays can differ
+        geometries = [stream.geometry or tuple(wx.Display().GetGeometry()) for stream in self.screenstreams]
+        framesize = max([width * height for x, y, width, height in geometries] or [0]) * len(Frame.MODE)
 
-        else:
-            fileName = os.path.join(folder,"%s%s.jpg" % (prefix, filename))
-            img.SaveFile(fileName, wx.BITMAP_TYPE_JPEG)
+        self.framebuffer = FrameRingBuffer(self.options['highfrequencybudget'] * 1024 * 1024,
+                            self.options['highfrequencybatch'], self.options['highfrequencycontainer'],
+                            debug=self.debug, store=self.framestore, onwrite=self.getWriteCallback(),
+                            framesize=framesize)
+        self.framebuffer.start()
+        self.debug('Started high frequency frame buffer', self.VERBOSE)
+
+    def stopFrameBuffer(self):
+        if self.framebuffer is None:
+            return
+
+        self.framebuffer.stop()
+        stats = self.framebuffer.getStats()
+        self.debug('Frame buffer stopped - buffered: %d written: %d overruns: %d batches: %d failed: %d' % (
+                stats['pushed'], stats['written'], stats['overruns'], stats['batches'], stats['failed']), self.VERBOSE)
+        self.framebuffer = None
+
+    def saveImage(self, frame, filename, folder, prefix, format='jpg'):
+        """Saves frame, or hands it to whatever saves it. Returns False if it was dropped"""
+        if format not in ('gif', 'png'):
+            format = 'jpg'
+        fileName = os.path.join(folder,"%s%s.%s" % (prefix, filename, format))
+
+        # keep the raw frame in memory and let the buffer write it out in batches
+        if self.framebuffer is not None:
+            try:
+                if not self.framebuffer.push(frame.data, frame.size, fileName, format, frame.timestamp, Frame.MODE):
+                    self.debug('Frame buffer overrun - dropped %s' % fileName, self.VERBOSE)
+                    return False
+                return True
+            except ValueError, e:
+                self.debug('Disabling frame buffer: %s' % str(e), self.NORMAL)
+                self.stopFrameBuffer()
+
+        # hand the frame to the writer pool and get back to the event loop
+        if self.writer is not None:
+            self.writer.submit(frame, frame.size, fileName, format)
+            return True
 
-    def saveWebcam(self, filename):
+        # save
+        storeImage(frame.getImage(), fileName, format, self.framestore, self.getWriteCallback())
+        return True
+
+    def saveWebcam(self, filename, capturetime=None):
+        """Captures and saves a webcam frame. Returns the saved path or None"""
         timestamp = self.options['webcamtimestamp']
         folder = self.options['webcamsavefolder']
         prefix = self.options['webcamprefix']
         format = self.options['webcamformat']
 
-        self.takeWebcam(filename, folder, prefix, format, timestamp)
+        return self.takeWebcam(filename, folder, prefix, format, timestamp, capturetime) or None
 
-    def takeWebcam(self, filename, folder, prefix, format='jpg', usetimestamp=False):
+    def takeWebcam(self, filename, folder, prefix, format='jpg', usetimestamp=False, capturetime=None):
 
         if self.cam is None:
             self.debug('takeWebcam called with no camera')
@@ -980,11 +1442,33 @@ class ChronoFrame(chronoFrame):
         filepath = os.path.join(folder,"%s%s.%s" % (prefix, filename, format))
 
         if ONWINDOWS:
-            if usetimestamp:
-                self.cam.saveSnapshot(filepath, quality=80, timestamp=1)
+            if self.writer is not None:
+                self.writer.submit(self.cam.getImage(timestamp=int(usetimestamp)), None, filepath, format)
+            elif self.framestore is not None:
+                storeImage(self.cam.getImage(timestamp=int(usetimestamp)), filepath, format,
+                            self.framestore, self.getWriteCallback())
             else:
-                self.cam.saveSnapshot(filepath, quality=80, timestamp=0)
+                if usetimestamp:
+                    self.cam.saveSnapshot(filepath, quality=80, timestamp=1)
+                else:
+                    self.cam.saveSnapshot(filepath, quality=80, timestamp=0)
 
+                if self.captureindex is not None:
+                    self.captureindex.frameWritten(filepath, Image.open(filepath).size,
+                                os.path.getsize(filepath), format)
+
+
+        elif self.webcamgrabber is not None:
+            # the grabber keeps draining the camera, so its frame is current
+            im, age = self.webcamgrabber.capture()
+            if im is None:
+                self.debug('Error - could not get frame from camera')
+                return False
+            self.debug('Webcam frame is %.3fs old' % age)
+
+            # the same frame is handed out until a new one arrives
+            if usetimestamp:
+                im = cv.CloneImage(im)
 
         else:
             # JohnColburn says you need to grab a bunch of frames to underflow
@@ -1001,16 +1485,17 @@ class ChronoFrame(chronoFrame):
                 self.debug('Error - could not get frame from camera')
                 return False
 
+        if not ONWINDOWS:
+
             #cv.Flip(im, None, 1)
 
             # write timestamp as necessary
             if usetimestamp:
 
                 # build timestamp
-                stamp = time.strftime(self.TIMESTAMPFORMAT)
-                now = time.time()
-                micro = str(now - math.floor(now))[0:4]
-                stamp = stamp + micro
+                if capturetime is None:
+                    capturetime = time.time()
+                stamp = formatStamp(capturetime, True)
 
                 # TODO: try to write timestamp out with PIL or something else
                 # this *might* be the cause of weird ubuntu errors
@@ -1019,7 +1504,14 @@ class ChronoFrame(chronoFrame):
                 cv.PutText(im,stamp,mark,font,cv.RGB(0,0,0))
 
             self.debug('Saving image to %s' % filepath)
-            cv.SaveImage(filepath, im)
+            if self.framestore is not None:
+                self.framestore.append(filepath, cv.GetSize(im), format,
+                        cv.EncodeImage('.' + format, im).tostring())
+            else:
+                cv.SaveImage(filepath, im)
+
+                if self.captureindex is not None:
+                    self.captureindex.frameWritten(filepath, cv.GetSize(im), os.path.getsize(filepath), format)
 
         return filepath
 
@@ -1133,6 +1625,18 @@ class ChronoFrame(chronoFrame):
             if self.webcamcheck.IsChecked():
                 # initialize webcam
                 self.initCam()
+                self.startWebcamGrabber()
+
+            # encode and write in the background if enabled
+            self.startCaptureIndex()
+            self.startFrameStore()
+            self.startWriter()
+            self.startLiveEncoding()
+
+            # work out the screen areas once for the whole session
+            if self.screenshotcheck.IsChecked():
+                self.screenstreams = self.getScreenStreams(True)
+            self.startFrameBuffer()
 
             # start timer
             if float(self.frequencytext.GetValue()) > 0:
@@ -1156,11 +1660,25 @@ class ChronoFrame(chronoFrame):
             # stop timer
             self.stopTimer()
 
+            # finish writing queued frames
+            self.stopWriter()
+            self.stopFrameBuffer()
+            self.stopFrameStore()
+            self.stopWebcamGrabber()
+            self.stopLiveEncoding()
+            self.stopCaptureIndex()
+
+            self.screenstreams = []
+
     def forceCapturePressed(self, event): # wxGlade: chronoFrame.<event_handler>
 
         # save a capture right now
         filename = self.capture()
 
+        # make sure the files exist before copying them
+        if self.writer is not None:
+            self.writer.join()
+
         # strip extension
         index = filename.rfind('.') # skip error checking - should never be user-input data
         name = filename[:index]
@@ -1293,6 +1811,66 @@ class ChronoFrame(chronoFrame):
             return False
 
         # check size
+        size = self.getResizeSize()
+        if size is None:
+            return False
+        width, height = size
+
+        # check for images -- notes and sidecar files are left out
+        images = [frame for frame in getFrames(self.resizesourcetext.GetValue()) if frame.isImage()]
+        if len(images) == 0:
+            self.showWarning('No images found',
+            'No images found in source directory')
+            return False
+
+        # resize on every core
+        job = BatchJob('resize', images, self.resizeoutputtext.GetValue(),
+                        [(width, height), self.options['batchdraftdecode']],
+                        self.options['batchworkers'], self.options['batchchunkframes'], self.debug,
+                        incremental=self.options['batchincremental'])
+        self.queueBatchJob(job, 'Resize %s to %dx%d' % (self.resizesourcetext.GetValue(), width, height),
+                        'Resizing Complete')
+
+
+    def rotatePressed(self, event): # wxGlade: chronoFrame.<event_handler>
+
+        # check source dir
+        if not os.path.isdir(self.resizesourcetext.GetValue()):
+            self.showWarning('Invalid Path', 'The source path is invalid')
+            return False
+
+        # check output dir
+        if not os.path.isdir(self.resizeoutputtext.GetValue()):
+            self.showWarning('Invalid Path', 'The output path is invalid')
+            return False
+
+        # check write permission
+        if not os.access(self.resizeoutputtext.GetValue(), os.W_OK):
+            self.showWarning('No write permission',
+            'Error: Cannot write to %s. Please set write permissions and try again' % self.resizeoutputtext.GetValue())
+            return False
+
+        rot = self.getRotation()
+        if rot is None:
+            return False
+
+        # check for images -- notes and sidecar files are left out
+        images = [frame for frame in getFrames(self.resizesourcetext.GetValue()) if frame.isImage()]
+        if len(images) == 0:
+            self.showWarning('No images found',
+            'No images found in source directory')
+            return False
+
+        # rotate on every core
+        job = BatchJob('rotate', images, self.resizeoutputtext.GetValue(),
+                        [rot, self.options['rotatemode'], findJpegtran(self.options['jpegtranpath'])],
+                        self.options['batchworkers'], self.options['batchchunkframes'], self.debug,
+                        incremental=self.options['batchincremental'])
+        self.queueBatchJob(job, 'Rotate %s by %d degrees' % (self.resizesourcetext.GetValue(), rot),
+                        'Rotating Complete')
+
+    def getResizeSize(self):
+        """Width and height from the Adjust tab, or None if they are invalid"""
         try:
             width = int(self.resizewidthtext.GetValue())
 
@@ -1301,7 +1879,7 @@ class ChronoFrame(chronoFrame):
         except:
             self.showWarning('Invalid Width',
             'Error: Width is invalid. Must be a positive integer')
-            return False
+            return None
 
         try:
             height = int(self.resizeheighttext.GetValue())
@@ -1311,115 +1889,304 @@ class ChronoFrame(chronoFrame):
         except:
             self.showWarning('Invalid Height',
             'Error: Height is invalid. Must be a positive integer')
+            return None
+
+        return width, height
+
+    def getRotation(self):
+        """Rotation from the Adjust tab, or None if it is invalid"""
+        try:
+            rot = int(self.rotatecombo.GetValue())
+
+            if rot < 0 or rot > 360:
+                raise Exception()
+            self.debug('Setting rotation: %d' % rot)
+        except:
+            self.showWarning('Invalid Rotation',
+            'Error: Rotation is invalid. Must be a positive integer less than 360')
+            return None
+
+        return rot
+
+    def pipelinePressed(self, event): # wxGlade: chronoFrame.<event_handler>
+        dlg = pipelineDialog(self)
+        dlg.pipelineresizecheck.SetValue(self.options['pipelineresize'])
+        dlg.pipelinerotatecheck.SetValue(self.options['pipelinerotate'])
+        dlg.pipelinepipcheck.SetValue(self.options['pipelinepip'])
+        dlg.pipelineannotatecheck.SetValue(self.options['pipelineannotate'])
+        dlg.pipelinekeepcheck.SetValue(self.options['pipelinekeepsteps'])
+        dlg.pipelineeditlistcheck.SetValue(self.options['pipelineeditlist'])
+
+        result = dlg.ShowModal()
+        if result == wx.ID_OK:
+            self.options['pipelineresize'] = dlg.pipelineresizecheck.IsChecked()
+            self.options['pipelinerotate'] = dlg.pipelinerotatecheck.IsChecked()
+            self.options['pipelinepip'] = dlg.pipelinepipcheck.IsChecked()
+            self.options['pipelineannotate'] = dlg.pipelineannotatecheck.IsChecked()
+            self.options['pipelinekeepsteps'] = dlg.pipelinekeepcheck.IsChecked()
+            self.options['pipelineeditlist'] = dlg.pipelineeditlistcheck.IsChecked()
+            self.saveConfig()
+        dlg.Destroy()
+
+        if result == wx.ID_OK and self.options['pipelineeditlist']:
+            self.saveEditList()
+        elif result == wx.ID_OK:
+            self.runPipeline()
+
+    def runPipeline(self):
+        """Runs the steps picked in the Combine Steps dialog in one pass. The
+        finished images go in the output folder of the last step's tab."""
+        sourcefolder = self.resizesourcetext.GetValue()
+        if not os.path.isdir(sourcefolder):
+            self.showWarning('Invalid Path', 'The source path is invalid')
             return False
 
-        # check for images
-        images = os.listdir(self.resizesourcetext.GetValue())
-        if len(images) == 0:
-            self.showWarning('No files found',
-            'No files found in source directory')
+        frames = [frame for frame in getFrames(sourcefolder) if frame.isImage()]
+        if len(frames) == 0:
+            self.showWarning('No files found', 'No files found in source directory')
             return False
 
-        # show progress dialog
-        progressdialog = wx.ProgressDialog('Resize Progress', 'Processing Images',
-                        maximum=len(images), parent=self, style= wx.PD_CAN_ABORT | wx.PD_APP_MODAL | wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
+        keepsteps = self.options['pipelinekeepsteps']
+        stages = []
 
-        # for all images in main folder
-        count = 0
-        for f in images:
+        if self.options['pipelineresize']:
+            size = self.getResizeSize()
+            if size is None:
+                return False
+            stages.append(['resize', self.resizeoutputtext.GetValue(), (size,)])
 
-            # update progress dialog
-            count += 1
-            cancel, somethingelse = progressdialog.Update(count, 'Processing %s'%f)
-            # update progress dialog
-            if not cancel:
-                progressdialog.Destroy()
-                break
+        if self.options['pipelinerotate']:
+            rot = self.getRotation()
+            if rot is None:
+                return False
+            stages.append(['rotate', self.resizeoutputtext.GetValue(), (rot,)])
 
-            try:
-                # open with PIL -- will skip non-images
-                source = Image.open(os.path.join(self.resizesourcetext.GetValue(), f))
+        extras = [{} for frame in frames]
 
-                # resize image
-                source.thumbnail((width, height))
+        if self.options['pipelinepip']:
+            pipfolder = self.pippipimagefoldertext.GetValue()
+            if not os.path.isdir(pipfolder):
+                self.showWarning('Invalid Path', 'The PIP folder on the PIP tab is invalid')
+                return False
 
-                # save image
-                source.save(os.path.join(self.resizeoutputtext.GetValue(), f))
+            # matched up by capture time like the PIP tab
+            pipframes = [frame for frame in getFrames(pipfolder) if frame.isImage()]
+            pairs = self.pairPipFrames(frames, pipframes)
+            frames = [frame for frame, pipframe in pairs]
+            extras = [{'pip': pipframe} for frame, pipframe in pairs]
 
-            except Exception, e:
-                pass
-                #self.debug(str(e))
+            stages.append(['pip', self.pipoutputimagefoldertext.GetValue(),
+                        (self.pipsizecombo.GetStringSelection(), self.pippositioncombo.GetStringSelection())])
 
-        progressdialog.Update( len(images), 'Resizing Complete')
+        if self.options['pipelineannotate']:
+            timed = sorted(frames, key=lambda frame: frame.getTime())
+            plan = self.getAnnotationPlan(sourcefolder, timed)
+            if plan is None:
+                return False
 
+            entries = dict((frame.name, entry) for frame, entry in zip(timed, plan))
+            for extra, frame in zip(extras, frames):
+                extra['annotate'] = entries[frame.name]
 
-    def rotatePressed(self, event): # wxGlade: chronoFrame.<event_handler>
+            stages.append(list(self.getAnnotationStage(plan, self.annotateoutputfoldertext.GetValue())))
 
-        # check source dir
-        if not os.path.isdir(self.resizesourcetext.GetValue()):
-            self.showWarning('Invalid Path', 'The source path is invalid')
+        if len(stages) == 0:
+            self.showWarning('No Steps Selected', 'Select at least one step to run')
             return False
 
-        # check output dir
-        if not os.path.isdir(self.resizeoutputtext.GetValue()):
-            self.showWarning('Invalid Path', 'The output path is invalid')
-            return False
+        # the last step's folder gets the finished images, the others only
+        # if each step is kept - resize and rotate share the Adjust folder
+        outfolder = stages[-1][1]
+        for index, stage in enumerate(stages):
+            if not keepsteps or index == len(stages) - 1 or stage[1] == stages[index + 1][1]:
+                stage[1] = None
 
-        # check write permission
-        if not os.access(self.resizeoutputtext.GetValue(), os.W_OK):
-            self.showWarning('No write permission',
-            'Error: Cannot write to %s. Please set write permissions and try again' % self.resizeoutputtext.GetValue())
-            return False
+        for folder in [outfolder] + [stage[1] for stage in stages if stage[1] is not None]:
+            if not os.path.isdir(folder) or not os.access(folder, os.W_OK):
+                self.showWarning('Permission Denied', 'The output folder %s is not writable. Please change the permissions and try again.' % folder)
+                return False
 
-        try:
-            rot = int(self.rotatecombo.GetValue())
+        # keep the annotation with the images, like the PIP tab does
+        if os.path.isfile(os.path.join(sourcefolder, self.ANNOTATIONFILE)) and sourcefolder != outfolder:
+            shutil.copy(os.path.join(sourcefolder, self.ANNOTATIONFILE), os.path.join(outfolder, self.ANNOTATIONFILE))
 
-            if rot < 0 or rot > 360:
-                raise Exception()
-            self.debug('Setting rotation: %d' % rot)
-        except:
-            self.showWarning('Invalid Rotation',
-            'Error: Rotation is invalid. Must be a positive integer less than 360')
+        job = BatchJob('pipeline', frames, outfolder, [[tuple(stage) for stage in stages], self.options['batchdraftdecode'],
+                        self.options['batchlinkmode']],
+                        self.options['batchworkers'], self.options['batchchunkframes'], self.debug, extras,
+                        self.options['batchincremental'])
+        self.queueBatchJob(job, '%s %s' % (', '.join(stage[0].capitalize() for stage in stages), sourcefolder),
+                        'Processing Complete')
+
+    def saveEditList(self):
+        """Saves the steps picked in the Combine Steps dialog as the edit list
+        of the Adjust source folder, so they are done while it is encoded
+        instead. The frame range, crop and holds are only ever set by hand,
+        so any the folder's edit list already has are kept."""
+        sourcefolder = self.resizesourcetext.GetValue()
+        if not os.path.isdir(sourcefolder):
+            self.showWarning('Invalid Path', 'The source path is invalid')
             return False
 
-        # check for images
-        images = os.listdir(self.resizesourcetext.GetValue())
-        if len(images) == 0:
-            self.showWarning('No files found',
-            'No files found in source directory')
+        if not os.access(sourcefolder, os.W_OK):
+            self.showWarning('Permission Denied', 'The source folder %s is not writable. Please change the permissions and try again.' % sourcefolder)
             return False
 
-        # show progress dialog
-        progressdialog = wx.ProgressDialog('Resize Progress', 'Processing Images',
-                        maximum=len(images), parent=self, style= wx.PD_CAN_ABORT | wx.PD_APP_MODAL | wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
+        previous = readEditList(sourcefolder) or {}
+        settings = dict((key, previous[key]) for key in ('first', 'last', 'crop', 'holds') if key in previous)
 
-        # for all images in main folder
-        count = 0
-        for f in images:
+        if self.options['pipelineresize']:
+            settings['size'] = self.getResizeSize()
+            if settings['size'] is None:
+                return False
 
-            # update progress dialog
-            count += 1
-            cancel, somethingelse = progressdialog.Update(count, 'Processing %s'%f)
-            # update progress dialog
-            if not cancel:
-                progressdialog.Destroy()
-                break
+        if self.options['pipelinerotate']:
+            settings['rotate'] = self.getRotation()
+            if settings['rotate'] is None:
+                return False
 
-            try:
-                # open with PIL -- will skip non-images
-                source = Image.open(os.path.join(self.resizesourcetext.GetValue(), f))
+        if self.options['pipelinepip']:
+            pipfolder = self.pippipimagefoldertext.GetValue()
+            if not os.path.isdir(pipfolder):
+                self.showWarning('Invalid Path', 'The PIP folder on the PIP tab is invalid')
+                return False
 
-                # rotate image
-                if rot > 0:
-                    rotated = source.rotate(rot, expand=True)
+            settings.update({
+                'pipfolder':            pipfolder,
+                'pipsize':              self.pipsizecombo.GetStringSelection(),
+                'pipposition':          self.pippositioncombo.GetStringSelection(),
+                'piptolerance':         self.options['piptolerance'],
+                'pipignoreunmatched':   self.pipignoreunmatchedcheck.GetValue(),
+            })
 
-                # save image
-                rotated.save(os.path.join(self.resizeoutputtext.GetValue(), f))
+        if self.options['pipelineannotate']:
+            if not os.path.exists(os.path.join(sourcefolder, self.ANNOTATIONFILE)):
+                self.showWarning('Annotation file not found', 'Annotation file not found in folder.')
+                return False
 
-            except Exception, e:
-                pass
+            frames = sorted([frame for frame in getFrames(sourcefolder) if frame.isImage()], key=lambda frame: frame.getTime())
+            timing = self.getAnnotationTiming(sourcefolder, frames)
+            if timing is None:
+                return False
+
+            colour = self.options['fontdata'].GetColour()
+            settings.update({
+                'annotationfolder':     sourcefolder,
+                'annotatetimed':        timing[0],
+                'annotateduration':     timing[1],
+                'annotatefadein':       timing[2],
+                'annotatefadeout':      timing[3],
+                'annotateposition':     self.annotatepositioncombo.GetStringSelection(),
+                'annotatecolour':       (colour.Red(), colour.Green(), colour.Blue()),
+                'annotatedropshadow':   self.dropshadowcheck.IsChecked(),
+                'annotatefont':         self.options['font'].GetNativeFontInfoDesc(),
+            })
+
+        writeEditList(sourcefolder, settings)
+        self.debug('Saved edit list for %s: %s' % (sourcefolder, repr(settings)), self.VERBOSE)
+
+        dlg = wx.MessageDialog(self, 'Edit list saved in %s\nEncode this folder on the Video tab to apply it' % sourcefolder,
+                        'Edit List Saved', wx.OK | wx.ICON_INFORMATION)
+        dlg.ShowModal()
+        dlg.Destroy()
 
-        progressdialog.Update( len(images), 'Rotating Complete')
+    def getEditList(self, folder):
+        """The edit list of folder, drawing its annotation with its wx font,
+        or None if it has none"""
+        settings = readEditList(folder)
+        if settings is None:
+            return None
+
+        font = self.options['font']
+        if settings['annotatefont'] != '':
+            savedfont = wx.FontFromNativeInfoString(settings['annotatefont'])
+            if savedfont.IsOk():
+                font = savedfont
+
+        return EditList(folder, settings, lambda text: makeTextMask(self.renderTextMask(text, font)))
+
+    def renderTextMask(self, text, font):
+        """Annotation text drawn white on black with a wx font, as a PIL image"""
+        memDC = wx.MemoryDC()
+        memDC.SelectObject(wx.EmptyBitmap(1, 1))
+        width, height, somethingelse = memDC.GetMultiLineTextExtent(text, font)
+
+        bmp = wx.EmptyBitmap(max(width, 1), max(height, 1))
+        memDC.SelectObject(bmp)
+        memDC.SetBackground(wx.BLACK_BRUSH)
+        memDC.Clear()
+        memDC.SetFont(font)
+        memDC.SetTextForeground(wx.WHITE)
+        memDC.DrawText(text, 0, 0)
+        memDC.SelectObject(wx.NullBitmap)
+
+        img = bmp.ConvertToImage()
+        return Image.frombuffer('RGB', (img.GetWidth(), img.GetHeight()), img.GetData(), 'raw', 'RGB', 0, 1).convert('L')
+
+    def jobsMenuClicked(self, event): # wxGlade: chronoFrame.<event_handler>
+        self.showJobs()
+
+    def showJobs(self):
+        if self.jobsdialog is None:
+            self.jobsdialog = JobsDialog(self)
+        self.jobsdialog.refresh()
+        self.jobsdialog.Show()
+        self.jobsdialog.Raise()
+
+    def showJobMessage(self, message):
+        self.debug(message, self.VERBOSE)
+        if self.jobsdialog is not None:
+            self.jobsdialog.showMessage(message)
+
+    def queueJob(self, job, title, finished=None):
+        """Runs job in the background once the jobs queued before it are done.
+        finished(job, ok) is called on the GUI thread afterwards."""
+        if finished is not None:
+            self.jobfinishers[job] = finished
+        self.jobqueue.add(job, title)
+        self.showJobs()
+
+    def jobEvent(self, event, job, *args):
+        """Hears about queued jobs, see JobQueue - always on the GUI thread"""
+        # the window may be gone by the time a job finishes
+        if not self:
+            return
+
+        if event == 'progress':
+            if self.jobsdialog is not None:
+                self.jobsdialog.showProgress(*args)
+            return
+
+        if event == 'finished':
+            ok, error = args
+            if error is not None:
+                self.showWarning('Job Failed', '%s failed: %s' % (job.title, error))
+
+            finished = self.jobfinishers.pop(job, None)
+            if finished is not None:
+                finished(job, ok)
+
+        if self.jobsdialog is not None:
+            self.jobsdialog.refresh()
+
+    def queueBatchJob(self, job, title, message, finished=None):
+        """Queues a batch job, showing message with what it did once it is done"""
+        def batchFinished(job, ok):
+            if not ok:
+                self.showJobMessage('%s: cancelled after %d images' % (job.title, job.done))
+            else:
+                report = message
+                if job.skipped > 0:
+                    report = '%s - %d images were already up to date' % (report, job.skipped)
+                if job.linkedbytes > 0:
+                    report = '%s - linking unchanged images saved writing %.1f MB' % (report, job.linkedbytes / 1048576.0)
+                if len(job.errors) > 0:
+                    report = '%s - %d files could not be processed' % (report, len(job.errors))
+                self.showJobMessage(report)
+
+            if finished is not None:
+                finished(job, ok)
+
+        self.queueJob(job, title, batchFinished)
 
     def fontSelectPressed(self, event): # wxGlade: chronoFrame.<event_handler>
         data = wx.FontData()
@@ -1496,289 +2263,132 @@ class ChronoFrame(chronoFrame):
             self.showWarning('Source folder invalid', 'The source folder is invalid')
             return False
 
-        # check for annotation file
-        if not os.path.exists( os.path.join(self.annotatesourcefoldertext.GetValue(), self.ANNOTATIONFILE)):
-            self.showWarning('Annotation file not found', 'Annotation file not found in folder.')
-            return False
-
         # check that destination folder exists and is writable
         if not os.access( annodestfolder, os.W_OK):
             self.showWarning('Permission Denied', 'The output folder %s is not writable. Please change the permissions and try again.'%annodestfolder)
             return False
 
-        # parse annotation file
-        annofile = open(os.path.join(annofolder, self.ANNOTATIONFILE), 'rb')
-        try:
-            annotation = cPickle.load(annofile)
-        except:
-            self.showWarning('Annotation Corrupted','Annotation file appears corrupted. Cannot continue.')
-            return False
-
-        # get list of annotation times
-        times = annotation.keys()
-
-        if len(times) == 0:
-            self.showWarning('Annotation Has No Entries','Annotation file has no entries.')
-            return False
+        # for files in source
+        sourcefiles = []
+        for frame in getFrames(annofolder):
+            if frame.isImage():
+                sourcefiles.append(frame)
+            else:
+                self.debug('Skipping %s - not an image file' % frame.name)
 
         # get number of images
-        numimages = len(os.listdir(annofolder))
+        numimages = len(sourcefiles)
         self.debug('Preparing to apply annotation to %d images' % numimages, self.VERBOSE)
 
-        # make a list of sorted timestamps
-        times.sort()
-        annotime = time.mktime(time.strptime(times[0], self.FILETIMEFORMAT))
-
-        # for files in source
-        sourcefiles = os.listdir(annofolder)
-
         # sort by mtime
-        sourcefiles.sort( lambda x,y: int(os.path.getmtime(os.path.join(annofolder,x))-os.path.getmtime(os.path.join(annofolder,y))))
-
-        progressdialog = wx.ProgressDialog('Annotation Progress', 'Processing annotation data',
-                        maximum=numimages, parent=self, style= wx.PD_CAN_ABORT | wx.PD_APP_MODAL | wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
-
-        # if timed
-        if self.annotatetimedradio.GetValue():
-
-            # get duration
-            if self.annotatedurationtext.GetValue() != '':
-                duration = float(self.annotatedurationtext.GetValue())
-            else:
-                duration = 5.0
-
-            # adjust duration by framerate to get timestamp duration
-            framerate = self.videoframeratetext.GetValue()
-            if framerate == '':
-                framerate = 25
-            else:
-                framerate = int(framerate)
-
-            # guess at duration by comparing 2 creation times
-            f1 = None
-            f2 = None
-            index = 0
-            while f1 is None and f2 is None and index < len(sourcefiles):
-                try:
-                    Image.open(os.path.join(annofolder, sourcefiles[index]))
-                    Image.open(os.path.join(annofolder, sourcefiles[index+1]))
+        sourcefiles.sort(key=lambda frame: frame.getTime())
 
-                    f1 = os.path.join(annofolder, sourcefiles[index])
-                    f2 = os.path.join(annofolder, sourcefiles[index+1])
-                except Exception, e:
-                    index += 1
-
-            # couldnt compare
-            if f1 is None or f2 is None:
-                dlg = wx.MessageDialog(self,"Failed to estimate timelapse frequency for source files by comparing consecutive file creation times. Continue with default (and probably wrong) 1 minute guess?",
-                            'Annotation Warning', wx.YES_NO)
-                result = dlg.ShowModal()
-                if result == wx.ID_NO:
-                    dlg.Destroy()
-                    progressdialog.Destroy()
-                    return
-                else:
-                    timelapseinterval = 60.0
-                    dlg.Destroy()
-            else:
-                timelapseinterval = round(os.path.getmtime(f2) - os.path.getmtime(f1))
-
-            # calculate new duration
-            duration = duration * timelapseinterval * framerate
-            self.debug('Annotation duration = %s (duration in seconds) * %d (timelapse interval) * %d (framerate) = %d' % (self.annotatedurationtext.GetValue(),timelapseinterval, framerate, duration))
-
-            if self.annotatefadeoutcheck.GetValue():
-                fadetimeout = duration/3.0
-            else:
-                fadetimeout = 0.0
-
-            if self.annotatefadeincheck.GetValue():
-                fadetimein = duration/3.0
-            else:
-                fadetimein = 0.0
-
-            count = 0
-            for f in sourcefiles:
-
-                count += 1
-
-                sourcefile = os.path.join(annofolder, f)
-                # test if image
-                try:
-                    Image.open( sourcefile)
-                except:
-                    self.debug('Skipping %s - not an image file'%sourcefile)
-                    continue
-
-                cancel, somethingelse = progressdialog.Update(count, 'Processing %s'%f)
-                self.debug('Processing %s'%f)
-                # update progress dialog
-                if not cancel:
-                    self.debug('Annotation Cancelled by User')
-                    progressdialog.Destroy()
-                    break
-
-                # get creation time
-                creationtime = os.path.getctime(sourcefile)
-
-                # if creation time is before, skip it
-                if creationtime < annotime:
-                    shutil.copyfile(sourcefile, os.path.join(annodestfolder, f))
-                    continue
-
-                # if same time or within the time limit
-                elif creationtime <= annotime + duration:
-                    elapsed = creationtime - annotime
-
-                    # fade in
-                    if elapsed < fadetimein:
-                        opacity = elapsed / fadetimein
-
-                    # full opacity
-                    elif elapsed < duration - fadetimeout:
-                        opacity = 1.0
-
-                    # fade out
-                    elif elapsed < duration:
-                        opacity = (duration - elapsed) / fadetimeout
-
-                    # create annotated file
-                    self.applyAnnotation(f, annofolder, annodestfolder, annotation[times[0]],
-                        self.options['font'], self.options['fontdata'], opacity, self.annotatepositioncombo.GetStringSelection() )
-
-                # after annotation time
-                else:
-                    # copy file
-                    shutil.copyfile(sourcefile, os.path.join(annodestfolder, f))
-
-                    # move to next annotation time
-                    if len(times) > 1:
-                        times = times[1:]
-                        annotime = time.mktime(time.strptime(times[0], self.FILETIMEFORMAT))
-
-                        # get next applicable time
-                        while len(times) > 1 and creationtime > time.mktime(time.strptime(times[1], self.FILETIMEFORMAT)):
-                            times = times[1:]
-                            annotime = time.mktime(time.strptime(times[0], self.FILETIMEFORMAT))
-
-        else:   # constant annotation
-            count = 0
-            for f in sourcefiles:
-                count += 1
-
-                sourcefile = os.path.join(annofolder, f)
-                # test if image
-                try:
-                    Image.open( sourcefile)
-                except:
-                    print self.debug('Skipped %s - not an image file'%sourcefile)
-                    continue
-
-                cancel, somethingelse = progressdialog.Update(count, 'Processing %s'%f)
-                # update progress dialog
-                if not cancel:
-                    progressdialog.Destroy()
-                    break
-
-                # get creation time
-                creationtime = os.path.getctime(sourcefile)
-
-                # if creation time is before, skip it
-                if creationtime < annotime:
-                    shutil.copyfile(sourcefile, os.path.join(annodestfolder, f))
-                    continue
-
-                # make sure we aren't early
-                while len(times) > 1 and creationtime > time.mktime(time.strptime(times[1], self.FILETIMEFORMAT)):
-                    times = times[1:]
-                    annotime = time.mktime(time.strptime(times[0], self.FILETIMEFORMAT))
-
-                # create annotated file
-                self.applyAnnotation(f, annofolder, annodestfolder, annotation[times[0]],
-                        self.options['font'], self.options['fontdata'], 1.0, self.annotatepositioncombo.GetStringSelection() )
-
-        # close dialog
-        progressdialog.Update(count, 'Annotation Complete')
-        progressdialog.Destroy()
+        plan = self.getAnnotationPlan(annofolder, sourcefiles)
+        if plan is None:
+            return False
 
-        self.debug('Annotation Complete', self.VERBOSE)
+        # images outside the annotation are copied as they are
+        job = BatchJob('pipeline', sourcefiles, annodestfolder,
+                        [[self.getAnnotationStage(plan)], self.options['batchdraftdecode'], self.options['batchlinkmode']],
+                        self.options['batchworkers'], self.options['batchchunkframes'], self.debug,
+                        [{'annotate': entry} for entry in plan], self.options['batchincremental'])
+        self.queueBatchJob(job, 'Annotate %s' % annofolder, 'Annotation Complete')
 
-    def applyAnnotation( self, filename, sourcefolder, destfolder, text, font, fontdata, opacity, position):
-        self.debug('Applying annotation: file: %s  text: %s opacity: %s' % (filename, text, opacity))
+    def getAnnotationPlan(self, annofolder, sourcefiles):
+        """Reads the annotation in annofolder and works out what it shows on
+        each of sourcefiles (in time order), using the Annotate tab settings.
+        Returns None if there is no usable annotation."""
 
-        sourcefile = os.path.join(sourcefolder, filename)
-        fontcolor = fontdata.GetColour()
+        # check for annotation file
+        if not os.path.exists( os.path.join(annofolder, self.ANNOTATIONFILE)):
+            self.showWarning('Annotation file not found', 'Annotation file not found in folder.')
+            return None
 
-        # apply text with opacity
-        bmp = wx.Bitmap(sourcefile)
+        # parse annotation file
+        annofile = open(os.path.join(annofolder, self.ANNOTATIONFILE), 'rb')
+        try:
+            annotation = cPickle.load(annofile)
+        except:
+            self.showWarning('Annotation Corrupted','Annotation file appears corrupted. Cannot continue.')
+            return None
+        finally:
+            annofile.close()
 
-        #Create a memory DC so we can draw on it
-        memDC = wx.MemoryDC()
+        if len(annotation) == 0:
+            self.showWarning('Annotation Has No Entries','Annotation file has no entries.')
+            return None
 
-        #Tell the memory DC to use our Bitmap
-        memDC.SelectObject(bmp)
+        timing = self.getAnnotationTiming(annofolder, sourcefiles)
+        if timing is None:
+            return None
 
-        # get image size
-        width, height = bmp.GetWidth(), bmp.GetHeight()
+        return planAnnotation(sourcefiles, annotation, self.FILETIMEFORMAT, *timing)
 
-        # get text size
-        fontwidth, fontheight, somethingelse = memDC.GetMultiLineTextExtent(text, font)
+    def getAnnotationTiming(self, folder, sourcefiles):
+        """(timed, duration, fade in, fade out) for planAnnotation from the
+        Annotate tab settings, with the duration in capture time. sourcefiles
+        are the frames in folder, in time order. Returns None if the user
+        gives up."""
 
-        # TODO: wrap
+        # constant annotation
+        if not self.annotatetimedradio.GetValue():
+            return False, 0.0, 0.0, 0.0
 
-        # decide on placement
-        if position == 'Top':
-            x = (width-fontwidth)/2
-            y = 40
+        # get duration
+        if self.annotatedurationtext.GetValue() != '':
+            duration = float(self.annotatedurationtext.GetValue())
         else:
-            x = (width-fontwidth)/2
-            y = height - fontheight - 40
+            duration = 5.0
 
-        # set font
-        memDC.SetFont(font)
-
-        # save colors
-        red = fontcolor.Red()
-        green = fontcolor.Green()
-        blue = fontcolor.Blue()
+        # adjust duration by framerate to get timestamp duration
+        framerate = self.videoframeratetext.GetValue()
+        if framerate == '':
+            framerate = 25
+        else:
+            framerate = int(framerate)
 
-        # write drop shadow if selected
-        if self.dropshadowcheck.IsChecked():
-            # set opacity and color
-            fontcolor.Set( 0,0,0, int(255*opacity))
-            memDC.SetTextForeground(fontcolor)
-            memDC.DrawText(text, x+2, y+2)
+        # the usual time between captures - from the frame index if there is one
+        timelapseinterval = getIndexedInterval(folder)
+        if timelapseinterval is None:
+            timelapseinterval = getFrameInterval([frame.getTime() for frame in sourcefiles])
 
-        # set opacity and color
-        fontcolor.Set( red, green, blue, int(255*opacity))
-        memDC.SetTextForeground(fontcolor)
+        if timelapseinterval is None:
+            dlg = wx.MessageDialog(self,"Failed to estimate timelapse frequency for source files by comparing consecutive file creation times. Continue with default (and probably wrong) 1 minute guess?",
+                        'Annotation Warning', wx.YES_NO)
+            result = dlg.ShowModal()
+            dlg.Destroy()
+            if result == wx.ID_NO:
+                return None
+            timelapseinterval = 60.0
 
-        # write annotation on image
-        memDC.DrawText(text, x, y)
+        # calculate new duration
+        duration = duration * timelapseinterval * framerate
+        self.debug('Annotation duration = %s (duration in seconds) * %.2f (timelapse interval) * %d (framerate) = %d' % (self.annotatedurationtext.GetValue(),timelapseinterval, framerate, duration))
 
-        # save image
-        img = bmp.ConvertToImage()
+        if self.annotatefadeoutcheck.GetValue():
+            fadetimeout = duration/3.0
+        else:
+            fadetimeout = 0.0
 
-        # find image type by extension
-        index = filename.rfind('.')
-        if index == -1:
-            ext = 'jpg'
+        if self.annotatefadeincheck.GetValue():
+            fadetimein = duration/3.0
         else:
-            ext = filename[index+1:]
+            fadetimein = 0.0
 
-        filename = os.path.join(destfolder, filename)
-        if ext == 'gif':
-            img.SaveFile(filename, wx.BITMAP_TYPE_GIF)
+        return True, duration, fadetimein, fadetimeout
 
-        elif ext == 'png':
-            filename = os.path.join(destfolder, filename)
-            img.SaveFile(filename, wx.BITMAP_TYPE_PNG)
+    def getAnnotationStage(self, plan, folder=None):
+        """Pipeline stage drawing the texts in plan with the Annotate tab's font,
+        colour, position and drop shadow. Each text is drawn once here and
+        the workers paste it onto the images."""
+        masks = {}
+        for entry in plan:
+            if entry is not None and entry[0] not in masks:
+                masks[entry[0]] = makeTextMask(self.renderTextMask(entry[0], self.options['font']))
 
-        else:
-            filename = os.path.join(destfolder, filename)
-            img.SaveFile(filename, wx.BITMAP_TYPE_JPEG)
-
-        self.debug('Wrote annotated image to %s'%filename, self.DEBUG)
+        colour = self.options['fontdata'].GetColour()
+        return ('annotate', folder, (masks, (colour.Red(), colour.Green(), colour.Blue()),
+                    self.annotatepositioncombo.GetStringSelection(), self.dropshadowcheck.IsChecked()))
 
     def pipMainImageBrowsePressed(self, event): # wxGlade: chronoFrame.<event_handler>
         path = self.dirBrowser('Select folder containing main images',
@@ -1830,116 +2440,40 @@ class ChronoFrame(chronoFrame):
         pipsizestring = self.pipsizecombo.GetStringSelection()
         pippositionstring = self.pippositioncombo.GetStringSelection()
 
-        # sort files - match up by sorting so prefixes work
-        sourcefiles = os.listdir(sourcefolder)
-        sourcefiles.sort()
-        pipfiles = os.listdir(pipfolder)
-        pipfiles.sort()
+        # match up by capture time
+        sourcefiles = [frame for frame in getFrames(sourcefolder) if frame.isImage()]
+        pipfiles = [frame for frame in getFrames(pipfolder) if frame.isImage()]
+        pairs = self.pairPipFrames(sourcefiles, pipfiles)
 
         self.debug('Creating PIP')
 
-        # progress dialog
-        progressdialog = wx.ProgressDialog('PIP Progress', 'Processing Images',
-                        maximum=len(sourcefiles), parent=self, style= wx.PD_CAN_ABORT | wx.PD_APP_MODAL | wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
-
-        # for all images in main folder
-        count = 0
-        for i in xrange( min(len(sourcefiles), len(pipfiles))):
-            sourcefile = sourcefiles[i]
-            pipfile = pipfiles[i]
-
-            # update progress dialog
-            count += 1
-            cancel, somethingelse = progressdialog.Update(count, 'Processing %s'%sourcefile)
-            # update progress dialog
-            if not cancel:
-                progressdialog.Destroy()
-                break
-
-            try:
-                # open with PIL -- will skip non-images
-                source = Image.open(os.path.join(sourcefolder, sourcefile))
-                pip = Image.open(os.path.join(pipfolder, pipfile))
-
-                # get pip size - sides
-                if pippositionstring == 'Left' or pippositionstring == 'Right':
-                    if pipsizestring == 'Small':
-                        pipsize = ( source.size[0] / 4, source.size[1])
-                    elif pipsizestring == 'Medium':
-                        pipsize = ( source.size[0] / 3, source.size[1])
-                    else:
-                        pipsize = ( source.size[0] / 2, source.size[1])
-
-                # get pip size - top/bottom
-                elif pippositionstring == 'Top' or pippositionstring == 'Bottom':
-                    if pipsizestring == 'Small':
-                        pipsize = ( source.size[0], source.size[1] / 4)
-                    elif pipsizestring == 'Medium':
-                        pipsize = ( source.size[0], source.size[1] / 3)
-                    else:
-                        pipsize = ( source.size[0], source.size[1] / 2)
-
-                # get pip size - corners
-                else:
-                    if pipsizestring == 'Small':
-                        pipsize = ( source.size[0] / 4, source.size[1] / 4)
-                    elif pipsizestring == 'Medium':
-                        pipsize = ( source.size[0] / 3, source.size[1] / 3)
-                    else:
-                        pipsize = ( source.size[0] / 2, source.size[1] / 2)
-
-                # resize pip
-                pip.thumbnail(pipsize)
-
-                # paste on main - left
-                if pippositionstring == 'Left':
-                    source.paste(pip, (0,0))
-
-                # paste on main - Right
-                elif pippositionstring == 'Right':
-                    source.paste(pip, ( source.size[0]-pip.size[0], 0))
-
-                # paste on main - top
-                elif pippositionstring == 'Top':
-                    source.paste(pip, (0,0))
-
-                # paste on main - bottom
-                elif pippositionstring == 'Bottom':
-                    source.paste(pip, (0, source.size[1]-pip.size[1]))
-
-                # paste on main - top right
-                elif pippositionstring == 'Top-Right':
-                    source.paste(pip, ( source.size[0]-pip.size[0], 0))
-
-                # paste on main - bottom right
-                elif pippositionstring == 'Bottom-Right':
-                    source.paste(pip, ( source.size[0]-pip.size[0], source.size[1]-pip.size[1]))
-
-                # paste on main - bottom left
-                elif pippositionstring == 'Bottom-Left':
-                    source.paste(pip, (0, source.size[1]-pip.size[1]))
-
-                # paste on main - top left
-                elif pippositionstring == 'Top-Left':
-                    source.paste(pip, (0, 0))
-
-                # save in destination
-                outpath = os.path.join( outfolder, sourcefiles[i])
-                source.save( outpath)
-
-                # modify creation time to match source file
-                ctime = os.path.getctime(os.path.join(sourcefolder, sourcefile))
-                os.utime(outpath, (ctime, ctime))
-
-            except Exception, e:
-                pass
-                #print e
+        sourcefiles = [frame for frame, pipfile in pairs]
+        extras = [{'pip': pipfile} for frame, pipfile in pairs]
 
         # copy source annotation file if found
         if os.path.isfile( os.path.join(sourcefolder, self.ANNOTATIONFILE)):
             shutil.copy(os.path.join(sourcefolder, self.ANNOTATIONFILE), os.path.join(outfolder, self.ANNOTATIONFILE))
 
-        progressdialog.Destroy()
+        job = BatchJob('pipeline', sourcefiles, outfolder,
+                        [[('pip', None, (pipsizestring, pippositionstring))], self.options['batchdraftdecode'],
+                        self.options['batchlinkmode']],
+                        self.options['batchworkers'], self.options['batchchunkframes'], self.debug, extras,
+                        self.options['batchincremental'])
+        self.queueBatchJob(job, 'PIP %s into %s' % (pipfolder, sourcefolder), 'PIP Complete')
+
+    def pairPipFrames(self, frames, pipframes):
+        """Pairs frames with the PIP frames captured at the same time. Returns
+        (frame, PIP frame) pairs - frames without a PIP frame are left out if
+        un-matched images are ignored, otherwise paired with None."""
+        pairs = zip(frames, pairFrames(frames, pipframes, self.options['piptolerance']))
+
+        unmatched = [frame.name for frame, pipframe in pairs if pipframe is None]
+        if len(unmatched) > 0:
+            self.debug('%d images have no PIP image captured at the same time: %s' % (len(unmatched), ', '.join(unmatched[:10])))
+
+        if self.pipignoreunmatchedcheck.IsChecked():
+            pairs = [(frame, pipframe) for frame, pipframe in pairs if pipframe is not None]
+        return pairs
 
     def videoSourceBrowsePressed(self, event): # wxGlade: chronoFrame.<event_handler>
         path = self.dirBrowser('Select folder containing source images',
@@ -1968,11 +2502,11 @@ class ChronoFrame(chronoFrame):
     def videoRecalculatePressed(self, event): # wxGlade: chronoFrame.<event_handler>
         sourcepath = self.videosourcetext.GetValue()
 
-        # get number of files in source dir
-        numfiles = 0
-        for f in os.listdir(sourcepath):
-            if os.path.isfile(os.path.join(sourcepath,f)):
-                numfiles += 1
+        # get number of frames in source dir - captures skipped as unchanged
+        # are encoded as repeats of the frame standing in for them
+        numfiles = countFrames(sourcepath)
+        if numfiles > 0:
+            numfiles += sum(readSkippedFrames(sourcepath).values())
 
         # framerate
         framerate = int(self.videoframeratetext.GetValue())
@@ -2034,19 +2568,40 @@ class ChronoFrame(chronoFrame):
             return False
 
 
-        # get dimensions of first image file
-        found = False
-        count = 0
-        sourcefiles = os.listdir(sourcefolder)
-        while not found and count < len(sourcefiles):
-            count += 1
+        # frames saved in frame packs are decoded here and piped to mencoder as raw video
+        sourceframes = getFrames(sourcefolder)
+        pipeframes = None
+        if hasPacks(sourcefolder):
+            pipeframes = sourceframes
+
+        # so are frames going through the folder's edit list, which makes its
+        # edits on the way - the first edited frame sets the video size
+        editlist = self.getEditList(sourcefolder)
+        stages = extras = None
+        if editlist is not None:
             try:
-                imagepath = os.path.join(sourcefolder, sourcefiles[count])
-                img = Image.open(imagepath)
-                found = True
-                width, height = img.size
+                pipeframes, extras = editlist.getFrames()
+                stages = editlist.getStages(extras)
+                if len(pipeframes) > 0:
+                    width, height = renderFrame(pipeframes[0], stages, extras[0], self.options['batchdraftdecode']).size
+            except Exception, e:
+                self.showWarning('Edit List Error', 'Could not apply the edit list in %s: %s' % (sourcefolder, repr(e)))
+                return False
 
-                imagepath = imagepath.lower()
+            self.debug('Encoding %d frames through the edit list' % len(pipeframes), self.VERBOSE)
+            sourceframes = pipeframes[:1]
+
+        # get dimensions of first image - indexed frames already know them
+        found = False
+        for frame in sourceframes:
+            if not frame.isImage():
+                continue
+            if editlist is None:
+                width, height = frame.size
+            found = True
+
+            if pipeframes is None:
+                imagepath = frame.name.lower()
                 if imagepath.endswith(('.gif')):
                     imagetype = 'gif'
                     path = '*.gif'
@@ -2063,9 +2618,7 @@ class ChronoFrame(chronoFrame):
                         path = '*.jpg'
 
                 #path = os.path.join(sourcefolder, path)
-
-            except:
-                pass
+            break
 
         if not found:
             self.showWarning('No Images Found', 'No images were found in the source folder %s'%sourcefolder)
@@ -2077,6 +2630,28 @@ class ChronoFrame(chronoFrame):
         # get codec from select box
         codec = self.videocodeccombo.GetStringSelection()
 
+        # repeat frames that stood in for skipped unchanged captures - edit
+        # lists already have, unless they say not to
+        holds = readSkippedFrames(sourcefolder)
+        if editlist is not None:
+            holds = {}
+        framelist = ''
+        if pipeframes is not None:
+            pipeframes = [frame for frame in pipeframes for i in xrange(holds.get(frame.name, 0) + 1)]
+
+        elif len(holds) > 0:
+            extension = path[1:]
+            frames = [frame.name for frame in sourceframes if frame.name.lower().endswith(extension)]
+
+            framelist = os.path.join(sourcefolder, self.FRAMELISTFILE)
+            listfile = open(framelist, 'w')
+            for f in frames:
+                for i in xrange(holds.get(f, 0) + 1):
+                    listfile.write('%s\n' % f)
+            listfile.close()
+
+            path = '@%s' % self.FRAMELISTFILE
+
         # get output file name  ---  create in source folder then move bc of ANOTHER mencoder bug
         timestamp = time.strftime('%Y-%m-%d_%H-%M-%S')
         outextension = 'avi'
@@ -2094,17 +2669,6 @@ class ChronoFrame(chronoFrame):
         else:
             outfile = 'timelapse_%s.%s' % (timestamp, outextension)
 
-        # change cwd to image folder to stop mencoder bug
-        try:
-            os.chdir(sourcefolder)
-        except Exception, e:
-            self.showWarning('CWD Error', "Could not change current directory. %s" % str(e))
-            return False
-
-        # create progress dialog
-        progressdialog = wx.ProgressDialog('Encoding Progress', 'Encoding - Please Wait')
-        progressdialog.Pulse('Encoding - Please Wait')
-
         # run mencoder with options from GUI
 ##         mf://%s -mf w=%d:h=%d:fps=%s:type=%s -ovc lavc -lavcopts vcodec=%s:mbd=2:trell %s -oac copy -o %s' % (
 ##        path, width, height, fps, imagetype, codec, format, outfile ))
@@ -2115,56 +2679,52 @@ class ChronoFrame(chronoFrame):
 ##                    mencoderpath, path, fps, outfile )
 ##            command = '"%s" mf://fps=%s:type=png  -ovc rawrgb -o %s \*.png' % (mencoderpath, fps, outfile)
 ##        else:
-        command = '"%s" mf://%s -mf fps=%s-ovc lavc -lavcopts vcodec=%s -o %s' % (
+        if pipeframes is not None:
+            command = '"%s" - -demuxer rawvideo -rawvideo w=%d:h=%d:format=rgb24:fps=%s -ovc lavc -lavcopts vcodec=%s -o %s' % (
+                    mencoderpath, width, height, fps, codec, outfile )
+        else:
+            command = '"%s" mf://%s -mf fps=%s-ovc lavc -lavcopts vcodec=%s -o %s' % (
                     mencoderpath, path, fps, codec, outfile )
 
-        self.debug("Calling: %s"%command)
-
-        self.returncode = None
-        self.mencodererror = 'Unknown'
-        mencoderthread = threading.Thread(None, self.runMencoderInThread, 'mencoderthread', (command,))
-        mencoderthread.start()
-
-        while self.returncode is None:
-            time.sleep(.5)
-            progressdialog.Pulse()
-
-        # mencoder error
-        if self.returncode > 0:
-            progressdialog.Destroy()
-
-            self.showWarning('MEncoder Error', "Error while encoding video. Check the MEncoder console or try a different codec")
-            return
-
-        # move video file to destination folder
-        self.debug("Moving file from %s to %s" % (os.path.join(sourcefolder,outfile), os.path.join(destfolder, outfile)))
-        shutil.move(os.path.join(sourcefolder,outfile), os.path.join(destfolder, outfile))
+        # mencoder runs in the image folder to stop a mencoder bug
+        if pipeframes is not None:
+            job = EncodeJob(command, pipeframes, (width, height), sourcefolder, self.debug,
+                            stages, extras, self.options['batchdraftdecode'])
+        else:
+            job = CommandJob(command, sourcefolder, self.debug)
 
-        progressdialog.Destroy()
+        def encodeFinished(job, ok):
+            # remove the frame list
+            if framelist != '':
+                try:
+                    os.remove(framelist)
+                except Exception, e:
+                    self.debug('Failed to remove frame list %s: %s' % (framelist, repr(e)))
 
-        dlg = wx.MessageDialog(self, 'Encoding Complete!\nFile saved as %s'%os.path.join(destfolder, outfile), 'Encoding Complete', style=wx.OK)
-        dlg.ShowModal()
-        dlg.Destroy()
+            if job.cancelled:
+                self.showJobMessage('Encoding cancelled')
+                try:
+                    os.remove(os.path.join(sourcefolder, outfile))
+                except OSError:
+                    pass
+                return
 
-    def runMencoderInThread(self, command):
-        #proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+            # mencoder error
+            if job.returncode != 0:
+                self.debug('MEncoder output: %s' % job.output)
+                self.showWarning('MEncoder Error', "Error while encoding video. Check the MEncoder console or try a different codec")
+                return
 
-        self.debug('Running mencoder in thread')
-        #proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-  #      mencoder mf://*.jpg -mf w=800:h=600:fps=25:type=jpg -ovc lavc -lavcopts vcodec=mpeg4:mbd=2:trell -oac copy -o output.avi
+            # move video file to destination folder
+            self.debug("Moving file from %s to %s" % (os.path.join(sourcefolder,outfile), os.path.join(destfolder, outfile)))
+            shutil.move(os.path.join(sourcefolder,outfile), os.path.join(destfolder, outfile))
 
-        try:
-            if ONWINDOWS:
-                proc = subprocess.Popen(command, close_fds=True)
-            else:
-                proc = subprocess.Popen(command, close_fds=True, shell=True, stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+            self.showJobMessage('Encoding Complete')
+            dlg = wx.MessageDialog(self, 'Encoding Complete!\nFile saved as %s'%os.path.join(destfolder, outfile), 'Encoding Complete', style=wx.OK)
+            dlg.ShowModal()
+            dlg.Destroy()
 
-            stdout, stderr = proc.communicate()
-            self.mencodererror = stderr
-            self.returncode = proc.returncode
-        except Exception, e:
-            self.mencodererror = repr(e)
-            self.returncode = 1
+        self.queueJob(job, 'Encode %s' % outfile, encodeFinished)
 
     def audioSourceVideoBrowsePressed(self, event): # wxGlade: chronoFrame.<event_handler>
         path = self.fileBrowser('Select video source',
@@ -2260,22 +2820,6 @@ class ChronoFrame(chronoFrame):
                 count += 1
             outfile = "%s-audio%d%s"%(os.path.splitext(safevideoname)[0], count,os.path.splitext(safevideoname)[1])
 
-        # change cwd to video folder to stop mencoder bug
-        try:
-            self.debug('Changing directory to %s' % videofolder)
-            os.chdir( videofolder)
-        except Exception, e:
-            self.showWarning('CWD Error', "Could not change current directory. %s" % repr(e))
-
-            # delete temp video file
-            if safevideoname != videobase:
-                try:
-                    os.remove(safevideoname)
-                except:
-                    pass
-
-            return False
-
         newaudiopath = ''
         try:
             # copy audio to video source folder
@@ -2287,26 +2831,18 @@ class ChronoFrame(chronoFrame):
         except Exception, e:
             self.showWarning('Temp Audio Error', "Exception while copying audio to video folder: %s" % repr(e))
 
-        # create progress dialog
-        progressdialog = wx.ProgressDialog('Dubbing Progress', 'Dubbing - Please Wait')
-        progressdialog.Pulse('Dubbing - Please Wait')
-
         # mencoder -ovc copy -audiofile silent.mp3 -oac copy input.avi -o output.avi
         command = '"%s" -ovc copy -audiofile %s -oac copy %s -o %s' % (
         mencoderpath, os.path.basename(newaudiopath), safevideoname, outfile )
 
-        self.debug("Calling: %s"%command)
-        #proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-
-        proc = subprocess.Popen(command, close_fds=True)
+        # mencoder runs in the video folder to stop a mencoder bug
+        job = CommandJob(command, videofolder or None, self.debug)
 
-        stdout, stderr = proc.communicate()
-        returncode = proc.returncode
-
-        # mencoder error
-        if returncode > 0:
-            progressdialog.Destroy()
-            self.showWarning('MEncoder Error', stderr)
+        def dubFinished(job, ok):
+            if ok and videofolder != destfolder:
+                # move video file to destination folder
+                self.debug("Moving file from %s to %s" % (os.path.join(videofolder,outfile), os.path.join(destfolder, outfile)))
+                shutil.move(os.path.join(videofolder,outfile), os.path.join(destfolder, outfile))
 
             # delete temporary audio file
             if newaudiopath != '':
@@ -2322,32 +2858,21 @@ class ChronoFrame(chronoFrame):
                 except:
                     pass
 
-            return
-
-        # move video file to destination folder
-        if videofolder != destfolder:
-            self.debug("Moving file from %s to %s" % (os.path.join(videodir,outfile), os.path.join(destfolder, outfile)))
-            shutil.move(os.path.join(os.path.dirname(videosource),outfile), os.path.join(destfolder, outfile))
+            if job.cancelled:
+                self.showJobMessage('Dubbing cancelled')
+                return
 
-        progressdialog.Destroy()
+            # mencoder error
+            if job.returncode != 0:
+                self.showWarning('MEncoder Error', job.output)
+                return
 
-        # delete temporary audio file
-        if newaudiopath != '':
-            try:
-                os.remove(newaudiopath)
-            except Exception, e:
-                self.debug('Exception while deleting temp audio file %s: %s' % (newaudiopath, repr(e)))
-
-        # delete temp video file
-        if safevideoname != videobase:
-            try:
-                os.remove(safevideoname)
-            except:
-                pass
+            self.showJobMessage('Dubbing Complete')
+            dlg = wx.MessageDialog(self, 'Dubbing Complete!\nFile saved as %s'%os.path.join(destfolder, outfile), 'Dubbing Complete', style=wx.OK)
+            dlg.ShowModal()
+            dlg.Destroy()
 
-        dlg = wx.MessageDialog(self, 'Dubbing Complete!\nFile saved as %s'%os.path.join(destfolder, outfile), 'Dubbing Complete', style=wx.OK)
-        dlg.ShowModal()
-        dlg.Destroy()
+        self.queueJob(job, 'Dub %s' % videobase, dubFinished)
 
     def instructionsMenuClicked(self, event):
         path = os.path.join(self.CHRONOLAPSEPATH, self.DOCFILE)
@@ -2690,12 +3215,12 @@ You can download the new version at:
             counter = 1
 
             # get the files from the folder
-            files = os.listdir(source)
+            files = getFrames(source)
 
             # get just our desired files
             imagefiles = []
             for f in files:
-                if f.endswith(('jpg','JPG','jpeg','JPEG','png','PNG','gif','GIF')):
+                if f.name.endswith(('jpg','JPG','jpeg','JPEG','png','PNG','gif','GIF')):
                     imagefiles.append(f)
 
             # calculate the filename padding necessary based on number of files
@@ -2703,15 +3228,28 @@ You can download the new version at:
             padding = max(4, padding)
 
             # process the files
+            newnames = []
             for f in imagefiles:
 
-                newname = "%s%s" % (str(counter).rjust(padding, '0'), os.path.splitext(f)[1])
-                shutil.copy( os.path.join(source,f), os.path.join(output, newname))
+                newnames.append("%s%s" % (str(counter).rjust(padding, '0'), os.path.splitext(f.name)[1]))
                 counter += 1
 
-            dlg = wx.MessageDialog(self,"%d files renamed"%(counter-1), "Renaming Complete",wx.OK | wx.ICON_INFORMATION)
-            dlg.ShowModal()
-            dlg.Destroy()
+            job = BatchJob('rename', imagefiles, output, [self.options['batchlinkmode']],
+                            self.options['batchworkers'], self.options['batchchunkframes'], self.debug, newnames)
+
+            def renameFinished(job, ok):
+                if not ok:
+                    return
+
+                message = "%d files renamed" % (job.done - len(job.errors))
+                if job.linkedbytes > 0:
+                    message += " - linking them saved writing %.1f MB" % (job.linkedbytes / 1048576.0)
+
+                dlg = wx.MessageDialog(self, message, "Renaming Complete",wx.OK | wx.ICON_INFORMATION)
+                dlg.ShowModal()
+                dlg.Destroy()
+
+            self.queueBatchJob(job, 'Rename %s' % source, 'Renaming Complete', renameFinished)
 
 class TaskBarIcon(wx.TaskBarIcon):
 
@@ -2805,6 +3343,9 @@ class TaskBarFrame(wx.Frame):
 
 # run it!
 if __name__ == "__main__":
+    # batch worker processes start from this script when it is frozen into an exe
+    multiprocessing.freeze_support()
+
     app = wx.PySimpleApp(0)
     wx.InitAllImageHandlers()
     chronoframe = ChronoFrame(None, -1, "")
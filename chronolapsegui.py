@@ -77,6 +77,10 @@ class chronoFrame(wx.Frame):
         self.aboutmenuitem = wx.MenuItem(self.aboutmenu, wx.NewId(), "About", "About Chronolapse", wx.ITEM_NORMAL)
         self.aboutmenu.AppendItem(self.aboutmenuitem)
         self.chronoframe_menubar.Append(self.aboutmenu, "About")
+        self.jobsmenu = wx.Menu()
+        self.jobsmenuitem = wx.MenuItem(self.jobsmenu, wx.NewId(), "Show Jobs", "Show the progress of queued jobs", wx.ITEM_NORMAL)
+        self.jobsmenu.AppendItem(self.jobsmenuitem)
+        self.chronoframe_menubar.Append(self.jobsmenu, "Jobs")
         self.SetMenuBar(self.chronoframe_menubar)
         # Menu Bar end
         self.label_2 = wx.StaticText(self.notebook_1_capturepane, -1, "Time Between Captures:")
@@ -119,6 +123,7 @@ class chronoFrame(wx.Frame):
         self.label_33 = wx.StaticText(self.notebook_1_resizepane, -1, "Rotation:")
         self.rotatecombo = wx.ComboBox(self.notebook_1_resizepane, -1, choices=["0", "45", "90", "135", "180", "225", "270", "315"], style=wx.CB_DROPDOWN|wx.CB_DROPDOWN)
         self.rotatebutton = wx.Button(self.notebook_1_resizepane, -1, "Rotate")
+        self.pipelinebutton = wx.Button(self.notebook_1_resizepane, -1, "Combine Steps...")
         self.label_16 = wx.StaticText(self.notebook_1_annotationpane, -1, "Image/Annotation Folder:")
         self.annotatesourcefoldertext = wx.TextCtrl(self.notebook_1_annotationpane, -1, "")
         self.annotatesourcefolderbrowse = wx.Button(self.notebook_1_annotationpane, -1, "...")
@@ -197,6 +202,7 @@ class chronoFrame(wx.Frame):
 
         self.Bind(wx.EVT_MENU, self.instructionsMenuClicked, self.instructionsmenuitem)
         self.Bind(wx.EVT_MENU, self.aboutMenuClicked, self.aboutmenuitem)
+        self.Bind(wx.EVT_MENU, self.jobsMenuClicked, self.jobsmenuitem)
         self.Bind(wx.EVT_BUTTON, self.screenshotConfigurePressed, self.screenshotconfigurebutton)
         self.Bind(wx.EVT_BUTTON, self.webcamConfigurePressed, self.configurewebcambutton)
         self.Bind(wx.EVT_BUTTON, self.startCapturePressed, self.startbutton)
@@ -209,6 +215,7 @@ class chronoFrame(wx.Frame):
         self.Bind(wx.EVT_BUTTON, self.resizeOutputBrowsePressed, self.resizeoutputbrowsebutton)
         self.Bind(wx.EVT_BUTTON, self.resizePressed, self.resizebutton)
         self.Bind(wx.EVT_BUTTON, self.rotatePressed, self.rotatebutton)
+        self.Bind(wx.EVT_BUTTON, self.pipelinePressed, self.pipelinebutton)
         self.Bind(wx.EVT_BUTTON, self.annotationSourceBrowsePressed, self.annotatesourcefolderbrowse)
         self.Bind(wx.EVT_BUTTON, self.annotationOutputBrowsePressed, self.annotateoutputfolderbrowse)
         self.Bind(wx.EVT_BUTTON, self.fontSelectPressed, self.fontSelectButton)
@@ -265,6 +272,7 @@ class chronoFrame(wx.Frame):
         self.rotatecombo.SetToolTipString("The angle in degrees")
         self.rotatecombo.SetSelection(0)
         self.rotatebutton.SetToolTipString("Press to begin rotating images")
+        self.pipelinebutton.SetToolTipString("Press to resize, rotate, add a PIP and annotate the images in one pass")
         self.annotatesourcefoldertext.SetMinSize((200, -1))
         self.annotatesourcefolderbrowse.SetMinSize((20, -1))
         self.annotateoutputfoldertext.SetMinSize((200, -1))
@@ -295,8 +303,7 @@ class chronoFrame(wx.Frame):
         self.pipsizecombo.SetSelection(0)
         self.pippositioncombo.SetToolTipString("Select the position of the smaller image")
         self.pippositioncombo.SetSelection(1)
-        self.pipignoreunmatchedcheck.SetToolTipString("Check to ignore image names that are in one folder but not the other")
-        self.pipignoreunmatchedcheck.Hide()
+        self.pipignoreunmatchedcheck.SetToolTipString("Check to leave out main images that have no PIP image captured at the same time")
         self.pipignoreunmatchedcheck.SetValue(1)
         self.pipcreatebutton.SetToolTipString("Create PIP")
         self.videosourcetext.SetMinSize((200, -1))
@@ -347,7 +354,7 @@ class chronoFrame(wx.Frame):
         grid_sizer_30 = wx.FlexGridSizer(1, 3, 0, 0)
         grid_sizer_22 = wx.FlexGridSizer(1, 2, 0, 5)
         grid_sizer_15 = wx.FlexGridSizer(2, 3, 0, 5)
-        grid_sizer_25 = wx.FlexGridSizer(6, 1, 0, 0)
+        grid_sizer_25 = wx.FlexGridSizer(8, 1, 0, 0)
         grid_sizer_28 = wx.GridSizer(1, 2, 0, 0)
         grid_sizer_27 = wx.FlexGridSizer(2, 4, 0, 5)
         grid_sizer_26 = wx.FlexGridSizer(2, 3, 0, 0)
@@ -412,6 +419,8 @@ class chronoFrame(wx.Frame):
         grid_sizer_28.Add(self.rotatecombo, 0, 0, 0)
         grid_sizer_25.Add(grid_sizer_28, 1, wx.EXPAND, 0)
         grid_sizer_25.Add(self.rotatebutton, 0, wx.ALIGN_BOTTOM|wx.ALIGN_CENTER_HORIZONTAL, 0)
+        grid_sizer_25.Add((20, 60), 0, 0, 0)
+        grid_sizer_25.Add(self.pipelinebutton, 0, wx.ALIGN_BOTTOM|wx.ALIGN_CENTER_HORIZONTAL, 0)
         self.notebook_1_resizepane.SetSizer(grid_sizer_25)
         grid_sizer_25.AddGrowableCol(0)
         grid_sizer_15.Add(self.label_16, 0, 0, 0)
@@ -549,6 +558,10 @@ class chronoFrame(wx.Frame):
         print "Event handler `aboutMenuClicked' not implemented!"
         event.Skip()
 
+    def jobsMenuClicked(self, event): # wxGlade: chronoFrame.<event_handler>
+        print "Event handler `jobsMenuClicked' not implemented!"
+        event.Skip()
+
     def screenshotConfigurePressed(self, event): # wxGlade: chronoFrame.<event_handler>
         print "Event handler `screenshotConfigurePressed' not implemented!"
         event.Skip()
@@ -597,6 +610,10 @@ class chronoFrame(wx.Frame):
         print "Event handler `rotatePressed' not implemented!"
         event.Skip()
 
+    def pipelinePressed(self, event): # wxGlade: chronoFrame.<event_handler>
+        print "Event handler `pipelinePressed' not implemented!"
+        event.Skip()
+
     def annotationSourceBrowsePressed(self, event): # wxGlade: chronoFrame.<event_handler>
         print "Event handler `annotationSourceBrowsePressed' not implemented!"
         event.Skip()
@@ -689,7 +706,7 @@ class screenshotConfigDialog(wx.Dialog):
         # begin wxGlade: screenshotConfigDialog.__init__
         kwds["style"] = wx.DEFAULT_DIALOG_STYLE
         wx.Dialog.__init__(self, *args, **kwds)
-        self.dualmonitorscheck = wx.CheckBox(self, -1, "Capture Dual Monitors")
+        self.dualmonitorscheck = wx.CheckBox(self, -1, "Capture All Monitors")
         self.timestampcheck = wx.CheckBox(self, -1, "Show Timestamp")
         self.subsectioncheck = wx.CheckBox(self, -1, "Subsection")
         self.label36 = wx.StaticText(self, -1, "Top:")
@@ -719,7 +736,7 @@ class screenshotConfigDialog(wx.Dialog):
     def __set_properties(self):
         # begin wxGlade: screenshotConfigDialog.__set_properties
         self.SetTitle("Configure Screenshots")
-        self.dualmonitorscheck.SetToolTipString("Check to capture images from 2 monitors")
+        self.dualmonitorscheck.SetToolTipString("Check to capture images from all monitors")
         self.timestampcheck.SetToolTipString("Check to have CL write a timestamp on each capture")
         self.timestampcheck.SetValue(1)
         self.screenshotprefixtext.SetToolTipString("The file prefix every screenshot should start with")
@@ -938,6 +955,120 @@ class annotationContentsDialog(wx.Dialog):
 # end of class annotationContentsDialog
 
 
+class pipelineDialog(wx.Dialog):
+    def __init__(self, *args, **kwds):
+        # begin wxGlade: pipelineDialog.__init__
+        kwds["style"] = wx.DEFAULT_DIALOG_STYLE
+        wx.Dialog.__init__(self, *args, **kwds)
+        self.label_40 = wx.StaticText(self, -1, "Run these steps on the Adjust source folder in one pass,\nusing the settings from their tabs:")
+        self.pipelineresizecheck = wx.CheckBox(self, -1, "Resize")
+        self.pipelinerotatecheck = wx.CheckBox(self, -1, "Rotate")
+        self.pipelinepipcheck = wx.CheckBox(self, -1, "PIP")
+        self.pipelineannotatecheck = wx.CheckBox(self, -1, "Annotate")
+        self.pipelinekeepcheck = wx.CheckBox(self, -1, "Save each step in its tab's output folder")
+        self.pipelineeditlistcheck = wx.CheckBox(self, -1, "Save as an edit list for the Video tab instead")
+        self.pipelineokbutton = wx.Button(self, wx.ID_OK, "")
+        self.pipelinecancelbutton = wx.Button(self, wx.ID_CANCEL, "")
+
+        self.__set_properties()
+        self.__do_layout()
+        # end wxGlade
+
+    def __set_properties(self):
+        # begin wxGlade: pipelineDialog.__set_properties
+        self.SetTitle("Combine Steps")
+        self.pipelineresizecheck.SetToolTipString("Resize to the width and height on the Adjust tab")
+        self.pipelinerotatecheck.SetToolTipString("Rotate by the angle on the Adjust tab")
+        self.pipelinepipcheck.SetToolTipString("Add the PIP images from the PIP tab")
+        self.pipelineannotatecheck.SetToolTipString("Apply the annotation in the source folder with the settings on the Annotate tab")
+        self.pipelinekeepcheck.SetToolTipString("Also save the images after each step, not just the finished ones")
+        self.pipelineeditlistcheck.SetToolTipString("Save no images - the steps are done while encoding the source folder on the Video tab")
+        # end wxGlade
+
+    def __do_layout(self):
+        # begin wxGlade: pipelineDialog.__do_layout
+        grid_sizer_34 = wx.FlexGridSizer(5, 1, 10, 0)
+        grid_sizer_36 = wx.FlexGridSizer(1, 2, 0, 0)
+        grid_sizer_35 = wx.GridSizer(2, 2, 0, 0)
+        grid_sizer_34.Add(self.label_40, 0, 0, 0)
+        grid_sizer_35.Add(self.pipelineresizecheck, 0, 0, 0)
+        grid_sizer_35.Add(self.pipelinerotatecheck, 0, 0, 0)
+        grid_sizer_35.Add(self.pipelinepipcheck, 0, 0, 0)
+        grid_sizer_35.Add(self.pipelineannotatecheck, 0, 0, 0)
+        grid_sizer_34.Add(grid_sizer_35, 1, wx.EXPAND, 0)
+        grid_sizer_34.Add(self.pipelinekeepcheck, 0, 0, 0)
+        grid_sizer_34.Add(self.pipelineeditlistcheck, 0, 0, 0)
+        grid_sizer_36.Add(self.pipelineokbutton, 0, wx.ALIGN_CENTER_HORIZONTAL, 0)
+        grid_sizer_36.Add(self.pipelinecancelbutton, 0, wx.ALIGN_CENTER_HORIZONTAL, 0)
+        grid_sizer_36.AddGrowableCol(0)
+        grid_sizer_36.AddGrowableCol(1)
+        grid_sizer_34.Add(grid_sizer_36, 1, wx.EXPAND, 0)
+        self.SetSizer(grid_sizer_34)
+        grid_sizer_34.Fit(self)
+        grid_sizer_34.AddGrowableCol(0)
+        self.Layout()
+        self.Centre()
+        # end wxGlade
+
+# end of class pipelineDialog
+
+
+class jobsDialog(wx.Dialog):
+    def __init__(self, *args, **kwds):
+        # begin wxGlade: jobsDialog.__init__
+        kwds["style"] = wx.DEFAULT_DIALOG_STYLE|wx.RESIZE_BORDER
+        wx.Dialog.__init__(self, *args, **kwds)
+        self.jobtitlelabel = wx.StaticText(self, -1, "No jobs running")
+        self.jobgauge = wx.Gauge(self, -1, 100)
+        self.jobstatuslabel = wx.StaticText(self, -1, "")
+        self.label_41 = wx.StaticText(self, -1, "Waiting:")
+        self.joblist = wx.ListBox(self, -1, choices=[])
+        self.jobpausebutton = wx.Button(self, -1, "Pause")
+        self.jobcancelbutton = wx.Button(self, -1, "Cancel Job")
+        self.jobremovebutton = wx.Button(self, -1, "Remove")
+        self.jobhidebutton = wx.Button(self, -1, "Hide")
+
+        self.__set_properties()
+        self.__do_layout()
+        # end wxGlade
+
+    def __set_properties(self):
+        # begin wxGlade: jobsDialog.__set_properties
+        self.SetTitle("Jobs")
+        self.jobgauge.SetMinSize((350, -1))
+        self.joblist.SetMinSize((350, 100))
+        self.joblist.SetToolTipString("Jobs that will run when the current one is finished")
+        self.jobpausebutton.SetToolTipString("Pause or resume the running job")
+        self.jobcancelbutton.SetToolTipString("Stop the running job")
+        self.jobremovebutton.SetToolTipString("Take the selected job off the queue")
+        self.jobhidebutton.SetToolTipString("Hide this window - jobs keep running")
+        # end wxGlade
+
+    def __do_layout(self):
+        # begin wxGlade: jobsDialog.__do_layout
+        grid_sizer_37 = wx.FlexGridSizer(6, 1, 10, 0)
+        grid_sizer_38 = wx.GridSizer(1, 4, 0, 0)
+        grid_sizer_37.Add(self.jobtitlelabel, 0, 0, 0)
+        grid_sizer_37.Add(self.jobgauge, 0, wx.EXPAND, 0)
+        grid_sizer_37.Add(self.jobstatuslabel, 0, 0, 0)
+        grid_sizer_37.Add(self.label_41, 0, 0, 0)
+        grid_sizer_37.Add(self.joblist, 0, wx.EXPAND, 0)
+        grid_sizer_38.Add(self.jobpausebutton, 0, wx.ALIGN_CENTER_HORIZONTAL, 0)
+        grid_sizer_38.Add(self.jobcancelbutton, 0, wx.ALIGN_CENTER_HORIZONTAL, 0)
+        grid_sizer_38.Add(self.jobremovebutton, 0, wx.ALIGN_CENTER_HORIZONTAL, 0)
+        grid_sizer_38.Add(self.jobhidebutton, 0, wx.ALIGN_CENTER_HORIZONTAL, 0)
+        grid_sizer_37.Add(grid_sizer_38, 1, wx.EXPAND, 0)
+        self.SetSizer(grid_sizer_37)
+        grid_sizer_37.Fit(self)
+        grid_sizer_37.AddGrowableRow(4)
+        grid_sizer_37.AddGrowableCol(0)
+        self.Layout()
+        self.Centre()
+        # end wxGlade
+
+# end of class jobsDialog
+
+
 if __name__ == "__main__":
     app = wx.PySimpleApp(0)
     wx.InitAllImageHandlers()
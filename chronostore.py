@@ -0,0 +1,840 @@
+"""
+    chronostore.py
+    @summary:
+        Storage helpers for Chronolapse captures that do not depend on wx.
+    @license: MIT license - see license.txt
+
+    Frame packs
+        A frame pack is a single file holding many frames one after the other.
+        It starts with PACKMAGIC and is followed by records of
+
+            PACKRECORD header (data length, timestamp, width, height,
+                               format, name length)
+            name
+            data
+
+        Formats are 'rgb' or 'rgbx' for raw 24 or 32 bit pixels, or an image
+        format name such as 'jpg' for encoded images.
+
+        A pack that was closed properly ends with an index of every record,
+        so the frames can be listed without reading the whole pack:
+
+            INDEXRECORD (record offset, data length, timestamp, width, height,
+                         format, name length) and name, for every frame
+            PACKFOOTER (index offset, frame count, INDEXMAGIC)
+
+        Packs without an index (still being written, or cut short by a crash)
+        are listed by walking the records from the start.
+
+    Frame folders
+        listFrames() lists the frames in a capture folder whether they are
+        single image files, frames inside packs, or a mix of both, so the batch
+        tools do not need to care how the captures were stored.
+
+        Folders are read through scanFolder(), which keeps what it has seen of
+        each folder in memory: the stat of every file, read in one pass, and
+        the image headers and pack indexes read so far. While the folder's
+        mtime stays the same nothing is read again; when it changes the
+        folder is listed again and only files whose size or mtime changed
+        lose their cached headers.
+
+    Frame index
+        Capture records every frame it saves in a SQLite database in the save
+        folder (INDEXFILE): name, capture time, source, size, byte size and,
+        for packed frames, where in which pack it is. getFrames() answers from
+        the index when there is one and falls back to listFrames() otherwise.
+        Files the index does not know about - captures made before the folder
+        had one, or copied in since - are listed from the folder alongside it,
+        and rows for files that have gone are left out. Run this script with folders as arguments to build the index for
+        folders captured without one:
+
+            chronostore.py folder [folder ...]
+
+    Linked copies
+        Frames the batch tools pass through unchanged are put in the output
+        folder with linkFile(), which makes a hard link to the source file if
+        it can, a copy-on-write clone (reflink) on file systems that support
+        them, and only copies the data when neither works - for example
+        between drives. Hard linked files share their data, so anything that
+        writes over an output calls unlinkShared() first to keep the source
+        as it was.
+"""
+
+import os, sys, re, time, stat, errno, shutil, struct, threading, sqlite3
+
+from cStringIO import StringIO
+
+from PIL import Image
+
+# scandir lists a folder and the type of each entry in one go - built in from
+# Python 3.5, otherwise available as the scandir package
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# reflinks are made with an ioctl on Linux
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+PACKMAGIC = 'CLPACK1\n'
+PACKEXTENSION = '.clpack'
+
+# data length, timestamp, width, height, format, name length
+PACKRECORD = struct.Struct('<IdII8sH')
+
+# record offset, data length, timestamp, width, height, format, name length
+INDEXRECORD = struct.Struct('<QIdII8sH')
+
+# index offset, frame count, magic
+INDEXMAGIC = 'CLINDEX\n'
+PACKFOOTER = struct.Struct('<QI8s')
+
+# sidecar files Chronolapse keeps next to the captures all start with this
+SIDECARPREFIX = 'chronolapse.'
+
+# raw pack formats and the PIL modes they hold
+RAWMODES = {'rgb': 'RGB', 'rgbx': 'RGBX'}
+
+# SQLite frame index kept in each save folder
+INDEXFILE = 'chronolapse.index'
+
+# capture times in file names - FILETIMEFORMAT or seconds for sub-second captures
+FILETIMEPATTERN = re.compile(r'(\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d)')
+SECONDSPATTERN = re.compile(r'(\d{9,}\.\d+)\.[^.]+$')
+
+# folder mtimes can be as coarse as a second or two, so a folder changed more
+# recently than this is always listed again
+SCANSETTLE = 2.0
+
+# how linkFile puts a file in place, cheapest first
+LINKMODES = ('link', 'reflink', 'copy')
+
+# Linux ioctl cloning one file's data into another (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+
+class FramePackWriter:
+    """Appends frames to a frame pack"""
+
+    def __init__(self, path):
+        self.path = path
+        self.packfile = open(path, 'wb')
+        self.packfile.write(PACKMAGIC)
+        self.frames = 0
+        self.index = []
+
+    def append(self, name, timestamp, size, format, data):
+        """Writes one frame and returns the offset of its record"""
+        offset = self.packfile.tell()
+
+        self.packfile.write(PACKRECORD.pack(len(data), timestamp, size[0], size[1], format, len(name)))
+        self.packfile.write(name)
+        self.packfile.write(data)
+
+        self.index.append((offset, len(data), timestamp, size[0], size[1], format, name))
+        self.frames += 1
+        return offset
+
+    def close(self):
+        """Writes the index and closes the pack"""
+        indexoffset = self.packfile.tell()
+        for offset, length, timestamp, width, height, format, name in self.index:
+            self.packfile.write(INDEXRECORD.pack(offset, length, timestamp, width, height, format, len(name)))
+            self.packfile.write(name)
+        self.packfile.write(PACKFOOTER.pack(indexoffset, len(self.index), INDEXMAGIC))
+        self.packfile.close()
+
+
+class FramePackReader:
+    """Lists and reads the frames in a frame pack"""
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = []
+
+        packfile = open(path, 'rb')
+        try:
+            if packfile.read(len(PACKMAGIC)) != PACKMAGIC:
+                raise IOError('%s is not a frame pack' % path)
+
+            if not self.readIndex(packfile):
+                self.scanRecords(packfile)
+        finally:
+            packfile.close()
+
+    @staticmethod
+    def getDataOffset(offset, name):
+        """Where the data of the record written at offset starts"""
+        return offset + PACKRECORD.size + len(name)
+
+    def readIndex(self, packfile):
+        """Reads the index at the end of the pack. Returns False if there is none"""
+        packfile.seek(0, 2)
+        end = packfile.tell()
+        if end < len(PACKMAGIC) + PACKFOOTER.size:
+            return False
+
+        packfile.seek(end - PACKFOOTER.size)
+        indexoffset, count, magic = PACKFOOTER.unpack(packfile.read(PACKFOOTER.size))
+        if magic != INDEXMAGIC or indexoffset >= end:
+            return False
+
+        packfile.seek(indexoffset)
+        index = StringIO(packfile.read(end - PACKFOOTER.size - indexoffset))
+        frames = []
+        for i in xrange(count):
+            header = index.read(INDEXRECORD.size)
+            if len(header) < INDEXRECORD.size:
+                return False
+            offset, length, timestamp, width, height, format, namelength = INDEXRECORD.unpack(header)
+            name = index.read(namelength)
+            datastart = offset + PACKRECORD.size + namelength
+            frames.append(PackedFrame(self.path, name, timestamp, (width, height), format.rstrip('\0'), datastart, length))
+
+        self.frames = frames
+        return True
+
+    def scanRecords(self, packfile):
+        """Walks the records from the start, stopping at the first incomplete one"""
+        packfile.seek(0, 2)
+        end = packfile.tell()
+        offset = len(PACKMAGIC)
+
+        while offset + PACKRECORD.size <= end:
+            packfile.seek(offset)
+            length, timestamp, width, height, format, namelength = PACKRECORD.unpack(packfile.read(PACKRECORD.size))
+
+            datastart = offset + PACKRECORD.size + namelength
+            if datastart + length > end:
+                break
+
+            name = packfile.read(namelength)
+            self.frames.append(PackedFrame(self.path, name, timestamp, (width, height), format.rstrip('\0'), datastart, length))
+            offset = datastart + length
+
+
+class FrameFile:
+    """A frame saved as its own image file"""
+
+    packed = False
+
+    def __init__(self, folder, name, timestamp=None, size=None, filestat=None):
+        self.name = name
+        self.folder = folder
+        self.path = os.path.join(folder, name)
+
+        # known from the frame index, otherwise taken from the file
+        self.timestamp = timestamp
+        self.size = size
+
+        # (bytes, mtime, ctime) if the folder scan already has them
+        self.filestat = filestat
+
+        # False until the name has been looked at
+        self.nametime = False
+
+    def getTime(self):
+        """Capture time - from the index, the file name, or the file's mtime"""
+        if self.timestamp is not None:
+            return self.timestamp
+        if self.getNameTime() is not None:
+            return self.nametime
+        if self.filestat is not None:
+            return self.filestat[1]
+        return os.path.getmtime(self.path)
+
+    def getCreationTime(self):
+        if self.timestamp is not None:
+            return self.timestamp
+        if self.getNameTime() is not None:
+            return self.nametime
+        if self.filestat is not None:
+            return self.filestat[2]
+        return os.path.getctime(self.path)
+
+    def getNameTime(self):
+        """Capture time in the file name, which survives the batch tools"""
+        if self.nametime is False:
+            self.nametime = parseCaptureTime(self.name)
+        return self.nametime
+
+    def getInfo(self):
+        """(format, size) from the image header, or None if it is not an image"""
+        info = scanFolder(self.folder).getImageInfo(self.name)
+        if info is not None:
+            self.size = info[1]
+        return info
+
+    def isImage(self):
+        return self.size is not None or self.getInfo() is not None
+
+    def open(self):
+        return Image.open(self.path)
+
+    def read(self):
+        framefile = open(self.path, 'rb')
+        try:
+            return framefile.read()
+        finally:
+            framefile.close()
+
+    def copyTo(self, path, linkmode='copy'):
+        """Puts the frame at path as it is, see linkFile. Returns the number
+        of bytes that did not have to be written."""
+        if linkFile(self.path, path, linkmode) == 'copy':
+            return 0
+        return os.path.getsize(path)
+
+
+class PackedFrame:
+    """A frame stored inside a frame pack"""
+
+    packed = True
+
+    def __init__(self, path, name, timestamp, size, format, offset, length):
+        self.name = name
+        self.path = path
+        self.timestamp = timestamp
+        self.size = size
+        self.format = format
+        self.offset = offset
+        self.length = length
+
+    def getTime(self):
+        return self.timestamp
+
+    def getCreationTime(self):
+        return self.timestamp
+
+    def getInfo(self):
+        return self.format, self.size
+
+    def isImage(self):
+        return True
+
+    def open(self):
+        data = self.read()
+        if self.format in RAWMODES:
+            mode = RAWMODES[self.format]
+            return Image.frombuffer(mode, self.size, data, 'raw', mode, 0, 1)
+        return Image.open(StringIO(data))
+
+    def read(self):
+        packfile = open(self.path, 'rb')
+        try:
+            packfile.seek(self.offset)
+            return packfile.read(self.length)
+        finally:
+            packfile.close()
+
+    def copyTo(self, path, linkmode='copy'):
+        # packed frames are always written out
+        unlinkShared(path)
+
+        # raw frames have to be encoded, the rest are copied as they are
+        if self.format in RAWMODES:
+            self.open().convert('RGB').save(path)
+            return 0
+
+        framefile = open(path, 'wb')
+        try:
+            framefile.write(self.read())
+        finally:
+            framefile.close()
+        return 0
+
+
+def isSameFile(path, otherpath):
+    try:
+        filestat = os.stat(path)
+        otherstat = os.stat(otherpath)
+    except OSError:
+        return False
+
+    # st_ino is 0 on Windows under Python 2
+    if filestat.st_ino == 0:
+        return os.path.normcase(os.path.abspath(path)) == os.path.normcase(os.path.abspath(otherpath))
+    return (filestat.st_dev, filestat.st_ino) == (otherstat.st_dev, otherstat.st_ino)
+
+
+def reflinkFile(source, path):
+    """Clones source to path without copying its data, if the file system can"""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+
+    sourcefile = open(source, 'rb')
+    try:
+        outfile = open(path, 'wb')
+        try:
+            fcntl.ioctl(outfile.fileno(), FICLONE, sourcefile.fileno())
+            cloned = True
+        except (IOError, OSError):
+            cloned = False
+        finally:
+            outfile.close()
+    finally:
+        sourcefile.close()
+
+    if not cloned:
+        os.remove(path)
+    return cloned
+
+
+def linkFile(source, path, mode='link'):
+    """Puts a file with the contents of source at path. In 'link' mode path
+    becomes a hard link to source if possible, then in 'reflink' mode a
+    clone of it, and otherwise - or in 'copy' mode - a copy. Returns the
+    mode that was used."""
+    if isSameFile(source, path):
+        return 'link'
+    unlinkShared(path)
+
+    if mode == 'link' and hasattr(os, 'link'):
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            os.link(source, path)
+            return 'link'
+        except OSError:
+            # other drives, or file systems without hard links
+            pass
+
+    if mode in ('link', 'reflink'):
+        if reflinkFile(source, path):
+            return 'reflink'
+
+    shutil.copyfile(source, path)
+    return 'copy'
+
+
+def unlinkShared(path):
+    """Removes path if it is hard linked to another file, so writing it leaves
+    the other file alone"""
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def isPack(name):
+    return name.lower().endswith(PACKEXTENSION)
+
+
+def statFiles(folder):
+    """Yields (name, stat) for every regular file in folder"""
+    if scandir is not None:
+        for entry in scandir(folder):
+            try:
+                if entry.is_file():
+                    yield entry.name, entry.stat()
+            except OSError:
+                # removed while listing
+                pass
+        return
+
+    for name in os.listdir(folder):
+        try:
+            filestat = os.stat(os.path.join(folder, name))
+        except OSError:
+            continue
+        if stat.S_ISREG(filestat.st_mode):
+            yield name, filestat
+
+
+class FolderScan:
+    """What is known about the files in one folder. Use scanFolder() rather
+    than making these directly."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.mtime = None
+        self.lock = threading.Lock()
+
+        # name -> (bytes, mtime, ctime)
+        self.files = {}
+
+        # name -> (file stat when read, cached value)
+        self.headers = {}
+        self.packs = {}
+
+    def refresh(self):
+        """Lists the folder again if it changed since the last scan"""
+        self.lock.acquire()
+        try:
+            mtime = os.stat(self.folder).st_mtime
+            if mtime == self.mtime and time.time() - mtime > SCANSETTLE:
+                return
+
+            files = {}
+            for name, filestat in statFiles(self.folder):
+                files[name] = (filestat.st_size, filestat.st_mtime, filestat.st_ctime)
+
+            # forget what was read from files that changed or went away
+            for cache in (self.headers, self.packs):
+                for name, (filestat, value) in cache.items():
+                    if files.get(name) != filestat:
+                        del cache[name]
+
+            self.files = files
+            self.mtime = mtime
+        finally:
+            self.lock.release()
+
+    def getImageInfo(self, name):
+        """(format, size) of the image file name, or None if PIL cannot read it"""
+        filestat = self.files.get(name)
+        cached = self.headers.get(name)
+        if cached is not None and cached[0] == filestat:
+            return cached[1]
+
+        # PIL only reads the header until the pixels are needed
+        try:
+            img = Image.open(os.path.join(self.folder, name))
+            info = (img.format, img.size)
+        except Exception:
+            info = None
+
+        self.headers[name] = (filestat, info)
+        return info
+
+    def getPackFrames(self, name):
+        filestat = self.files.get(name)
+        cached = self.packs.get(name)
+        if cached is not None and cached[0] == filestat:
+            return cached[1]
+
+        try:
+            frames = FramePackReader(os.path.join(self.folder, name)).frames
+        except Exception:
+            frames = []
+
+        self.packs[name] = (filestat, frames)
+        return frames
+
+    def getFrames(self):
+        frames = []
+        for name, filestat in self.files.items():
+            if name.startswith(SIDECARPREFIX):
+                continue
+
+            if isPack(name):
+                frames.extend(self.getPackFrames(name))
+            else:
+                frame = FrameFile(self.folder, name, filestat=filestat)
+                cached = self.headers.get(name)
+                if cached is not None and cached[0] == filestat and cached[1] is not None:
+                    frame.size = cached[1][1]
+                frames.append(frame)
+
+        frames.sort(key=lambda frame: frame.name)
+        return frames
+
+    def hasPacks(self):
+        for name in self.files:
+            if isPack(name):
+                return True
+        return False
+
+
+scans = {}
+scanslock = threading.Lock()
+
+def scanFolder(folder):
+    """Returns the up to date FolderScan of folder"""
+    key = os.path.normcase(os.path.abspath(folder))
+
+    scanslock.acquire()
+    try:
+        scan = scans.get(key)
+        if scan is None:
+            scan = scans[key] = FolderScan(folder)
+    finally:
+        scanslock.release()
+
+    scan.refresh()
+    return scan
+
+
+def listFrames(folder):
+    """Returns every frame in folder, sorted by name. Frames inside packs are
+    listed one by one; Chronolapse's own sidecar files are left out. Other
+    files are listed as they are - callers skip the ones where isImage() is
+    False."""
+    return scanFolder(folder).getFrames()
+
+
+def hasPacks(folder):
+    return scanFolder(folder).hasPacks()
+
+
+def parseCaptureTime(name):
+    """Capture time from a capture file name, or None"""
+    match = FILETIMEPATTERN.search(name)
+    if match:
+        return time.mktime(time.strptime(match.group(1), '%Y-%m-%d_%H-%M-%S'))
+
+    match = SECONDSPATTERN.search(name)
+    if match:
+        return float(match.group(1))
+
+    return None
+
+
+class FrameIndex:
+    """SQLite index of the frames in one save folder. Safe to use from
+    several threads at once.
+
+    Rows are keyed by file name. Capture adds the capture time and source
+    with addFrame() and the writers add what they wrote with addWrite(),
+    whichever comes first creates the row.
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS frames (
+            name        TEXT PRIMARY KEY,
+            timestamp   REAL,
+            source      TEXT,
+            width       INTEGER,
+            height      INTEGER,
+            bytes       INTEGER,
+            format      TEXT,
+            pack        TEXT,
+            offset      INTEGER
+        )""",
+        "CREATE INDEX IF NOT EXISTS frames_timestamp ON frames (timestamp)",
+        "CREATE INDEX IF NOT EXISTS frames_source ON frames (source, timestamp)",
+    ]
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, INDEXFILE)
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.text_factory = str
+
+        # a commit per captured frame must not wait for the disk - with a
+        # write ahead log a crash can only lose the last few rows
+        try:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+        except sqlite3.Error:
+            # file systems without shared memory, network drives say
+            pass
+        for statement in self.SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    @classmethod
+    def exists(cls, folder):
+        return os.path.isfile(os.path.join(folder, INDEXFILE))
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.connection.close()
+        finally:
+            self.lock.release()
+
+    def update(self, name, **columns):
+        """Creates the row for name if needed and sets columns on it"""
+        names = columns.keys()
+        self.lock.acquire()
+        try:
+            self.connection.execute('INSERT OR IGNORE INTO frames (name) VALUES (?)', (name,))
+            self.connection.execute('UPDATE frames SET %s WHERE name = ?' % ', '.join('%s = ?' % column for column in names),
+                                    [columns[column] for column in names] + [name])
+            self.connection.commit()
+        finally:
+            self.lock.release()
+
+    def addFrame(self, name, timestamp, source):
+        """Records when and from what a frame was captured"""
+        self.update(name, timestamp=timestamp, source=source)
+
+    def addWrite(self, name, size, length, format, pack=None, offset=None):
+        """Records what was written for a frame"""
+        self.update(name, width=size[0], height=size[1], bytes=length, format=format, pack=pack, offset=offset)
+
+    def getFrames(self, source=None):
+        """Returns the indexed frames in capture order"""
+        query = 'SELECT name, timestamp, width, height, bytes, format, pack, offset FROM frames'
+        arguments = ()
+        if source is not None:
+            query += ' WHERE source = ?'
+            arguments = (source,)
+        query += ' ORDER BY timestamp, name'
+
+        self.lock.acquire()
+        try:
+            rows = self.connection.execute(query, arguments).fetchall()
+        finally:
+            self.lock.release()
+
+        frames = []
+        for name, timestamp, width, height, length, format, pack, offset in rows:
+            size = None
+            if width is not None and height is not None:
+                size = (width, height)
+
+            if pack is not None:
+                frames.append(PackedFrame(os.path.join(self.folder, pack), name, timestamp, size, format, offset, length))
+            else:
+                frames.append(FrameFile(self.folder, name, timestamp, size))
+        return frames
+
+    def getCount(self):
+        self.lock.acquire()
+        try:
+            return self.connection.execute('SELECT COUNT(*) FROM frames').fetchone()[0]
+        finally:
+            self.lock.release()
+
+    def getInterval(self):
+        """Typical time between captures (the median gap), or None"""
+        self.lock.acquire()
+        try:
+            times = [row[0] for row in self.connection.execute(
+                        'SELECT timestamp FROM frames WHERE timestamp IS NOT NULL ORDER BY timestamp')]
+        finally:
+            self.lock.release()
+
+        gaps = [b - a for a, b in zip(times, times[1:]) if b > a]
+        if len(gaps) == 0:
+            return None
+        gaps.sort()
+        return gaps[len(gaps) / 2]
+
+    def rebuild(self, sources=None):
+        """Indexes every frame in the folder from scratch. sources maps file
+        names to source names where they are known. Returns the number of
+        frames indexed."""
+        sources = sources or {}
+        rows = []
+
+        for frame in listFrames(self.folder):
+            try:
+                if frame.packed:
+                    size = frame.size
+                    length = frame.length
+                    format = frame.format
+                    pack = os.path.basename(frame.path)
+                    offset = frame.offset
+                    timestamp = frame.timestamp
+                else:
+                    size = frame.getInfo()[1]
+                    length = frame.filestat[0]
+                    format = os.path.splitext(frame.name)[1][1:].lower()
+                    pack = offset = None
+                    timestamp = parseCaptureTime(frame.name)
+                    if timestamp is None:
+                        timestamp = frame.getTime()
+            except Exception:
+                # not an image
+                continue
+
+            rows.append((frame.name, timestamp, sources.get(frame.name), size[0], size[1], length, format, pack, offset))
+
+        self.lock.acquire()
+        try:
+            self.connection.execute('DELETE FROM frames')
+            self.connection.executemany('INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.connection.commit()
+        finally:
+            self.lock.release()
+
+        return len(rows)
+
+
+def getIndexedFrames(folder):
+    """The frames in folder's index, or None if it has no usable index"""
+    if not FrameIndex.exists(folder):
+        return None
+    try:
+        index = FrameIndex(folder)
+        try:
+            if index.getCount() > 0:
+                return index.getFrames()
+        finally:
+            index.close()
+    except sqlite3.Error:
+        pass
+    return None
+
+
+def getFrames(folder):
+    """Frames in folder in capture order - from the frame index if the folder
+    has one, otherwise from the files themselves"""
+    indexed = getIndexedFrames(folder)
+    if indexed is None:
+        return listFrames(folder)
+
+    # the index can miss files and outlive them, the folder scan can't
+    scan = scanFolder(folder)
+    frames = [frame for frame in indexed
+                if (os.path.basename(frame.path) if frame.packed else frame.name) in scan.files]
+
+    names = set(frame.name for frame in indexed)
+    unindexed = [frame for frame in scan.getFrames() if frame.name not in names]
+    if len(unindexed) == 0:
+        return frames
+
+    frames.extend(unindexed)
+    frames.sort(key=lambda frame: (frame.getTime(), frame.name))
+    return frames
+
+
+def getIndexedInterval(folder):
+    """Typical time between the captures in folder's index, or None if it
+    has no usable index"""
+    if not FrameIndex.exists(folder):
+        return None
+    try:
+        index = FrameIndex(folder)
+        try:
+            return index.getInterval()
+        finally:
+            index.close()
+    except sqlite3.Error:
+        return None
+
+
+def countFrames(folder):
+    """Number of frames in folder"""
+    return len(getFrames(folder))
+
+
+def main(argv):
+    if len(argv) < 2:
+        print __doc__
+        return 2
+
+    for folder in argv[1:]:
+        if not os.path.isdir(folder):
+            print '%s is not a folder' % folder
+            continue
+
+        # the frame records say which source each file came from
+        from chronocapture import getFrameSources
+
+        index = FrameIndex(folder)
+        try:
+            print '%s: indexed %d frames' % (folder, index.rebuild(getFrameSources(folder)))
+        finally:
+            index.close()
+
+    return 0
+
+
+# run it!
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))